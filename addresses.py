@@ -0,0 +1,79 @@
+import re
+
+try:
+    import ipaddress
+except ImportError:
+    # Python 2 without the ipaddress backport: only IPv4 addresses are understood
+    ipaddress = None
+
+
+# Dotted-quad IPv4 addresses, by far the most common, are parsed without building an ipaddress object; leading zeros
+# are accepted since older versions of the GUI saved addresses like "010.000.000.005"
+IPV4 = re.compile(r'^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})$')
+# An IPv4 address that is already in canonical form (no leading zeros, every part up to 255) is returned as it is
+OCTET = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)'
+CANONICAL_IPV4 = re.compile(r'^{0}\.{0}\.{0}\.{0}$'.format(OCTET))
+
+
+# (canonical form, None) of an IPv4 or IPv6 address, e.g. "010.000.000.005" -> "10.0.0.5" and "FE80:0::1" ->
+# "fe80::1", or (None, error message) if text is not an address
+def checkIP(text):
+    text = text.strip()
+    if CANONICAL_IPV4.match(text):
+        return text, None
+    match = IPV4.match(text)
+    if match is not None:
+        parts = [int(part) for part in match.groups()]
+        if max(parts) > 255:
+            return None, "Each part of the IP address must be between 0 and 255."
+        return '.'.join(str(part) for part in parts), None
+    if ipaddress is not None and ':' in text:
+        try:
+            # The Python 2 backport only takes unicode
+            return str(ipaddress.ip_address(text if isinstance(text, type(u'')) else text.decode('utf-8'))), None
+        except (ValueError, UnicodeDecodeError):
+            pass
+    return None, "'{}' is not a valid IP address.".format(text)
+
+
+# Canonical form of an address (see checkIP()); raises ValueError if text is not an address
+def normalizeIP(text):
+    normalized, error = checkIP(text)
+    if error is not None:
+        raise ValueError(error)
+    return normalized
+
+
+# Error message if brsaneconfig3 can't use text as an IP address, otherwise None
+def ipError(text):
+    normalized, error = checkIP(text)
+    if error is None and ':' in normalized:
+        return "brsaneconfig3 only supports IPv4 addresses."
+    return error
+
+
+# Check many addresses at once (e.g. from an imported inventory): returns the canonical addresses, with None for the
+# invalid ones, and a (position, message) pair for each of those; addresses that repeat are only parsed once
+def validateIPs(texts):
+    checked = {}
+    normalized = []
+    errors = []
+    for i, text in enumerate(texts):
+        result = checked.get(text)
+        if result is None:
+            result = checked[text] = checkIP(text)
+            if result[1] is None and ':' in result[0]:
+                result = checked[text] = (None, "brsaneconfig3 only supports IPv4 addresses.")
+        normalized.append(result[0])
+        if result[1] is not None:
+            errors.append((i, result[1]))
+    return normalized, errors
+
+
+# Key under which two addresses are the same: IP addresses in canonical form, node names ignoring case (they are
+# resolved like host names); addresses that don't parse are compared as they are
+def addressKey(usesIP, addr):
+    if not usesIP:
+        return (False, addr.lower())
+    normalized, error = checkIP(addr)
+    return (True, normalized if error is None else addr)
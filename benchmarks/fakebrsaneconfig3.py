@@ -0,0 +1,82 @@
+#! /usr/bin/env python
+
+# Stand-in for brsaneconfig3 used by the benchmarks: answers -q, -a and -r from a JSON store instead of the driver's
+# config files, so everything runs without a scanner, a network or the Brother packages
+# The store is {"models": [name, ...], "devices": [[name, model, usesIP, addr], ...]}, see writeStore()
+import os, sys, json
+
+
+STORE_VARIABLE = 'FAKE_BRSANECONFIG3_STORE'
+HEADER = "Devices on network"
+
+
+def writeStore(path, models, devices):
+    with open(path, 'w') as f:
+        json.dump({'models': models, 'devices': devices}, f)
+
+
+def usage():
+    sys.stdout.write("USAGE : brsaneconfig3 [-q | -a name=NAME model=MODEL ip=IP | -r name]\n")
+    return 0
+
+
+# Lines printed by -q (the benchmarks also feed them to the parser directly)
+def queryLines(store):
+    lines = ['{:3} "{}"\n'.format(i, model) for i, model in enumerate(store['models'])]
+    lines.append('\n')
+    lines.append(HEADER + '\n')
+    for i, (name, model, usesIP, addr) in enumerate(store['devices']):
+        lines.append('{:3} {} "{}" {}\n'.format(i, name, model, ('I:' if usesIP else 'N:') + addr))
+    return lines
+
+
+def query(store):
+    sys.stdout.write(''.join(queryLines(store)))
+    return 0
+
+
+# brsaneconfig3 reports problems on stdout with a zero exit code, so do the same
+def add(store, args):
+    values = dict(arg.split('=', 1) for arg in args if '=' in arg)
+    if 'name' not in values or 'model' not in values or not ('ip' in values or 'nodename' in values):
+        return usage()
+    if any(device[0] == values['name'] for device in store['devices']):
+        sys.stdout.write("Error: {} is already registered.\n".format(values['name']))
+        return 0
+    usesIP = 'ip' in values
+    store['devices'].append([values['name'], values['model'], usesIP, values['ip'] if usesIP else values['nodename']])
+    return None
+
+
+def remove(store, args):
+    if len(args) != 1:
+        return usage()
+    remaining = [device for device in store['devices'] if device[0] != args[0]]
+    if len(remaining) == len(store['devices']):
+        sys.stdout.write("Error: {} is not registered.\n".format(args[0]))
+        return 0
+    store['devices'] = remaining
+    return None
+
+
+def main(argv):
+    path = os.environ[STORE_VARIABLE]
+    with open(path) as f:
+        store = json.load(f)
+    if argv[:1] == ['-q']:
+        return query(store)
+    elif argv[:1] == ['-a']:
+        result = add(store, argv[1:])
+    elif argv[:1] == ['-r']:
+        result = remove(store, argv[1:])
+    else:
+        return usage()
+    # None means the store was changed and has to be written back
+    if result is None:
+        writeStore(path, store['models'], store['devices'])
+        return 0
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,419 @@
+#! /usr/bin/env python
+
+# Benchmarks for the paths users wait on: startup/query, parsing, save/rename/delete, merging outside changes and
+# per-keystroke work
+# brsaneconfig3 is replaced by fakebrsaneconfig3.py on PATH and the native backend works on generated files in a
+# temporary directory, so nothing on the machine is touched
+#
+#   python benchmarks/run.py -o before.json
+#   python benchmarks/run.py -o after.json
+#   python benchmarks/run.py --compare before.json after.json
+#
+# The Qt benchmarks (window startup, validation per keystroke) need PyQt4 and a display (e.g. xvfb-run) and are
+# reported as skipped otherwise
+import os, sys, json, time, socket, shutil, tempfile, argparse, platform, subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import fakebrsaneconfig3
+
+DEFAULT_SIZES = [10, 1000, 50000]
+# Most devices probed per run (one thread each, up to reachability.WORKERS at a time)
+MAX_PROBED = 1000
+# Typed one character at a time by the keystroke benchmarks
+SEARCH_TEXT = 'mfc-07'
+# Memory held while timing process spawns, standing in for the GUI's Python + Qt heap
+SPAWN_BALLAST = 512 * 1024 * 1024
+NAME_TEXT = 'office-scanner'
+
+
+# N model names in the same shape as Brother's (sorted, as brsaneconfig3 prints them)
+def makeModels(count):
+    prefixes = ['DCP-', 'MFC-', 'ADS-', 'HL-']
+    return sorted('{}{:05d}{}'.format(prefixes[i % len(prefixes)], i, 'CDW' if i % 3 else 'N') for i in range(count))
+
+
+# N devices as stored by the fake, [name, model, usesIP, addr], alternating IP addresses and node names
+def makeDevices(count, models):
+    devices = []
+    for i in range(count):
+        usesIP = i % 2 == 0
+        addr = '10.{}.{}.{}'.format(i // 65536, i // 256 % 256, i % 256) if usesIP else 'BRN_{:06X}'.format(i)
+        devices.append(['scanner{:05d}'.format(i), models[i % len(models)], usesIP, addr])
+    return devices
+
+
+# Temporary PATH entry, fake store and native backend files for one size
+class Environment(object):
+    def __init__(self, size):
+        self.size = size
+        self.directory = tempfile.mkdtemp(prefix = 'brsaneconfig-bench-')
+        self.models = makeModels(size)
+        self.devices = makeDevices(size, self.models)
+
+        binDir = os.path.join(self.directory, 'bin')
+        os.mkdir(binDir)
+        self.executable = os.path.join(binDir, 'brsaneconfig3')
+        with open(self.executable, 'w') as f:
+            f.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable,
+                                                              os.path.join(HERE, 'fakebrsaneconfig3.py')))
+        os.chmod(self.executable, 0o755)
+        self.store = os.path.join(self.directory, 'store.json')
+        self.resetStore()
+
+        self.configDir = os.path.join(self.directory, 'sane')
+        os.mkdir(self.configDir)
+        with open(os.path.join(self.configDir, 'Brsane3.ini'), 'w') as f:
+            f.write('[Driver]\nversion=0.2.13\n\n[Support Model]\n')
+            f.write(''.join('0x{:04x},1,1,"{}"\n'.format(i + 1, model) for i, model in enumerate(self.models)))
+        self.resetNative()
+
+        self.savedEnviron = dict(os.environ)
+        os.environ['PATH'] = binDir + os.pathsep + os.environ.get('PATH', '')
+        os.environ[fakebrsaneconfig3.STORE_VARIABLE] = self.store
+
+    def resetStore(self):
+        fakebrsaneconfig3.writeStore(self.store, self.models, self.devices)
+
+    def resetNative(self):
+        productIDs = dict((model, i + 1) for i, model in enumerate(self.models))
+        with open(os.path.join(self.configDir, 'brsanenetdevice3.cfg'), 'w') as f:
+            for name, model, usesIP, addr in self.devices:
+                f.write('DEVICE={} , "{}" , 0x4f9:0x{:04x} , {}\n'.format(
+                    name, model, productIDs[model], ('IP-ADDRESS=' if usesIP else 'NODENAME=') + addr))
+
+    def queryLines(self):
+        return fakebrsaneconfig3.queryLines({'models': self.models, 'devices': self.devices})
+
+    def close(self):
+        os.environ.clear()
+        os.environ.update(self.savedEnviron)
+        shutil.rmtree(self.directory, ignore_errors = True)
+
+
+# Milliseconds per call of func, over repeat runs; setup and teardown run around each call but are not timed
+def measure(func, repeat, setup = None, teardown = None):
+    runs = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        begin = time.time()
+        func()
+        runs.append((time.time() - begin) * 1000)
+        if teardown is not None:
+            teardown()
+    return summarize(runs)
+
+
+def summarize(runs):
+    ordered = sorted(runs)
+    middle = len(ordered) // 2
+    median = ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2.0
+    return {'min': round(ordered[0], 3), 'median': round(median, 3), 'mean': round(sum(runs) / len(runs), 3),
+            'runs': len(runs)}
+
+
+def benchParsing(env, repeat):
+    from brotherdevice import parseQueryOutput
+    lines = env.queryLines()
+    return {'parse': measure(lambda: parseQueryOutput(lines), repeat)}
+
+
+# Checking every IP address of an imported inventory at once
+def benchAddresses(env, repeat):
+    from addresses import validateIPs
+    addrs = [addr for name, model, usesIP, addr in env.devices if usesIP]
+    return {'validate.ips': measure(lambda: validateIPs(addrs), repeat)}
+
+
+# Recording a snapshot after an apply (the first one is stored, the rest are deduplicated away) and comparing two
+# snapshots that differ in one device
+def benchHistory(env, repeat):
+    from history import History, diffSettings
+    devices = [tuple(device) for device in env.devices]
+    changed = list(devices)
+    changed[len(changed) // 2] = ('benchmark', env.models[0], True, '192.168.0.1')
+    directory = os.path.join(env.directory, 'history')
+    return {'history.record': measure(lambda: History(directory).record(devices, 'benchmark'), repeat,
+                                      teardown = lambda: shutil.rmtree(directory, ignore_errors = True)),
+            'history.dedup': measure(lambda: History(directory).record(devices, 'benchmark'), repeat),
+            'history.diff': measure(lambda: diffSettings(devices, changed), repeat)}
+
+
+# Save (add), rename (replace) and delete (remove) of one device, through the given backend the way the window applies
+# them (BrotherDevice.applyChanges(), which also records the history)
+def benchBackend(env, backend, reset, repeat):
+    from brotherdevice import BrotherDevice, parseQueryOutput
+    from history import HISTORY
+    device = BrotherDevice()
+    device.name, device.model, device.usesIP, device.addr = 'benchmark', env.models[0], True, '192.168.0.1'
+    renamed = device.copy()
+    renamed.name = 'benchmark2'
+    withDevice = env.devices + [list(device.settings())]
+    name = backend.name
+
+    # The history follows the reset too, as it would when the change is undone in the window
+    def restore():
+        reset()
+        HISTORY.record(env.devices, "benchmark reset")
+
+    def addDevice():
+        backend.add(device)
+        HISTORY.record(withDevice, "benchmark setup")
+
+    previous = BrotherDevice.backend
+    BrotherDevice.backend = backend
+    restore()
+    try:
+        return {
+            'query.' + name: measure(lambda: parseQueryOutput(backend.query()), repeat),
+            'save.' + name: measure(lambda: BrotherDevice.applyChanges([], [device], base = env.devices), repeat,
+                                    teardown = restore),
+            'rename.' + name: measure(lambda: BrotherDevice.applyChanges([device], [renamed], base = withDevice),
+                                      repeat, setup = addDevice, teardown = restore),
+            'delete.' + name: measure(lambda: BrotherDevice.applyChanges([device], [], base = withDevice), repeat,
+                                      setup = addDevice, teardown = restore),
+        }
+    finally:
+        BrotherDevice.backend = previous
+
+
+# Picking up one device added to the device file by another program, as the file watcher does (compare with the
+# full query.native)
+def benchConfigWatch(env, repeat):
+    from brotherdevice import BrotherDevice, NativeBackend
+    from configwatch import DeviceFileTracker
+    backend = NativeBackend(env.configDir)
+    tracker = DeviceFileTracker(backend.deviceFile)
+    device = BrotherDevice()
+    device.name, device.model, device.usesIP, device.addr = 'benchmark', env.models[0], True, '192.168.0.1'
+
+    def setup():
+        tracker.reset()
+        backend.add(device)
+
+    return {'watch.change': measure(tracker.update, repeat, setup = setup, teardown = env.resetNative)}
+
+
+# Searching the model catalogue on every keystroke of SEARCH_TEXT; the first search also builds the indexes
+def benchModelSearch(env, repeat):
+    from modelsearch import ModelSearchIndex
+    prefixes = [SEARCH_TEXT[:i] for i in range(1, len(SEARCH_TEXT) + 1)]
+    runs = []
+    firstSearch = []
+    for i in range(repeat):
+        index = ModelSearchIndex(env.models)
+        begin = time.time()
+        index.search(prefixes[0])
+        firstSearch.append((time.time() - begin) * 1000)
+        for prefix in prefixes:
+            begin = time.time()
+            index.search(prefix)
+            runs.append((time.time() - begin) * 1000)
+    return {'search.first': summarize(firstSearch), 'search.keystroke': summarize(runs)}
+
+
+# Reachability probes against a listener on 127.0.0.1 (other 127.x addresses refuse the connection)
+def benchProbing(env, repeat):
+    from brotherdevice import BrotherDevice
+    from reachability import Prober
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    port = listener.getsockname()[1]
+    devices = []
+    for i in range(min(env.size, MAX_PROBED)):
+        device = BrotherDevice()
+        device.addr = '127.0.{}.{}'.format(i // 250, i % 250 + 1)
+        devices.append(device)
+    try:
+        return {'probe': measure(lambda: Prober(port = port, timeout = 1.0).probeAll(devices), repeat)}
+    finally:
+        listener.close()
+
+
+# Cost of starting a process from a large process, directly and through the spawn helper (see spawner); runs "true"
+# rather than the fake brsaneconfig3, whose own startup would hide the difference
+def benchSpawn(env, repeat):
+    from spawner import Spawner, runLocal
+    spawner = Spawner()
+    spawner.start()
+    ballast = bytearray(SPAWN_BALLAST)
+    # Touched so that the pages are really mapped
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1
+    try:
+        return {'spawn.direct': measure(lambda: list(runLocal(['true'], None, {})), repeat),
+                'spawn.helper': measure(lambda: list(spawner.stream(['true'], None, {})), repeat)}
+    finally:
+        spawner.stop()
+        del ballast
+
+
+# None if the Qt benchmarks can run, otherwise the reason they can't
+def qtUnavailable():
+    try:
+        import PyQt4
+    except ImportError:
+        return "PyQt4 is not installed"
+    # Without a display QApplication aborts the whole process instead of raising
+    if not os.environ.get('DISPLAY'):
+        return "no DISPLAY (run under xvfb-run)"
+    return None
+
+
+# Window startup until the device list is populated, cold (no caches) and warm, then the edit/validation work
+# done on every keystroke in the name field
+def benchWindow(env, repeat):
+    from PyQt4 import QtGui
+    from startupprofile import PROFILE
+    import modelcache, devicecache
+    from configwindow import ConfigWindow
+    app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv[:1])
+    windows = []
+
+    def clearCaches():
+        for path in (modelcache.CACHE_FILE, devicecache.SNAPSHOT_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def start():
+        PROFILE.finished = False
+        window = ConfigWindow()
+        windows.append(window)
+        deadline = time.time() + 600
+        while not PROFILE.finished and time.time() < deadline:
+            app.processEvents()
+            time.sleep(0.001)
+
+    def close():
+        windows.pop().close()
+
+    results = {
+        'startup.cold': measure(start, repeat, setup = clearCaches, teardown = close),
+        'startup.warm': measure(start, repeat, teardown = close),
+    }
+
+    start()
+    window = windows[-1]
+    window.addNewDevice()
+    runs = []
+    for i in range(repeat):
+        for length in range(1, len(NAME_TEXT) + 1):
+            window.friendlyNameEdit.setText(NAME_TEXT[:length])
+            begin = time.time()
+            window.onNameInputChange()
+            # Normally deferred until typing pauses, so this is the worst case
+            window.validateEditedFields()
+            runs.append((time.time() - begin) * 1000)
+    results['validate.keystroke'] = summarize(runs)
+    close()
+    return results
+
+
+def runSize(size, repeat):
+    from brotherdevice import BrotherDevice, SubprocessBackend, NativeBackend
+    sys.stderr.write("Size {}...\n".format(size))
+    env = Environment(size)
+    try:
+        results = {}
+        results.update(benchParsing(env, repeat))
+        results.update(benchAddresses(env, repeat))
+        results.update(benchBackend(env, SubprocessBackend(), env.resetStore, repeat))
+        results.update(benchBackend(env, NativeBackend(env.configDir), env.resetNative, repeat))
+        results.update(benchConfigWatch(env, repeat))
+        results.update(benchHistory(env, repeat))
+        results.update(benchModelSearch(env, repeat))
+        results.update(benchProbing(env, repeat))
+        results.update(benchSpawn(env, repeat))
+        reason = qtUnavailable()
+        if reason is None:
+            previous = BrotherDevice.backend
+            BrotherDevice.backend = SubprocessBackend()
+            try:
+                results.update(benchWindow(env, repeat))
+            finally:
+                BrotherDevice.backend = previous
+        else:
+            results['qt'] = {'skipped': reason}
+        return results
+    finally:
+        env.close()
+
+
+def gitCommit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = ROOT, stderr = subprocess.STDOUT)
+        return output.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Median of every benchmark in both files, side by side
+def compare(beforeFile, afterFile, stream):
+    with open(beforeFile) as f:
+        before = json.load(f)
+    with open(afterFile) as f:
+        after = json.load(f)
+    stream.write("{:<20} {:>8} {:>12} {:>12} {:>8}\n".format('benchmark', 'size', 'before (ms)', 'after (ms)', 'ratio'))
+    for size in sorted(set(before['results']) | set(after['results']), key = int):
+        old = before['results'].get(size, {})
+        new = after['results'].get(size, {})
+        for name in sorted(set(old) | set(new)):
+            # Skipped benchmarks have no timings
+            if name == 'qt':
+                continue
+            a = old.get(name, {}).get('median')
+            b = new.get(name, {}).get('median')
+            ratio = '{:.2f}x'.format(b / a) if a and b is not None else '-'
+            stream.write("{:<20} {:>8} {:>12} {:>12} {:>8}\n".format(name, size, '-' if a is None else a,
+                                                                      '-' if b is None else b, ratio))
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description = "Benchmark brsaneconfig-gui against a fake brsaneconfig3.")
+    parser.add_argument('--sizes', default = ','.join(str(size) for size in DEFAULT_SIZES),
+                        help = "comma separated numbers of devices and models (default: %(default)s)")
+    parser.add_argument('--repeat', type = int, default = 5, help = "runs per benchmark (default: %(default)s)")
+    parser.add_argument('-o', '--output', default = '-', help = "JSON results file (default: standard output)")
+    parser.add_argument('--compare', nargs = 2, metavar = ('BEFORE', 'AFTER'),
+                        help = "print the medians of two results files side by side instead of running")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parseArgs(argv)
+    if args.compare:
+        compare(args.compare[0], args.compare[1], sys.stdout)
+        return 0
+
+    # Keep the window's caches and the journal of the benchmark's batches out of the user's home directory, where an
+    # interrupted run would leave batches for the next real start to "recover"; the caches have to be redirected
+    # before modelcache is imported
+    cacheDir = tempfile.mkdtemp(prefix = 'brsaneconfig-bench-cache-')
+    stateDir = tempfile.mkdtemp(prefix = 'brsaneconfig-bench-state-')
+    os.environ['XDG_CACHE_HOME'] = cacheDir
+    os.environ['XDG_STATE_HOME'] = stateDir
+    try:
+        results = {}
+        for size in [int(size) for size in args.sizes.split(',')]:
+            results[str(size)] = runSize(size, args.repeat)
+    finally:
+        shutil.rmtree(cacheDir, ignore_errors = True)
+        shutil.rmtree(stateDir, ignore_errors = True)
+
+    report = {'commit': gitCommit(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'repeat': args.repeat, 'results': results}
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent = 2, sort_keys = True)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2, sort_keys = True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,885 @@
+import os, re, copy, json, time, errno, socket, hashlib, tempfile
+from collections import namedtuple
+
+from instrumentation import OPERATIONS
+from journal import JOURNAL
+from spawner import SPAWNER
+
+
+COMMAND = 'brsaneconfig3'
+# Text that separates the list of supported models from the user's devices in "brsaneconfig3 -q"
+HEADER = "Devices on network"
+# Where the brscan3 driver package keeps its files, can be overridden for non-standard installs
+CONFIG_DIR = os.environ.get('BRSANECONFIG3_DIR', '/usr/local/Brother/sane')
+# Brother's USB vendor ID, written in front of each model's product ID in the network device file
+VENDOR_ID = '0x4f9'
+# Unix socket of daemon.py, can be overridden with $BRSANECONFIG_SOCKET
+SOCKET_PATH = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), 'brsaneconfig-gui.sock')
+# Seconds to wait for the daemon's reply; its writes are queued behind everyone else's, so this is generous
+DAEMON_TIMEOUT = 120.0
+# Seconds a brsaneconfig3 command may run before it is killed, can be overridden with $BRSANECONFIG_TIMEOUT
+COMMAND_TIMEOUT = float(os.environ.get('BRSANECONFIG_TIMEOUT', '30'))
+# How many times a command is tried again (see SubprocessBackend.spawnCommand()), and the delay before the first retry
+# in seconds, doubled for each one after it
+COMMAND_RETRIES = 2
+RETRY_DELAY = 0.2
+# Reasons a process could not be started that may be gone a moment later
+TRANSIENT_ERRORS = (errno.EAGAIN, errno.ENOMEM, errno.EINTR)
+
+
+# Raised when brsaneconfig3 cannot be run or reports an error
+class BrotherError(Exception):
+    pass
+
+
+# Raised when brsaneconfig3 was killed for taking too long; a change it was making may or may not have been made
+class CommandTimeout(BrotherError):
+    pass
+
+
+# A device changed both here and elsewhere since the config was loaded; base (as loaded), ours and theirs (as it is now)
+# are (name, model, usesIP, addr) settings, or None where the device doesn't exist
+Conflict = namedtuple('Conflict', ['name', 'base', 'ours', 'theirs'])
+
+
+# Raised by a conditional batch (see checkGeneration()) that would overwrite someone else's changes; nothing was run
+# current holds the settings of every device the batch touches as they are now (by name, missing ones left out) and
+# token the generation they were read from, for retrying with one side's changes (see mergeBatch())
+class ConflictError(BrotherError):
+    def __init__(self, conflicts, current, token):
+        lines = ["{} device(s) were changed elsewhere since the list was loaded, nothing was changed:".format(
+            len(conflicts))]
+        for conflict in conflicts:
+            lines.append("{}: was {}, yours {}, now {}".format(conflict.name, describeSettings(conflict.base),
+                                                              describeSettings(conflict.ours),
+                                                              describeSettings(conflict.theirs)))
+        super(ConflictError, self).__init__("\n".join(lines))
+        self.conflicts = conflicts
+        self.current = current
+        self.token = token
+
+    # Plain representation for the daemon's replies
+    def toDict(self):
+        return {'conflicts': [list(conflict) for conflict in self.conflicts],
+                'current': dict((name, list(settings)) for name, settings in self.current.items()), 'token': self.token}
+
+    @staticmethod
+    def fromDict(values):
+        settings = lambda value: tuple(value) if value is not None else None
+        return ConflictError([Conflict(name, settings(base), settings(ours), settings(theirs))
+                              for name, base, ours, theirs in values['conflicts']],
+                             dict((name, tuple(value)) for name, value in values['current'].items()), values['token'])
+
+
+# Compact records produced by iterQueryOutput()
+ModelRecord = namedtuple('ModelRecord', ['num', 'name'])
+DeviceRecord = namedtuple('DeviceRecord', ['num', 'name', 'model', 'usesIP', 'addr'])
+# A line that could not be understood; lineNumber is 1-based, or None for problems with the output as a whole
+ParseWarning = namedtuple('ParseWarning', ['lineNumber', 'line', 'message'])
+
+
+class BrotherDevice(object):
+    # Large device tables create one of these per row, so skip the per-instance __dict__
+    __slots__ = ('isNew', 'devID', 'name', 'model', 'usesIP', 'addr')
+
+    # Backend used by queryDevices(), addDevice(), removeDevice() and replaceDevice(), see selectBackend()
+    backend = None
+
+    # info is a device line from "brsaneconfig3 -q" (raises ValueError if it is malformed) or a DeviceRecord
+    def __init__(self, info = None):
+        if info is not None:
+            self.isNew = False
+            record = info if isinstance(info, DeviceRecord) else parseDeviceLine(info)
+            self.devID = record.num
+            self.name = record.name
+            self.model = record.model
+            self.usesIP = record.usesIP
+            self.addr = record.addr
+        else:
+            self.isNew = True
+            self.devID = -1
+            self.name = ''
+            self.model = ''
+            self.usesIP = True
+            self.addr = '...'
+
+    def __str__(self):
+        return "devID: {}, name: {}, model: {}, addr: {} ({})".format(self.devID, self.name, self.model, self.addr,
+                                                                      'IP' if self.usesIP else 'node')
+
+    # Plain representation used for the startup snapshot (see devicecache)
+    def toDict(self):
+        return {'devID': self.devID, 'name': self.name, 'model': self.model, 'usesIP': self.usesIP, 'addr': self.addr}
+
+    @staticmethod
+    def fromDict(values):
+        device = BrotherDevice()
+        device.isNew = False
+        device.devID = values['devID']
+        device.name = values['name']
+        device.model = values['model']
+        device.usesIP = values['usesIP']
+        device.addr = values['addr']
+        return device
+
+    # True if both devices would be configured identically (devices are otherwise compared by identity)
+    def hasSameSettings(self, other):
+        return self.toDict() == other.toDict()
+
+    # What brsaneconfig3 stores for the device (devID is only its position in the list)
+    def settings(self):
+        return (self.name, self.model, self.usesIP, self.addr)
+
+    # Take over all of other's values (used to update a device in place, keeping its identity)
+    def assign(self, other):
+        for field in BrotherDevice.__slots__:
+            setattr(self, field, getattr(other, field))
+
+    # Copy of this device, used to hand a stable snapshot to background commands and to roll back failed saves
+    def copy(self):
+        return copy.copy(self)
+
+    # Output of "brsaneconfig3 -q", as an iterable of lines (streamed where the backend allows it)
+    @staticmethod
+    def queryDevices():
+        return OPERATIONS.call('queryDevices', BrotherDevice.backend, BrotherDevice.backend.query)
+
+    @staticmethod
+    def addDevice(device):
+        return OPERATIONS.call('addDevice', BrotherDevice.backend, BrotherDevice.backend.add, device)
+
+    @staticmethod
+    def removeDevice(name):
+        return OPERATIONS.call('removeDevice', BrotherDevice.backend, BrotherDevice.backend.remove, name)
+
+    # Replace a saved device with new settings (or add it if previous is None); returns False if nothing had to change
+    # Nothing runs if the settings are the same, brsaneconfig3 can only do this as a remove and an add
+    @staticmethod
+    def replaceDevice(previous, device):
+        if previous is not None and previous.settings() == device.settings():
+            return False
+        OPERATIONS.call('replaceDevice', BrotherDevice.backend, BrotherDevice.backend.replace, previous, device)
+        return True
+
+    # Remove and then add lists of devices as one all-or-nothing batch; returns the (removals, additions) that ran and
+    # the token of the config the batch left, taken right after its own last write so that a change someone else makes
+    # afterwards is not mistaken for part of it
+    # With the token of the config the devices were loaded from (see configToken()), steps that someone else already
+    # made are skipped and changes to the same devices raise ConflictError instead of being overwritten
+    # The resulting configuration is added to the history with reason, unless it is None (e.g. for a bulk job, which
+    # records once at the end); base is the (name, model, usesIP, addr) settings of the devices before the batch, if
+    # the caller has them (see recordHistory())
+    @staticmethod
+    def applyChanges(removals, additions, token = None, reason = "applied changes", base = None):
+        result = OPERATIONS.call('applyChanges', BrotherDevice.backend, BrotherDevice.backend.applyBatch,
+                                 removals, additions, token)
+        if reason is not None and (result[0] or result[1]):
+            BrotherDevice.recordHistory(result[0], result[1], reason, base)
+        return result
+
+    # Add the configuration that removing and adding the devices produced to the history (see history.History), so
+    # that every change made through this module (GUI, cli.py) can be compared with and restored later; returns the
+    # new Snapshot or None
+    # The configuration is worked out from base, or from the latest snapshot if there is no base, rather than by
+    # querying brsaneconfig3 again after every change
+    # Nothing is recorded through the daemon backend, the daemon records the changes it makes itself
+    @staticmethod
+    def recordHistory(removals, additions, reason, base = None):
+        if isinstance(BrotherDevice.backend, DaemonBackend):
+            return None
+        # history imports this module
+        from history import HISTORY
+        return HISTORY.recordChange([device.settings() for device in removals],
+                                    [device.settings() for device in additions], reason, base)
+
+    # Generation token of the device file as it is now, to be taken before loading the devices
+    @staticmethod
+    def configToken():
+        return configToken(BrotherDevice.backend.deviceFile)
+
+    # Finish the batches that were interrupted last time (see journal); returns a message for each one
+    @staticmethod
+    def recoverInterrupted():
+        messages = []
+        settings = None
+        with JOURNAL.recovering():
+            for batch in JOURNAL.unfinished():
+                message, recovered = recoverBatch(BrotherDevice.backend, batch)
+                messages.append(message)
+                settings = recovered if recovered is not None else settings
+        if settings is not None:
+            BrotherDevice.recordHistory([], [], "recovered interrupted changes", settings)
+        return messages
+
+
+# Parse one device line, e.g. '  0 office "MFC-9440CN" I:192.168.1.10' (or N:BRN_xxxxxx for node names)
+# Raises ValueError with a short description if the line is malformed
+def parseDeviceLine(line):
+    fields = line.split()
+    if len(fields) != 4:
+        raise ValueError("expected 4 fields, found {}".format(len(fields)))
+    num, name, model, ipOrNode = fields
+    if not num.isdigit():
+        raise ValueError("device number '{}' is not a number".format(num))
+    if len(model) < 3 or not (model.startswith('"') and model.endswith('"')):
+        raise ValueError("model {} is not quoted".format(model))
+    # Check if IP or node name is specified, and remove the prefix
+    if ipOrNode.startswith("I:"):
+        return DeviceRecord(num, name, model[1:-1], True, ipOrNode[len("I:"):])
+    if ipOrNode.startswith("N:"):
+        node = ipOrNode[len("N:"):]
+        return DeviceRecord(num, name, model[1:-1], False, node[len("BRN_"):] if node.startswith("BRN_") else node)
+    raise ValueError("address '{}' has neither an I: nor an N: prefix".format(ipOrNode))
+
+
+# DEVICE=name , "MFC-9440CN" , 0x4f9:0x0160 , IP-ADDRESS=192.168.1.10 (or NODENAME=BRN_xxxxxx)
+DEVICE_ENTRY = re.compile(r'^DEVICE=(\S+)\s*,\s*"([^"]*)"\s*,\s*(\S+)\s*,\s*(IP-ADDRESS|NODENAME)=(\S+)\s*$')
+
+
+# Parse one line of brsanenetdevice3.cfg into (name, model, usesIP, addr), or None if it is not a device line
+def parseDeviceEntry(line):
+    match = DEVICE_ENTRY.match(line.strip())
+    if match is None:
+        return None
+    name, model, productID, addrType, addr = match.groups()
+    usesIP = addrType == 'IP-ADDRESS'
+    return (name, model, usesIP, addr if usesIP else addr.replace('BRN_', '', 1))
+
+
+# Parse "brsaneconfig3 -q" output one line at a time, yielding ModelRecord, DeviceRecord and ParseWarning objects
+# Lines may be str or bytes (Python 3 pipes), so the output can be fed straight from the process without buffering it
+def iterQueryOutput(lines):
+    inDevices = False
+    lineNumber = 0
+    for lineNumber, line in enumerate(lines, 1):
+        if not isinstance(line, str):
+            line = line.decode('utf-8', 'replace')
+        line = line.rstrip('\r\n')
+        # brsaneconfig3 does not return nonzero exit code even when given bad params, prints usage text instead
+        if "USAGE" in line:
+            raise BrotherError("Invalid output when querying devices.")
+        if not inDevices:
+            # The header separates the list of supported models from the user's devices
+            if line.strip() == HEADER:
+                inDevices = True
+                continue
+            fields = line.split()
+            # Blank lines, and models without a name (brsaneconfig3 lists a few), are skipped
+            if len(fields) < 2:
+                continue
+            if len(fields) > 2 or not fields[0].isdigit():
+                yield ParseWarning(lineNumber, line, "expected a model number and name")
+                continue
+            # Remove surrounding quotation marks
+            yield ModelRecord(fields[0], fields[1].replace('"', ''))
+        elif line.strip():
+            try:
+                yield parseDeviceLine(line)
+            except ValueError as e:
+                yield ParseWarning(lineNumber, line, str(e))
+    if not inDevices:
+        yield ParseWarning(None, '', "the '{}' header is missing after {} lines".format(HEADER, lineNumber))
+
+
+# Split "brsaneconfig3 -q" output into the sorted list of supported model names and the list of BrotherDevice objects
+# Models are skipped (None is returned for them) when parseModels is False, e.g. because they were cached
+# Malformed lines are appended to warnings (if given) as ParseWarning objects instead of aborting the parse
+def parseQueryOutput(output, parseModels = True, warnings = None):
+    models = [] if parseModels else None
+    devices = []
+    for record in iterQueryOutput(output):
+        if isinstance(record, DeviceRecord):
+            devices.append(BrotherDevice(record))
+        elif isinstance(record, ModelRecord):
+            if parseModels:
+                models.append(record.name)
+        elif warnings is not None:
+            warnings.append(record)
+    if parseModels:
+        models.sort()
+    return models, devices
+
+
+# Runs brsaneconfig3 for every operation
+class SubprocessBackend:
+    name = 'subprocess'
+
+    # brsaneconfig3 keeps its state in the same files the native backend edits; they are only read, to notice changes
+    # made outside the GUI (see configwatch)
+    def __init__(self, configDir = CONFIG_DIR):
+        self.modelFile = os.path.join(configDir, 'Brsane3.ini')
+        self.deviceFile = os.path.join(configDir, 'brsanenetdevice3.cfg')
+
+    # File whose path/mtime/size identify the model catalogue (see modelcache)
+    def catalogueFile(self):
+        return findExecutable(COMMAND)
+
+    # Run brsaneconfig3 with the given arguments and return its output
+    # Errors are raised as BrotherError so that callers on any thread can decide how to report them
+    def runCommand(self, args, failureMessage):
+        status = {}
+        output = b''.join(self.spawnCommand([COMMAND] + args, status, False))
+        checkStatus(status, failureMessage, output)
+        return output
+
+    # Like runCommand(), but yields the output line by line as brsaneconfig3 prints it
+    # readOnly commands are tried again if they time out (see spawnCommand())
+    def streamCommand(self, args, failureMessage, readOnly = False):
+        status = {}
+        for line in self.spawnCommand([COMMAND] + args, status, readOnly):
+            yield line
+        checkStatus(status, failureMessage, None)
+
+    # Yields argv's output line by line; status gets its 'returnCode' and whether it 'timedOut' (see spawner)
+    # A command that could not be started because the system was short of processes or memory is tried again, and so
+    # is a readOnly one that timed out before printing anything; a change that timed out may still have been made, so
+    # it is not
+    # Every process is reported to the operations log (see instrumentation); the time reported leaves out the time
+    # spent by the consumer between lines
+    def spawnCommand(self, argv, status, readOnly):
+        for attempt in range(COMMAND_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            status.clear()
+            seconds = 0.0
+            outputSize = 0
+            begin = time.time()
+            lines = SPAWNER.stream(argv, COMMAND_TIMEOUT, status)
+            try:
+                for line in lines:
+                    outputSize += len(line)
+                    seconds += time.time() - begin
+                    yield line
+                    begin = time.time()
+            except OSError as e:
+                if e.errno in TRANSIENT_ERRORS and attempt < COMMAND_RETRIES:
+                    continue
+                raise BrotherError("Invalid command.\n" + e.strerror)
+            finally:
+                # Also when the consumer stops early, so that the process is done with before it is reported
+                lines.close()
+                OPERATIONS.command(argv, seconds + time.time() - begin, status.get('returnCode'), outputSize)
+            if not (status['timedOut'] and readOnly and outputSize == 0 and attempt < COMMAND_RETRIES):
+                return
+
+    # See iterQueryOutput() for how the USAGE text is detected
+    def query(self):
+        return self.streamCommand(["-q"], "Could not gather list of devices.", readOnly = True)
+
+    def add(self, device):
+        output = self.runCommand(["-a",
+                                  "name={}".format(device.name),
+                                  "model={}".format(device.model),
+                                  "ip={}".format(device.addr) if device.usesIP else "nodename=BRN_{}".format(device.addr)],
+                                 "Could not add device.")
+        # There should be no output (see comments in iterQueryOutput())
+        if len(output) > 0:
+            raise BrotherError("Error adding device.")
+        return output
+
+    def remove(self, name):
+        output = self.runCommand(["-r", name], "Could not remove device.")
+        # There should be no output (see comments in iterQueryOutput())
+        if len(output) > 0:
+            raise BrotherError("Error removing device.")
+        return output
+
+    # brsaneconfig3 cannot edit in place, so this is a remove followed by an add; if the add fails, the previous
+    # device is put back so that it doesn't simply disappear
+    def replace(self, previous, device):
+        self.applyBatch([previous] if previous is not None else [], [device])
+
+    # Each step is undone in reverse order if a later one fails
+    # Batches of more than one command are journaled first, so that if the process dies in the middle the batch is
+    # finished (or undone) on the next start instead of leaving devices missing
+    # A step that timed out may or may not have been made, so its undoing is left to the next start (see
+    # journalUncertainStep())
+    def applyBatch(self, removals, additions, token = None):
+        removals, additions = checkGeneration(self.deviceFile, token, removals, additions)
+        batchID = beginBatch(removals, additions) if len(removals) + len(additions) > 1 else None
+        done = []
+        step = None
+        try:
+            for device in removals:
+                step = ('remove', device)
+                self.runStep(self.remove, device.name,
+                             lambda current, name = device.name: name not in current)
+                done.append((self.add, device))
+                journalStep(batchID, 'remove', device.name)
+            for device in additions:
+                step = ('add', device)
+                self.runStep(self.add, device,
+                             lambda current, device = device: device.name in current and
+                             current[device.name].settings() == device.settings())
+                done.append((self.remove, device.name))
+                journalStep(batchID, 'add', device.name)
+            token = configToken(self.deviceFile)
+        except BrotherError as e:
+            failures = []
+            for undo, arg in reversed(done):
+                try:
+                    undo(arg)
+                except BrotherError as undoError:
+                    failures.append(str(undoError))
+            if failures:
+                # Left open in the journal, the next start tries again
+                raise BrotherError(str(e) + "\nCould not undo every change:\n" + "\n".join(failures))
+            endBatch(batchID, 'rolledBack')
+            if isinstance(e, CommandTimeout):
+                raise CommandTimeout(str(e) + "\n" + journalUncertainStep(*step))
+            raise
+        endBatch(batchID, 'committed')
+        return removals, additions, token
+
+    # Run one step of a batch, func(arg); if it times out, brsaneconfig3 is queried to see whether it was made anyway
+    # (isMade(devices by name)) before the batch goes on, and a step that was not made is tried once more
+    # Raises CommandTimeout if it is still unknown whether the step was made
+    def runStep(self, func, arg, isMade):
+        try:
+            func(arg)
+            return
+        except CommandTimeout as e:
+            timeout = e
+        try:
+            current = dict((device.name, device) for device in parseQueryOutput(self.query(), parseModels = False)[1])
+        except BrotherError as e:
+            raise CommandTimeout("{}\nCould not check whether it was made:\n{}".format(timeout, e))
+        if not isMade(current):
+            func(arg)
+
+
+# Reads and writes the files behind brsaneconfig3 directly: the model list in Brsane3.ini and the network devices in
+# brsanenetdevice3.cfg. Each edit is a single atomic rewrite of the device file instead of one or two process spawns.
+class NativeBackend:
+    name = 'native'
+    # 0x0160,13,1,"MFC-9440CN" in the [Support Model] section
+    MODEL_LINE = re.compile(r'^\s*(0x[0-9A-Fa-f]+)\s*,.*"([^"]+)"\s*$')
+
+    def __init__(self, configDir = CONFIG_DIR):
+        self.modelFile = os.path.join(configDir, 'Brsane3.ini')
+        self.deviceFile = os.path.join(configDir, 'brsanenetdevice3.cfg')
+
+    def catalogueFile(self):
+        return self.modelFile if os.path.exists(self.modelFile) else None
+
+    # List of (product ID, model name) in the order brsaneconfig3 prints them
+    def readModels(self):
+        models = []
+        inSection = False
+        for line in self.readLines(self.modelFile, "Could not read the list of supported models."):
+            line = line.strip()
+            if line.startswith('['):
+                inSection = line.lower() == '[support model]'
+                continue
+            match = NativeBackend.MODEL_LINE.match(line) if inSection else None
+            if match is not None:
+                models.append((match.group(1), match.group(2)))
+        return models
+
+    # All lines of the device file, with the parsed (name, model, usesIP, addr) for device lines and None for others
+    def readDevices(self):
+        if not os.path.exists(self.deviceFile):
+            return []
+        return [(line, parseDeviceEntry(line))
+                for line in self.readLines(self.deviceFile, "Could not read the list of devices.")]
+
+    def readLines(self, path, failureMessage):
+        try:
+            with open(path) as f:
+                return f.read().splitlines()
+        except (IOError, OSError) as e:
+            raise BrotherError(failureMessage + "\n" + str(e))
+
+    def query(self):
+        return queryLines([model for productID, model in self.readModels()],
+                          [info for line, info in self.readDevices() if info is not None])
+
+    def add(self, device):
+        self.replace(None, device)
+        return ''
+
+    def remove(self, name):
+        entries = self.readDevices()
+        kept = [line for line, info in entries if info is None or info[0] != name]
+        if len(kept) == len(entries):
+            raise BrotherError("Could not remove device.\nNo device named '{}'.".format(name))
+        self.writeLines(kept)
+        return ''
+
+    # The old entry is swapped for the new one in a single write, so there is no window where neither exists
+    def replace(self, previous, device):
+        productIDs = self.productIDs()
+        newLine = self.deviceLine(device, productIDs)
+        lines = []
+        replaced = False
+        for line, info in self.readDevices():
+            if info is not None and previous is not None and info[0] == previous.name:
+                lines.append(newLine)
+                replaced = True
+            elif info is not None and info[0] == device.name:
+                raise BrotherError("Could not add device.\nA device named '{}' already exists.".format(device.name))
+            else:
+                lines.append(line)
+        if not replaced:
+            lines.append(newLine)
+        self.writeLines(lines)
+
+    # The whole batch is a single write, so it either happens completely or not at all
+    def applyBatch(self, removals, additions, token = None):
+        removals, additions = checkGeneration(self.deviceFile, token, removals, additions)
+        productIDs = self.productIDs()
+        removedNames = set(device.name for device in removals)
+        entries = self.readDevices()
+        lines = [line for line, info in entries if info is None or info[0] not in removedNames]
+        names = set(info[0] for line, info in entries if info is not None) - removedNames
+        for device in additions:
+            if device.name in names:
+                raise BrotherError("Could not add device.\nA device named '{}' already exists.".format(device.name))
+            names.add(device.name)
+            lines.append(self.deviceLine(device, productIDs))
+        return removals, additions, self.writeLines(lines)
+
+    def productIDs(self):
+        return dict((model, productID) for productID, model in self.readModels())
+
+    def deviceLine(self, device, productIDs):
+        if device.model not in productIDs:
+            raise BrotherError("Could not add device.\nUnsupported model '{}'.".format(device.model))
+        return 'DEVICE={} , "{}" , {}:{} , {}'.format(device.name, device.model, VENDOR_ID, productIDs[device.model],
+                                                      'IP-ADDRESS=' + device.addr if device.usesIP
+                                                      else 'NODENAME=BRN_' + device.addr)
+
+    # Write to a temporary file next to the device file and rename it over the original, which is atomic on POSIX
+    def writeLines(self, lines):
+        directory = os.path.dirname(self.deviceFile)
+        try:
+            mode = os.stat(self.deviceFile).st_mode & 0o777 if os.path.exists(self.deviceFile) else 0o644
+            fd, tempPath = tempfile.mkstemp(dir = directory, prefix = '.brsanenetdevice3-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(''.join(line + '\n' for line in lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tempPath, mode)
+                # The renamed file keeps the temporary file's mtime, size and contents
+                token = configToken(tempPath)
+                os.rename(tempPath, self.deviceFile)
+            except:
+                os.remove(tempPath)
+                raise
+        except (IOError, OSError) as e:
+            raise BrotherError("Could not write the list of devices.\n" + str(e))
+        return token
+
+
+# Talks to daemon.py, which runs one of the other backends on behalf of every client on the machine: queries are
+# answered from its memory and changes go through its single writer, so concurrent users don't clobber each other
+# Each call is one JSON request and reply on a new connection to the daemon's Unix socket
+class DaemonBackend:
+    name = 'daemon'
+
+    # The files are only used to notice changes (see configwatch), the daemon writes them on the same machine
+    def __init__(self, socketPath = None, configDir = CONFIG_DIR):
+        self.socketPath = socketPath or daemonSocket()
+        self.modelFile = os.path.join(configDir, 'Brsane3.ini')
+        self.deviceFile = os.path.join(configDir, 'brsanenetdevice3.cfg')
+
+    # Only used for the model cache, which is simply skipped if the daemon can't be reached
+    def catalogueFile(self):
+        try:
+            return self.request({'op': 'info'}, "Could not contact the daemon.")['catalogueFile']
+        except BrotherError:
+            return None
+
+    # Send one request and return the reply; errors reported by the daemon are raised as they are
+    def request(self, message, failureMessage):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # Connected before the timeout is set: with a timeout, a busy daemon's full backlog fails the connect
+            # right away instead of waiting for a free slot
+            connection.connect(self.socketPath)
+            connection.settimeout(DAEMON_TIMEOUT)
+            connection.sendall((json.dumps(message) + "\n").encode('utf-8'))
+            reply = connection.makefile('rb').readline()
+        except (socket.error, OSError) as e:
+            raise BrotherError(failureMessage + "\nNo daemon answering at {}: {}".format(self.socketPath, e))
+        finally:
+            connection.close()
+        try:
+            response = json.loads(reply.decode('utf-8'))
+        except ValueError:
+            raise BrotherError(failureMessage + "\nInvalid reply from the daemon.")
+        if 'conflict' in response:
+            raise ConflictError.fromDict(response['conflict'])
+        if 'error' in response:
+            raise BrotherError(response['error'])
+        return response
+
+    # JSON strings are unicode on Python 2, where iterQueryOutput() expects the encoded lines a pipe would give
+    def query(self):
+        lines = self.request({'op': 'query'}, "Could not gather list of devices.")['lines']
+        return [line if isinstance(line, str) else line.encode('utf-8') for line in lines]
+
+    def add(self, device):
+        self.request({'op': 'add', 'device': device.toDict()}, "Could not add device.")
+        return ''
+
+    def remove(self, name):
+        self.request({'op': 'remove', 'name': name}, "Could not remove device.")
+        return ''
+
+    def replace(self, previous, device):
+        self.request({'op': 'replace', 'previous': previous.toDict() if previous is not None else None,
+                      'device': device.toDict()}, "Could not save device.")
+
+    # The daemon checks the token on its writer thread, so no other client can write in between
+    def applyBatch(self, removals, additions, token = None):
+        response = self.request({'op': 'applyBatch', 'removals': [device.toDict() for device in removals],
+                                 'additions': [device.toDict() for device in additions], 'token': token},
+                                "Could not apply changes.")
+        return ([BrotherDevice.fromDict(values) for values in response['removals']],
+                [BrotherDevice.fromDict(values) for values in response['additions']], response.get('token'))
+
+
+# Same lines "brsaneconfig3 -q" prints for the model names and (name, model, usesIP, addr) devices, for backends that
+# don't run it, so callers don't need to know which backend is in use
+def queryLines(models, devices):
+    lines = ['{:3} "{}"'.format(i, model) for i, model in enumerate(models)]
+    lines.append(HEADER)
+    for i, (name, model, usesIP, addr) in enumerate(devices):
+        lines.append('{:3} {} "{}" {}'.format(i, name, model, ('I:' if usesIP else 'N:BRN_') + addr))
+    return lines
+
+
+# Journal helpers for SubprocessBackend.applyBatch(); batchID None means the batch is not journaled
+# Only failing to record the intent stops a batch, the other entries just make recovery cheaper
+def beginBatch(removals, additions):
+    try:
+        return JOURNAL.begin([device.toDict() for device in removals], [device.toDict() for device in additions])
+    except (IOError, OSError) as e:
+        raise BrotherError("Could not write the journal, nothing was changed.\n" + str(e))
+
+
+def journalStep(batchID, op, name):
+    if batchID is not None:
+        try:
+            JOURNAL.step(batchID, op, name)
+        except (IOError, OSError):
+            pass
+
+
+def endBatch(batchID, outcome):
+    if batchID is not None:
+        try:
+            JOURNAL.end(batchID, outcome)
+        except (IOError, OSError):
+            pass
+
+
+# Journal the undoing of a step (op 'remove' or 'add' of device) whose command timed out, as a batch of its own that is
+# left open: the next start checks what brsaneconfig3 has and undoes the step only if it was made
+# Returns what to tell the user
+def journalUncertainStep(op, device):
+    removals, additions = ([], [device]) if op == 'remove' else ([device], [])
+    try:
+        JOURNAL.begin([device.toDict() for device in removals], [device.toDict() for device in additions])
+    except (IOError, OSError):
+        return "The last step timed out and may or may not have been applied; check {}.".format(device.name)
+    return "The last step timed out and may or may not have been applied; it will be checked on the next start."
+
+
+# Bring an interrupted batch to an end: first try to finish it (run whatever removals and additions are still
+# missing), and if that is impossible or fails, undo it back to the devices it started from
+# brsaneconfig3 is queried rather than trusting the step entries, so it does not matter which of them reached the disk
+# The batch stays in the journal if neither works, to be tried again next time
+# Returns a message saying what happened, and the settings of the devices afterwards (None if nothing was recovered)
+def recoverBatch(backend, batch):
+    removals = [BrotherDevice.fromDict(values) for values in batch['removals']]
+    additions = [BrotherDevice.fromDict(values) for values in batch['additions']]
+    names = ', '.join(sorted(set(device.name for device in removals + additions)))
+    try:
+        try:
+            settings = finishBatch(backend, removals, additions)
+            outcome, message = 'replayed', "Finished an interrupted change to {}."
+        except BrotherError:
+            # Undoing is the same as finishing the reverse batch
+            settings = finishBatch(backend, additions, removals)
+            outcome, message = 'rolledBack', "Undid an interrupted change to {}."
+    except BrotherError as e:
+        return "Could not recover an interrupted change to {}, will try again next time.\n{}".format(names, e), None
+    try:
+        JOURNAL.end(batch['id'], outcome)
+    except (IOError, OSError) as e:
+        return ("Recovered an interrupted change to {}, but could not update the journal.\n{}".format(names, e),
+                settings)
+    return message.format(names), settings
+
+
+# Returns the settings of the devices once the batch is finished
+def finishBatch(backend, removals, additions):
+    devices = parseQueryOutput(backend.query(), parseModels = False)[1]
+    current = dict((device.name, device) for device in devices)
+    remaining = remainingSteps(current, removals, additions)
+    if remaining is None:
+        raise BrotherError("The devices have been changed since.")
+    backend.applyBatch(*remaining)
+    removedNames = set(device.name for device in remaining[0])
+    return ([device.settings() for device in devices if device.name not in removedNames] +
+            [device.settings() for device in remaining[1]])
+
+
+# (removals, additions) still needed to go from the current devices (by name) to the end state of a batch, or None
+# if another change got in the way (a name that is taken by a device the batch knows nothing about)
+def remainingSteps(current, removals, additions):
+    pending = [device for device in removals
+               if device.name in current and current[device.name].settings() == device.settings()]
+    left = dict((name, device) for name, device in current.items())
+    for device in pending:
+        del left[device.name]
+    missing = []
+    for device in additions:
+        existing = left.get(device.name)
+        if existing is None:
+            missing.append(device)
+        elif existing.settings() != device.settings():
+            return None
+    return pending, missing
+
+
+# Generation token of the device file: mtime and size change with almost every write and are compared first, the hash
+# catches the writes they miss (same size within the mtime's resolution); None if there is no file to compare with
+def configToken(path):
+    try:
+        with open(path, 'rb') as f:
+            return tokenOf(os.fstat(f.fileno()), f.read())
+    except (IOError, OSError):
+        return None
+
+
+def tokenOf(info, data):
+    return {'mtime': info.st_mtime, 'size': info.st_size, 'sha1': hashlib.sha1(data).hexdigest()}
+
+
+def tokenMatches(path, token):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    if info.st_mtime != token['mtime'] or info.st_size != token['size']:
+        return False
+    return configToken(path) == token
+
+
+# Settings of the named devices as the device file has them now, and the token of that version
+def currentRows(path, names):
+    try:
+        with open(path, 'rb') as f:
+            info = os.fstat(f.fileno())
+            data = f.read()
+    except (IOError, OSError) as e:
+        raise BrotherError("Could not read the list of devices.\n" + str(e))
+    text = data if isinstance(data, str) else data.decode('utf-8', 'replace')
+    rows = {}
+    for line in text.splitlines():
+        entry = parseDeviceEntry(line)
+        if entry is not None and entry[0] in names:
+            rows[entry[0]] = entry
+    return rows, tokenOf(info, data)
+
+
+# The first thing a conditional batch does: if the device file is still the version the batch was made against (or
+# there is no token to check), run it as it is; otherwise merge it with the current rows of the devices it touches
+def checkGeneration(path, token, removals, additions):
+    if token is None or tokenMatches(path, token):
+        return removals, additions
+    current, currentToken = currentRows(path, set(device.name for device in removals + additions))
+    removals, additions, conflicts = mergeBatch(removals, additions, current)
+    if conflicts:
+        raise ConflictError(conflicts, current, currentToken)
+    return removals, additions
+
+
+# Three-way merge of a batch with the devices as they are now, one device name at a time: base is the removal (the
+# device as loaded), ours the addition and theirs the current row
+#   theirs == base: nobody else touched it, our steps run
+#   theirs == ours: someone made the same change already, our steps are skipped
+#   otherwise:      a Conflict, unless preferOurs, in which case theirs is replaced by ours
+# Returns (removals, additions, conflicts); devices not in the batch are never looked at
+def mergeBatch(removals, additions, current, preferOurs = False):
+    base = dict((device.name, device) for device in removals)
+    ours = dict((device.name, device) for device in additions)
+    keptRemovals = []
+    keptAdditions = []
+    conflicts = []
+    for name in sorted(set(base) | set(ours)):
+        baseSettings = base[name].settings() if name in base else None
+        ourSettings = ours[name].settings() if name in ours else None
+        theirs = current.get(name)
+        if theirs == baseSettings:
+            if name in base:
+                keptRemovals.append(base[name])
+            if name in ours:
+                keptAdditions.append(ours[name])
+        elif theirs == ourSettings:
+            continue
+        elif preferOurs:
+            if theirs is not None:
+                keptRemovals.append(BrotherDevice(DeviceRecord('-1', *theirs)))
+            if name in ours:
+                keptAdditions.append(ours[name])
+        else:
+            conflicts.append(Conflict(name, baseSettings, ourSettings, theirs))
+    # Keep the batch's own order, which decides where brsaneconfig3 puts the additions
+    order = dict((device, i) for i, device in enumerate(removals + additions))
+    keptRemovals.sort(key = lambda device: order.get(device, -1))
+    keptAdditions.sort(key = lambda device: order.get(device, -1))
+    return keptRemovals, keptAdditions, conflicts
+
+
+def describeSettings(settings):
+    if settings is None:
+        return "(none)"
+    name, model, usesIP, addr = settings
+    return "{} at {}".format(model, addr if usesIP else 'BRN_' + addr)
+
+
+BACKENDS = {SubprocessBackend.name: SubprocessBackend, NativeBackend.name: NativeBackend,
+            DaemonBackend.name: DaemonBackend}
+
+
+# Choose the backend by name ("subprocess", "native" or "daemon"), defaulting to $BRSANECONFIG_BACKEND or "subprocess"
+def selectBackend(name = None):
+    name = name or os.environ.get('BRSANECONFIG_BACKEND', SubprocessBackend.name)
+    if name not in BACKENDS:
+        raise BrotherError("Unknown backend '{}'.".format(name))
+    BrotherDevice.backend = BACKENDS[name]()
+    return BrotherDevice.backend
+
+
+# Where daemon.py listens and DaemonBackend connects
+def daemonSocket():
+    return os.environ.get('BRSANECONFIG_SOCKET', SOCKET_PATH)
+
+
+# Raise a BrotherError if a command that finished with status (see SubprocessBackend.spawnCommand()) failed; output is
+# what it printed, if it was kept
+def checkStatus(status, failureMessage, output):
+    if status['timedOut']:
+        raise CommandTimeout(failureMessage + "\n{} did not finish within {:g} seconds.".format(COMMAND, COMMAND_TIMEOUT))
+    if status['returnCode'] != 0:
+        if output:
+            raise BrotherError(failureMessage + "\n" + (output if isinstance(output, str) else
+                                                        output.decode('utf-8', 'replace')))
+        raise BrotherError(failureMessage + "\n{} exited with status {}.".format(COMMAND, status['returnCode']))
+
+
+# Full path of the executable that would be run for command, or None if it is not on the PATH
+def findExecutable(command):
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(directory, command)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return os.path.realpath(path)
+    return None
+
+
+BrotherDevice.backend = SubprocessBackend()
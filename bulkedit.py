@@ -0,0 +1,188 @@
+import re
+from collections import namedtuple
+
+from brotherdevice import BrotherDevice, BrotherError, ConflictError, describeSettings
+from addresses import addressKey, normalizeIP
+from editstate import IP_FIELDS, addressError
+from pendingchanges import describeAddress
+
+
+# Outcome of one device in a bulk job
+DONE = 'done'
+UNCHANGED = 'unchanged'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# One device of a bulk job: device is the object shown in the list, original a copy of its saved settings and updated
+# its new settings (None to delete it)
+BulkItem = namedtuple('BulkItem', ['device', 'original', 'updated'])
+# What happened to an item; detail is a human readable reason for FAILED, SKIPPED and UNCHANGED
+BulkResult = namedtuple('BulkResult', ['item', 'status', 'detail'])
+
+
+# Items that delete every device
+def deletionItems(devices):
+    return [BulkItem(device, device.copy(), None) for device in devices]
+
+
+# Items that give the devices the addresses produced by rewrite (see IPRewrite, NodeRewrite), and a SKIPPED result
+# for every device it doesn't apply to, would give an invalid address or would put on an address that is taken
+# devicesAt(usesIP, addr), if given, lists the devices at an address (see DeviceModel.devicesAt()); an address is taken
+# by a device there that is not moved by the batch, or by a device of the batch that was given it first
+def rewriteItems(devices, rewrite, devicesAt = None):
+    candidates = []
+    skipped = []
+    for device in devices:
+        addr = rewrite.apply(device)
+        item = BulkItem(device, device.copy(), None)
+        if addr is None:
+            skipped.append(BulkResult(item, SKIPPED, "does not match"))
+            continue
+        values = {'usesIP': device.usesIP, 'node': addr}
+        values.update(zip(IP_FIELDS, (addr.split('.') + ['', '', '', ''])[:4]))
+        error = addressError(values)
+        if error is not None:
+            skipped.append(BulkResult(item, SKIPPED, "{}: {}".format(addr, error)))
+            continue
+        updated = device.copy()
+        # Parts copied from the old address may have leading zeros
+        updated.addr = normalizeIP(addr) if device.usesIP else addr
+        candidates.append(item._replace(updated = updated))
+    # A skipped device stays where it is, which may take an address another one was going to move to, so this is
+    # repeated until no more devices are skipped
+    while True:
+        moving = set(id(item.device) for item in candidates)
+        claimed = {}
+        items = []
+        conflicts = []
+        for item in candidates:
+            updated = item.updated
+            key = addressKey(updated.usesIP, updated.addr)
+            owners = [other.name for other in (devicesAt(updated.usesIP, updated.addr) if devicesAt is not None else [])
+                      if other is not item.device and id(other) not in moving]
+            if key in claimed:
+                owners.append(claimed[key])
+            if owners:
+                conflicts.append(BulkResult(item, SKIPPED, "{}: {} already uses this address".format(
+                    describeAddress(updated), owners[0])))
+            else:
+                claimed[key] = item.device.name
+                items.append(item)
+        if not conflicts:
+            return items, skipped
+        skipped.extend(conflicts)
+        candidates = items
+
+
+# Rewrites IP addresses by pattern, e.g. "10.1.x.y" -> "10.2.x.y": a number must match that part of the address, a
+# name captures it, and the replacement is built from numbers and the captured names
+class IPRewrite:
+    def __init__(self, fromPattern, toPattern):
+        self.fromParts = IPRewrite.parsePattern(fromPattern)
+        self.toParts = IPRewrite.parsePattern(toPattern)
+        unknown = [part for part in self.toParts if not part.isdigit() and part not in self.fromParts]
+        if unknown:
+            raise ValueError("'{}' does not appear in the address to match".format(unknown[0]))
+
+    # The four parts of a pattern; raises ValueError if it is malformed
+    @staticmethod
+    def parsePattern(pattern):
+        parts = pattern.strip().split('.')
+        if len(parts) != 4 or not all(re.match(r'^(\d{1,3}|[A-Za-z]\w*)$', part) for part in parts):
+            raise ValueError("'{}' is not a pattern like 10.1.x.y".format(pattern.strip()))
+        return parts
+
+    # New address of device, or None if the rewrite doesn't apply to it
+    def apply(self, device):
+        if not device.usesIP:
+            return None
+        segments = device.addr.split('.')
+        if len(segments) != 4:
+            return None
+        captured = {}
+        for part, segment in zip(self.fromParts, segments):
+            if part.isdigit():
+                if not segment.isdigit() or int(part) != int(segment):
+                    return None
+            elif captured.setdefault(part, segment) != segment:
+                # The same name twice has to match the same number
+                return None
+        return '.'.join(str(int(part)) if part.isdigit() else captured[part] for part in self.toParts)
+
+
+# Rewrites node names (without the BRN_ prefix) by pattern: one * in the pattern to match stands for any text, which
+# the * in the replacement is replaced with; {name} in the replacement is the device's name
+# "*" -> "{name}" names every node after its device, "OFFICE*" -> "LAB*" renames a prefix
+class NodeRewrite:
+    def __init__(self, fromPattern, toPattern):
+        self.fromPattern = fromPattern.strip()
+        self.toPattern = toPattern.strip()
+        if self.fromPattern.count('*') > 1 or self.toPattern.count('*') > 1:
+            raise ValueError("Only one * is allowed in a pattern.")
+        if '*' in self.toPattern and '*' not in self.fromPattern:
+            raise ValueError("The replacement has a * but the pattern to match doesn't.")
+        self.regex = re.compile('^' + '(.*)'.join(re.escape(part) for part in self.fromPattern.split('*')) + '$')
+
+    def apply(self, device):
+        if device.usesIP:
+            return None
+        match = self.regex.match(device.addr)
+        if match is None:
+            return None
+        node = self.toPattern.replace('{name}', device.name)
+        return node.replace('*', match.group(1)) if match.groups() else node
+
+
+# Runs on the command thread: apply each item on its own (a failure only affects that device) and report progress as
+# onProgress(done, total) after each one; items left when cancelled (a threading.Event) is set are not started
+# Every item is conditional on token, the generation the list was loaded from (see BrotherDevice.applyChanges()), so
+# after the first write each device is checked against its own row rather than the whole file
+# The history gets one snapshot for the whole job rather than one per device, worked out from base (the settings of the
+# devices as of token, see BrotherDevice.recordHistory())
+def runBulk(items, token, onProgress = None, cancelled = None, base = None):
+    results = []
+    ranRemovals, ranAdditions = [], []
+    for i, item in enumerate(items):
+        if cancelled is not None and cancelled.is_set():
+            results.extend(BulkResult(rest, CANCELLED, "") for rest in items[i:])
+            break
+        try:
+            removals, additions = BrotherDevice.applyChanges([item.original],
+                                                             [item.updated] if item.updated is not None else [], token,
+                                                             reason = None)[:2]
+        except ConflictError as e:
+            theirs = e.conflicts[0].theirs if e.conflicts else None
+            results.append(BulkResult(item, FAILED, "changed elsewhere, now {}".format(describeSettings(theirs))))
+        except BrotherError as e:
+            results.append(BulkResult(item, FAILED, str(e).replace("\n", " ")))
+        else:
+            ranRemovals.extend(removals)
+            ranAdditions.extend(additions)
+            results.append(BulkResult(item, DONE if removals or additions else UNCHANGED,
+                                      "" if removals or additions else "already done elsewhere"))
+        if onProgress is not None:
+            onProgress(i + 1, len(items))
+    if ranRemovals or ranAdditions:
+        BrotherDevice.recordHistory(ranRemovals, ranAdditions, "bulk changes", base)
+    return results
+
+
+# What an item does, e.g. "office: 10.1.0.5 -> 10.2.0.5"
+def describeItem(item):
+    if item.updated is None:
+        return "delete {}".format(item.original.name)
+    return "{}: {} -> {}".format(item.original.name, describeAddress(item.original), describeAddress(item.updated))
+
+
+# Line of the summary for a result
+def describeResult(result):
+    action = result.item.original.name if result.status == SKIPPED else describeItem(result.item)
+    return "{} ({}{})".format(action, result.status, ", " + result.detail if result.detail else "")
+
+
+# Counts of each outcome, e.g. "58 done, 2 failed"
+def summarize(results):
+    statuses = [result.status for result in results]
+    return ", ".join("{} {}".format(statuses.count(status), status)
+                     for status in (DONE, UNCHANGED, SKIPPED, FAILED, CANCELLED) if status in statuses)
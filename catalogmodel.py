@@ -0,0 +1,22 @@
+from PyQt4 import QtCore
+
+
+# Read-only list of model names for the model combo box and its completer
+# Unlike QComboBox.addItems(), nothing is copied into Qt up front; the view asks for the rows it actually shows
+class ModelCatalogModel(QtCore.QAbstractListModel):
+    def __init__(self, parent = None):
+        super(ModelCatalogModel, self).__init__(parent)
+        self.names = []
+
+    def setNames(self, names):
+        self.beginResetModel()
+        self.names = names
+        self.endResetModel()
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def data(self, index, role = QtCore.Qt.DisplayRole):
+        if index.isValid() and index.row() < len(self.names) and role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return self.names[index.row()]
+        return QtCore.QVariant()
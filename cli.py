@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+
+# Command line counterpart of gui.py for scripted provisioning; deliberately does not import PyQt
+import sys, argparse
+
+import inventory
+from brotherdevice import BACKENDS, BrotherDevice, BrotherError, parseQueryOutput, selectBackend
+from pendingchanges import describeAddress
+from instrumentation import OPERATIONS
+
+
+# Supported models (None unless parseModels) and devices currently configured in brsaneconfig3
+def queryDevices(parseModels = False):
+    warnings = []
+    models, devices = parseQueryOutput(BrotherDevice.queryDevices(), parseModels, warnings)
+    for warning in warnings:
+        sys.stderr.write("Warning: brsaneconfig3 output, line {}: {}\n".format(warning.lineNumber, warning.message))
+    return models, devices
+
+
+def export(args):
+    devices = queryDevices()[1]
+    fmt = args.format or (inventory.guessFormat(args.output) if args.output != '-' else 'json')
+    if args.output == '-':
+        inventory.writeInventory(devices, sys.stdout, fmt)
+    else:
+        with (inventory.openForCSV(args.output, 'w') if fmt == 'csv' else open(args.output, 'w')) as f:
+            inventory.writeInventory(devices, f, fmt)
+    return 0
+
+
+# Bring brsaneconfig3 in line with an inventory file, running only the operations that are needed
+# Devices that are not in the file are kept unless reconciling; the whole file is checked, models included, before
+# anything is changed
+def importInventory(args):
+    # Taken before the query, so that changes made by someone else in the meantime are not overwritten
+    token = BrotherDevice.configToken()
+    models, configured = queryDevices(parseModels = True)
+
+    fmt = args.format or inventory.guessFormat(args.file)
+    if args.file == '-':
+        wanted = inventory.readInventory(sys.stdin, fmt, models)
+    else:
+        with (inventory.openForCSV(args.file, 'r') if fmt == 'csv' else open(args.file)) as f:
+            wanted = inventory.readInventory(f, fmt, models)
+    added, removed, modified = inventory.diffDevices(configured, wanted, removeMissing = args.reconcile)
+    for device in added:
+        print('+ {} ({}, {})'.format(device.name, device.model, describeAddress(device)))
+    for device in removed:
+        print('- {}'.format(device.name))
+    for current, device in modified:
+        print('~ {} ({}, {}) -> ({}, {})'.format(device.name, current.model, describeAddress(current),
+                                                 device.model, describeAddress(device)))
+    if not (added or removed or modified):
+        print('Nothing to do.')
+        return 0
+    if args.dry_run:
+        return 0
+
+    removals, additions = inventory.diffOperations(added, removed, modified)
+    BrotherDevice.applyChanges(removals, additions, token,
+                               reason = "reconciled with {}".format(args.file) if args.reconcile
+                               else "imported {}".format(args.file),
+                               base = [device.settings() for device in configured])
+    return 0
+
+
+# Failing to write the metrics is reported but doesn't change the exit code
+def writeMetrics(path):
+    try:
+        OPERATIONS.export(path)
+    except (IOError, OSError) as e:
+        sys.stderr.write("Error: could not write metrics: {}\n".format(e))
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description = "Export, import and reconcile brsaneconfig3 network devices.")
+    parser.add_argument('--backend', choices = sorted(BACKENDS),
+                        help = "how to talk to brsaneconfig3 (default: $BRSANECONFIG_BACKEND or subprocess)")
+    parser.add_argument('--metrics', metavar = 'FILE',
+                        help = "write the brsaneconfig3 calls that were made to FILE on exit, as JSON lines or in the "
+                               "Prometheus text format if FILE ends in .prom")
+    commands = parser.add_subparsers(dest = 'command')
+    commands.required = True
+
+    exportParser = commands.add_parser('export', help = "write the configured devices to a file")
+    exportParser.add_argument('-o', '--output', default = '-', help = "output file (default: standard output)")
+    exportParser.add_argument('-f', '--format', choices = inventory.FORMATS,
+                              help = "file format (default: guessed from the file name, otherwise json)")
+    exportParser.set_defaults(run = export, reconcile = False)
+
+    for name, reconcile, description in (('import', False, "add or update the devices listed in a file"),
+                                         ('reconcile', True, "make the configured devices match a file exactly")):
+        importParser = commands.add_parser(name, help = description)
+        importParser.add_argument('file', help = "inventory file, or - for standard input")
+        importParser.add_argument('-f', '--format', choices = inventory.FORMATS,
+                                  help = "file format (default: guessed from the file name, otherwise json)")
+        importParser.add_argument('-n', '--dry-run', action = 'store_true', help = "only print what would change")
+        importParser.set_defaults(run = importInventory, reconcile = reconcile)
+
+    return parser.parse_args(argv)
+
+
+def main(argv = None):
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+    try:
+        selectBackend(args.backend)
+        # Finish (or undo) changes that were interrupted by a crash before looking at the devices
+        for message in BrotherDevice.recoverInterrupted():
+            sys.stderr.write(message + "\n")
+        return args.run(args)
+    except BrotherError as e:
+        sys.stderr.write("Error: {}\n".format(e))
+        return 1
+    except (IOError, OSError) as e:
+        sys.stderr.write("Error: {}\n".format(e))
+        return 1
+    finally:
+        if args.metrics:
+            writeMetrics(args.metrics)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import traceback
+from PyQt4 import QtCore
+
+from brotherdevice import BrotherError
+from instrumentation import OPERATIONS
+
+
+# A single brsaneconfig3 call (or sequence of calls) queued on the CommandExecutor
+class CommandJob:
+    def __init__(self, widgets, func, args, onSuccess, onFailure, caller):
+        self.widgets = widgets
+        self.func = func
+        self.args = args
+        self.onSuccess = onSuccess
+        self.onFailure = onFailure
+        # Where the job was submitted from, reported as the caller of the brsaneconfig3 calls it makes
+        self.caller = caller
+
+
+# Lives on the executor's thread and runs jobs one at a time, in the order they were submitted
+class CommandWorker(QtCore.QObject):
+    # Emitted with (job, result, error message), exactly one of result/error is meaningful
+    finished = QtCore.pyqtSignal(object, object, object)
+
+    @QtCore.pyqtSlot(object)
+    def execute(self, job):
+        try:
+            with OPERATIONS.callerContext(job.caller):
+                result = job.func(*job.args)
+        except BrotherError as e:
+            self.finished.emit(job, None, str(e))
+        except Exception as e:
+            # Anything else is a bug, but the job must still finish or the executor stays busy forever
+            traceback.print_exc()
+            self.finished.emit(job, None, "Unexpected error: {}".format(e))
+        else:
+            self.finished.emit(job, result, None)
+
+
+# Runs brsaneconfig3 commands on a background thread so the GUI keeps repainting while they execute
+# Commands are serialized because brsaneconfig3 edits a single config file
+class CommandExecutor(QtCore.QObject):
+    # Emitted with (widget, isBusy) when a widget gains its first or loses its last pending job
+    widgetBusy = QtCore.pyqtSignal(object, bool)
+    # Emitted with True when the first job is queued and False when the queue drains
+    busyChanged = QtCore.pyqtSignal(bool)
+    # Emitted with the error message of a failed job that has no onFailure of its own, so that it is still reported
+    commandFailed = QtCore.pyqtSignal(object)
+    submitted = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent = None):
+        super(CommandExecutor, self).__init__(parent)
+        self.pending = 0
+        # Number of pending jobs for each widget that has been disabled
+        self.busyWidgets = {}
+        self.thread = QtCore.QThread(self)
+        self.worker = CommandWorker()
+        self.worker.moveToThread(self.thread)
+        # Cross-thread connections are queued, so execute() runs on self.thread and onJobFinished() on ours
+        self.submitted.connect(self.worker.execute)
+        self.worker.finished.connect(self.onJobFinished)
+        self.thread.start()
+
+    # Queue func(*args) to run in the background; widgets are reported busy until it finishes
+    def submit(self, widgets, func, args = (), onSuccess = None, onFailure = None):
+        job = CommandJob(widgets, func, args, onSuccess, onFailure, OPERATIONS.callerOf())
+        for widget in widgets:
+            self.busyWidgets[widget] = self.busyWidgets.get(widget, 0) + 1
+            if self.busyWidgets[widget] == 1:
+                self.widgetBusy.emit(widget, True)
+        self.pending += 1
+        if self.pending == 1:
+            self.busyChanged.emit(True)
+        self.submitted.emit(job)
+        return job
+
+    def isBusy(self, widget = None):
+        if widget is None:
+            return self.pending > 0
+        return self.busyWidgets.get(widget, 0) > 0
+
+    def onJobFinished(self, job, result, error):
+        for widget in job.widgets:
+            self.busyWidgets[widget] -= 1
+            if self.busyWidgets[widget] == 0:
+                del self.busyWidgets[widget]
+                self.widgetBusy.emit(widget, False)
+        self.pending -= 1
+        if error is None:
+            if job.onSuccess is not None:
+                job.onSuccess(result)
+        else:
+            if job.onFailure is not None:
+                job.onFailure(error)
+            else:
+                self.commandFailed.emit(error)
+        if self.pending == 0:
+            self.busyChanged.emit(False)
+
+    # Let any running command finish, then stop the background thread
+    def shutdown(self):
+        self.thread.quit()
+        self.thread.wait()
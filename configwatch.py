@@ -0,0 +1,69 @@
+import os
+from collections import namedtuple
+
+from brotherdevice import DeviceRecord, parseDeviceEntry, tokenOf
+
+
+# What changed in the device file since it was last read: names of the devices that are gone, DeviceRecords for the
+# devices that were added or edited, and the names of all devices in file order
+DeviceDelta = namedtuple('DeviceDelta', ['removed', 'changed', 'names'])
+
+
+# Identifies a version of a file without reading it; None if it does not exist
+def fileSignature(path):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return (info.st_ino, info.st_mtime, info.st_size)
+
+
+# Follows brsanenetdevice3.cfg as other programs change it (brsaneconfig3 run by hand, an admin's script, another
+# instance of the GUI) and reports only what changed
+# Parsed lines are remembered by their text, so after an edit only the lines that are new get parsed again
+class DeviceFileTracker:
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        # Generation token of the last version read (see brotherdevice.configToken())
+        self.token = None
+        # line -> (name, model, usesIP, addr) for the device lines of the last version read
+        self.entries = {}
+
+    # Read the current version as the baseline (e.g. right after a full query), without reporting anything
+    def reset(self):
+        self.update()
+
+    # DeviceDelta since the last call, or None if the file is unchanged (or unreadable, which is treated the same, so
+    # that a file being replaced is not mistaken for all devices disappearing)
+    def update(self):
+        signature = fileSignature(self.path)
+        if signature is None or signature == self.signature:
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                info = os.fstat(f.fileno())
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        # From the file that was actually read, in case it was replaced since the stat above
+        self.signature = (info.st_ino, info.st_mtime, info.st_size)
+        self.token = tokenOf(info, data)
+        lines = (data if isinstance(data, str) else data.decode('utf-8', 'replace')).splitlines()
+
+        entries = {}
+        names = []
+        changed = []
+        for line in lines:
+            entry = self.entries.get(line)
+            if entry is None:
+                entry = parseDeviceEntry(line)
+                if entry is None:
+                    continue
+                changed.append(DeviceRecord(str(len(names)), *entry))
+            entries[line] = entry
+            names.append(entry[0])
+        remaining = set(names)
+        removed = [entry[0] for line, entry in self.entries.items() if entry[0] not in remaining]
+        self.entries = entries
+        return DeviceDelta(sorted(set(removed)), changed, names)
@@ -0,0 +1,1214 @@
+import os, sys, time, threading
+from PyQt4 import QtGui, QtCore
+
+import modelcache, devicecache, bulkedit
+from startupprofile import PROFILE
+from commandexecutor import CommandExecutor
+from pendingchanges import PendingChanges
+from devicemodel import DeviceListModel
+from catalogmodel import ModelCatalogModel
+from modelsearch import ModelSearchIndex
+from operationspanel import OperationsPanel
+from reachability import Prober
+from discoverydialog import DiscoveryDialog
+from readdressdialog import ReaddressDialog
+from historydialog import HistoryDialog
+from history import HISTORY, restoreOperations
+from editstate import EditState, GROUPS, GROUP_ORDER, IP_FIELDS, groupErrors
+from addresses import addressKey, normalizeIP
+from configwatch import DeviceFileTracker, fileSignature
+from brotherdevice import BrotherDevice, ConflictError, DeviceRecord, NativeBackend, mergeBatch, parseQueryOutput
+
+
+WINDOW_TITLE = 'brsaneconfig3'
+WIDTH_FUDGE = 30
+BUSY_MESSAGE = "Running brsaneconfig3..."
+# How often the configured devices are checked for reachability, in milliseconds
+PROBE_INTERVAL = 60000
+# Fields are validated once typing has paused for this long, in milliseconds
+VALIDATION_DELAY = 300
+# Changes to the config files are merged once they have stopped for this long, in milliseconds
+CONFIG_WATCH_DELAY = 500
+
+
+class ConfigWindow(QtGui.QMainWindow):
+    # Emitted from the prober's threads as (prober, reachability.ProbeResult)
+    deviceProbed = QtCore.pyqtSignal(object, object)
+    # Emitted from the command thread as (done, total) while a bulk job runs
+    bulkProgress = QtCore.pyqtSignal(int, int)
+
+    def __init__(self):
+        # The super() method returns the parent object of the given class
+        super(ConfigWindow, self).__init__()
+
+        # Data structures and variables
+        self.supportedModels = []
+        # Lookups over self.supportedModels, see setSupportedModels()
+        self.modelIndex = ModelSearchIndex([])
+        # Devices shown in the device list, with name/address indexes
+        self.deviceModel = DeviceListModel(self)
+        self.currentDevice = []
+        self.hasEditedCurrentDevice = False
+        # Which fields differ from the current device, updated one field at a time as they are edited
+        self.editState = EditState()
+        # Validation groups (see editstate) edited since they were last validated, and the errors being shown
+        self.unvalidatedGroups = set()
+        self.fieldErrors = {}
+        self.ipEdits = []
+
+        # Interface elements
+        self.deviceList = QtGui.QListView()
+        self.friendlyNameEdit = QtGui.QLineEdit()
+        self.modelNameSelect = QtGui.QComboBox()
+        # The whole catalogue for the drop-down, and the current search results for the completer
+        self.modelCatalog = ModelCatalogModel(self)
+        self.modelMatches = ModelCatalogModel(self)
+        self.modelCompleter = QtGui.QCompleter(self.modelMatches, self)
+        self.saveBtn = QtGui.QPushButton("Save")
+        self.deleteButton = QtGui.QPushButton("Delete")
+        self.ipRadio = QtGui.QRadioButton("IP:")
+        self.nodeRadio = QtGui.QRadioButton("Node:")
+        self.ipWidget = QtGui.QWidget()
+        self.nodeEdit = QtGui.QLineEdit()
+        self.nodeNameWidget = QtGui.QWidget()
+        self.previousDevice = None
+        self.infoPanel = QtGui.QWidget()
+        self.validationLabel = QtGui.QLabel()
+        self.validationTimer = QtCore.QTimer(self)
+        self.deviceListWidget = QtGui.QWidget()
+        self.progressBar = QtGui.QProgressBar()
+        self.addDeviceBtn = QtGui.QPushButton("Add New Device")
+        self.discoverBtn = QtGui.QPushButton("Discover...")
+        self.bulkDeleteBtn = QtGui.QPushButton("Delete Selected")
+        self.readdressBtn = QtGui.QPushButton("Change Addresses...")
+        # Progress of the running bulk job and the event that cancels it, see runBulkJob()
+        self.bulkProgressDialog = None
+        self.bulkCancelled = None
+        self.pendingPanel = QtGui.QWidget()
+        self.pendingList = QtGui.QListWidget()
+        self.applyBtn = QtGui.QPushButton("Apply All")
+        self.discardBtn = QtGui.QPushButton("Discard")
+        self.historyBtn = QtGui.QPushButton("History...")
+        # Debug window with the recent brsaneconfig3 calls, created when first opened
+        self.operationsPanel = None
+
+        # Saves and deletes are queued here until "Apply All" is pressed
+        self.pendingChanges = PendingChanges()
+        # Generation of the config the device list matches (see BrotherDevice.configToken()); applying is conditional on
+        # it, so that changes made elsewhere in the meantime are merged or reported instead of overwritten
+        self.configToken = None
+
+        # brsaneconfig3 runs in the background, errors come back through signals
+        self.executor = CommandExecutor(self)
+        self.executor.widgetBusy.connect(self.onWidgetBusy)
+        self.executor.busyChanged.connect(self.onBusyChanged)
+        self.executor.commandFailed.connect(self.onCommandFailed)
+
+        # Reachability of the configured devices is checked in the background and shown as badges in the list
+        self.prober = None
+        self.deviceProbed.connect(self.onDeviceProbed)
+        self.probeTimer = QtCore.QTimer(self)
+        self.probeTimer.setInterval(PROBE_INTERVAL)
+        self.probeTimer.timeout.connect(self.probeDevices)
+        self.bulkProgress.connect(self.onBulkProgress)
+
+        # Changes other programs make to brsaneconfig3's files are merged into the list as they happen, see
+        # checkConfigFiles()
+        self.deviceFileTracker = DeviceFileTracker(BrotherDevice.backend.deviceFile)
+        self.modelFileSignature = fileSignature(BrotherDevice.backend.modelFile)
+        self.configChangePending = False
+        self.configWatcher = QtCore.QFileSystemWatcher(self)
+        self.configWatcher.fileChanged.connect(self.onConfigPathChanged)
+        self.configWatcher.directoryChanged.connect(self.onConfigPathChanged)
+        self.configTimer = QtCore.QTimer(self)
+        self.configTimer.setSingleShot(True)
+        self.configTimer.setInterval(CONFIG_WATCH_DELAY)
+        self.configTimer.timeout.connect(self.checkConfigFiles)
+        self.watchConfigFiles()
+
+        with PROFILE.phase('widgets'):
+            self.initUI()
+        self.gatherInfo()
+
+    # Query brsaneconfig3 in the background; the window is shown (but disabled) until the results arrive
+    # The supported models are taken from the on-disk cache when it matches the installed brsaneconfig3, and the
+    # devices from the last run are shown right away (read-only) until the query confirms or corrects them
+    def gatherInfo(self):
+        with PROFILE.phase('cache'):
+            cachedModels = modelcache.loadModels()
+            if cachedModels is not None:
+                self.setSupportedModels(cachedModels)
+            snapshot = devicecache.loadSnapshot()
+            if snapshot:
+                try:
+                    self.mergeDevices([BrotherDevice.fromDict(values) for values in snapshot])
+                except (KeyError, TypeError):
+                    # Unreadable snapshot, just wait for the query
+                    pass
+        # Changes interrupted by a crash are finished (or undone) before anything else runs
+        self.executor.submit([self.infoPanel, self.pendingPanel], BrotherDevice.recoverInterrupted,
+                             onSuccess = self.onRecovered)
+        # The device list can be browsed while the stale snapshot is being revalidated, but nothing can be edited
+        self.refreshDevices([self.addDeviceBtn] if len(self.deviceModel) > 0 else [self.deviceListWidget])
+
+    def onRecovered(self, messages):
+        if messages:
+            QtGui.QMessageBox.information(None, "Interrupted changes", "\n\n".join(messages))
+
+    # Query brsaneconfig3 again and merge the results into the device list
+    def refreshDevices(self, busyWidgets = None):
+        busyWidgets = busyWidgets if busyWidgets is not None else [self.deviceListWidget]
+        # The file watcher's baseline is taken first, anything that changes after it is reported as a change even if
+        # the query already saw it (merging it again does nothing)
+        self.executor.submit([], self.deviceFileTracker.reset)
+        self.executor.submit(busyWidgets + [self.infoPanel, self.pendingPanel],
+                             PROFILE.timed('query', ConfigWindow.loadDevices), (not self.supportedModels,),
+                             onSuccess = self.onQueryFinished, onFailure = self.onQueryFailed)
+
+    # Remember the saved devices so that they can be drawn immediately on the next launch
+    def saveSnapshot(self):
+        devicecache.saveSnapshot([device.toDict() for device in self.deviceModel if not device.isNew])
+
+    # Apply a freshly queried device list to self.deviceModel, touching only the rows that differ
+    # Devices are matched by name (brsaneconfig3 does not allow duplicates); existing objects are updated in place so
+    # that the current selection survives
+    def mergeDevices(self, devices):
+        freshNames = set(device.name for device in devices)
+        # Removed devices
+        for device in [device for device in self.deviceModel if device.name not in freshNames and not device.isNew]:
+            self.deviceModel.removeDevice(device)
+        for row, fresh in enumerate(devices):
+            device = self.deviceModel.deviceNamed(fresh.name)
+            if device is not None:
+                # Changed devices
+                if not device.hasSameSettings(fresh):
+                    device.assign(fresh)
+                    self.deviceModel.deviceChanged(device)
+                # Reordered devices
+                self.deviceModel.moveDevice(device, row)
+            else:
+                # Added devices
+                self.deviceModel.insertDevice(row, fresh)
+
+        if self.currentRow() < 0 and len(self.deviceModel) > 0:
+            self.selectDevice(self.deviceModel.device(0))
+        self.fitDeviceList()
+
+        # Get info about currently-selected device (if there is one) and populate fields
+        self.currentDevice = self.deviceModel.device(self.currentRow())
+        self.updateFields()
+
+    # Do not allow resizing the devices list, just because
+    # (measured from the names rather than sizeHintForColumn(), which asks the view for every row)
+    def fitDeviceList(self):
+        metrics = self.deviceList.fontMetrics()
+        longest = max([metrics.width(device.name) for device in self.deviceModel] or [0])
+        self.deviceList.setMaximumWidth(max(longest + WIDTH_FUDGE, self.deviceList.minimumWidth()))
+
+    # Watch the device and model files, and their directory so that files created or replaced by a rename (which
+    # QFileSystemWatcher stops following) are noticed; paths that don't exist are skipped and picked up later
+    def watchConfigFiles(self):
+        backend = BrotherDevice.backend
+        watched = set(str(path) for path in list(self.configWatcher.files()) + list(self.configWatcher.directories()))
+        missing = [path for path in (os.path.dirname(backend.deviceFile), backend.deviceFile, backend.modelFile)
+                   if path not in watched and os.path.exists(path)]
+        if missing:
+            self.configWatcher.addPaths(missing)
+
+    # brsaneconfig3, editors and the native backend write in several steps, so wait for the changes to settle
+    def onConfigPathChanged(self, path):
+        self.watchConfigFiles()
+        self.configTimer.start()
+
+    # Merge whatever changed in the config files since the last check
+    # While a command is running the check waits for it to finish: the GUI's own changes go through intermediate
+    # states (e.g. between the remove and the add of a rename) that are not worth showing
+    def checkConfigFiles(self):
+        if self.executor.isBusy():
+            self.configChangePending = True
+            return
+        self.configChangePending = False
+        signature = fileSignature(BrotherDevice.backend.modelFile)
+        if signature != self.modelFileSignature:
+            self.modelFileSignature = signature
+            self.executor.submit([], ConfigWindow.loadModels, onSuccess = self.onModelsReloaded)
+        delta = self.deviceFileTracker.update()
+        if delta is not None:
+            self.mergeDelta(delta)
+
+    # Apply a configwatch.DeviceDelta to self.deviceModel, without querying brsaneconfig3 again
+    # Devices with queued changes or unsaved edits are left alone so that nothing the user typed is lost (applying the
+    # queued changes overwrites the outside change, discarding them shows it); the selection only moves if the
+    # selected device was removed
+    def mergeDelta(self, delta):
+        protected = self.pendingChanges.names()
+        if self.hasEditedCurrentDevice and self.currentDevice is not None:
+            protected.add(self.currentDevice.name)
+        current = self.currentDevice
+        currentSettings = current.settings() if current is not None else None
+        updated = 0
+        kept = set()
+        for name in delta.removed:
+            device = self.deviceModel.deviceNamed(name)
+            if device is None:
+                continue
+            if name in protected:
+                kept.add(name)
+                continue
+            self.deviceModel.removeDevice(device)
+            updated += 1
+        for record in delta.changed:
+            fresh = BrotherDevice(record)
+            device = self.deviceModel.deviceNamed(fresh.name)
+            # Also what the GUI's own applied changes look like when they come back
+            if device is not None and device.settings() == fresh.settings():
+                continue
+            if fresh.name in protected:
+                kept.add(fresh.name)
+                continue
+            if device is not None:
+                device.assign(fresh)
+                self.deviceModel.deviceChanged(device)
+            else:
+                self.deviceModel.insertDevice(min(int(record.num), len(self.deviceModel)), fresh)
+            updated += 1
+        # The kept devices still differ from the file, so the next apply has to check them against it
+        if not kept:
+            self.configToken = self.deviceFileTracker.token
+        if updated == 0 and not kept:
+            return
+
+        if updated > 0:
+            if current is not None and current not in self.deviceModel:
+                if self.currentRow() < 0 and len(self.deviceModel) > 0:
+                    self.selectDevice(self.deviceModel.device(0))
+                self.currentDevice = self.deviceModel.device(self.currentRow())
+            # Fields are only refilled if they show something that changed, and they were not edited (see protected)
+            if self.currentDevice is not current or (current is not None and current.settings() != currentSettings):
+                self.updateFields()
+            self.fitDeviceList()
+            self.saveSnapshot()
+            self.recordHistory("changed outside this window")
+            self.probeDevices()
+        message = "Merged {} device change(s) made outside this window".format(updated)
+        if kept:
+            message += "; kept your edits to {}".format(', '.join(sorted(kept)))
+        self.statusBar().showMessage(message)
+
+    def currentRow(self):
+        return self.deviceList.currentIndex().row()
+
+    # Select a device in the list (the signals this triggers do not change self.currentDevice)
+    def selectDevice(self, device):
+        self.deviceList.setCurrentIndex(self.deviceModel.index(self.deviceModel.rowOf(device)))
+
+    # Failures of background jobs that don't report their own (recovery, reloading the models, ...)
+    def onCommandFailed(self, error):
+        QtGui.QMessageBox.warning(None, "Error", error)
+
+    # Nothing can be done without the list of devices, so report the error and close the window
+    def onQueryFailed(self, error):
+        QtGui.QMessageBox.critical(None, "Error", error)
+        self.close()
+
+    # Show models in the combo box; the search index is only built once the user starts typing
+    def setSupportedModels(self, models):
+        self.supportedModels = models
+        self.modelIndex = ModelSearchIndex(models)
+        self.modelCatalog.setNames(models)
+
+    # Runs on the command thread: the query output is parsed as it streams in, so it is never held in memory as a whole
+    # The token is taken first, a change that sneaks in during the query then only causes an unnecessary merge
+    @staticmethod
+    def loadDevices(parseModels):
+        token = BrotherDevice.configToken()
+        warnings = []
+        models, devices = parseQueryOutput(BrotherDevice.queryDevices(), parseModels, warnings)
+        return models, devices, warnings, token
+
+    # Runs on the command thread after Brsane3.ini changed (e.g. the driver was upgraded); it is read directly, since
+    # that is where brsaneconfig3 gets the list from as well
+    @staticmethod
+    def loadModels():
+        modelFile = BrotherDevice.backend.modelFile
+        return sorted(model for productID, model in NativeBackend(os.path.dirname(modelFile)).readModels())
+
+    def onModelsReloaded(self, models):
+        self.setSupportedModels(models)
+        modelcache.saveModels(self.supportedModels)
+        # The combo box was refilled, show the current device's model again
+        if self.currentDevice is not None and not self.hasEditedCurrentDevice:
+            self.updateFields()
+
+    def onQueryFinished(self, result):
+        # self.supportedModels was only parsed if it could not be loaded from the cache
+        models, devices, warnings, self.configToken = result
+        with PROFILE.phase('populate'):
+            if models is not None:
+                self.setSupportedModels(models)
+                modelcache.saveModels(self.supportedModels)
+
+            # Bring self.deviceModel (possibly drawn from the startup snapshot) up to date
+            self.mergeDevices(devices)
+            self.saveSnapshot()
+        self.recordHistory("loaded")
+        # Malformed lines were skipped; mention them rather than refusing to show anything
+        if warnings:
+            for warning in warnings:
+                sys.stderr.write("brsaneconfig3 output, line {}: {}\n".format(warning.lineNumber, warning.message))
+            self.statusBar().showMessage("Ignored {} unrecognized line(s) in the brsaneconfig3 output".format(len(warnings)))
+        # The first query completes startup (later refreshes are ignored)
+        PROFILE.finish()
+        self.probeDevices()
+        self.probeTimer.start()
+
+    # Check every saved device on background threads; results arrive through deviceProbed as each probe finishes
+    # A probe that is still running is cancelled, its remaining results would be out of date anyway
+    def probeDevices(self):
+        if self.prober is not None:
+            self.prober.cancel()
+        prober = self.prober = Prober()
+        devices = [device.copy() for device in self.deviceModel if not device.isNew]
+        thread = threading.Thread(target = prober.probeAll,
+                                  args = (devices, lambda result: self.deviceProbed.emit(prober, result)))
+        thread.daemon = True
+        thread.start()
+
+    # A result can still be on its way when its prober is cancelled, so only the current prober's results are shown
+    def onDeviceProbed(self, prober, result):
+        if prober is self.prober and not prober.cancelled.is_set():
+            self.deviceModel.setProbeResult(result)
+
+    def initUI(self):
+        # TODO: Possibly separate each block of code into its own function
+        # Device list on left with "Add Device" button below it
+        deviceListPanel = QtGui.QVBoxLayout()
+        deviceListPanel.addWidget(self.deviceList)
+        deviceListPanel.addWidget(self.addDeviceBtn)
+        deviceListPanel.addWidget(self.discoverBtn)
+        deviceListPanel.addWidget(self.bulkDeleteBtn)
+        deviceListPanel.addWidget(self.readdressBtn)
+        self.deviceList.setModel(self.deviceModel)
+        # Ctrl/Shift-click selects several devices for the bulk buttons; the fields still show the current device
+        self.deviceList.setSelectionMode(QtGui.QAbstractItemView.ExtendedSelection)
+        # Every row is one line of text, which lets the view skip measuring each of them
+        self.deviceList.setUniformItemSizes(True)
+        # Connect to currentChanged to remember the previous seleted item
+        self.deviceList.selectionModel().currentChanged.connect(self.rememberPreviousItem)
+        self.deviceList.selectionModel().selectionChanged.connect(self.updateBulkButtons)
+        # Do error-checking/save logic when an item is pressed (clicked would work too)
+        self.deviceList.pressed.connect(self.onDevicePressed)
+        self.addDeviceBtn.clicked.connect(self.addNewDevice)
+        self.discoverBtn.clicked.connect(self.discoverDevices)
+        self.bulkDeleteBtn.clicked.connect(self.deleteSelectedDevices)
+        self.readdressBtn.clicked.connect(self.readdressSelectedDevices)
+        self.updateBulkButtons()
+
+        self.deviceListWidget.setLayout(deviceListPanel)
+        self.deviceListWidget.setContentsMargins(0, 0, 0, 0)
+        self.deviceListWidget.layout().setContentsMargins(0, 0, 0, 0)
+
+        # Main layout for the whole window
+        mainHBox = QtGui.QHBoxLayout()
+        mainHBox.addWidget(self.deviceListWidget)
+        mainWidget = QtGui.QWidget()
+        mainWidget.setLayout(mainHBox)
+        self.setCentralWidget(mainWidget)
+        # The maximum width is set once the device names are known (see onQueryFinished())
+        self.deviceList.setMinimumWidth(self.addDeviceBtn.minimumSizeHint().width())
+
+        # Busy indicator shown in the status bar while brsaneconfig3 is running
+        self.progressBar.setRange(0, 0)
+        self.progressBar.setMaximumWidth(self.addDeviceBtn.minimumSizeHint().width())
+        self.progressBar.setVisible(False)
+        self.statusBar().addPermanentWidget(self.progressBar)
+
+        # Friendly name, user input
+        friendlyName = QtGui.QLabel('Name:')
+        # Verify text as it is typed so that we can display a message
+        self.friendlyNameEdit.textEdited.connect(self.onNameInputChange)
+
+        # Model name, combo box
+        modelName = QtGui.QLabel('Model:')
+        # http://stackoverflow.com/a/11254459/1693087
+        # Apply stylesheet to allow limiting max number of items to display
+        self.modelNameSelect.setStyleSheet("QComboBox { combobox-popup: 0; }")
+        self.modelNameSelect.setMaxVisibleItems(10)
+        self.modelNameSelect.setModel(self.modelCatalog)
+        # Typing filters the catalogue (prefix, substring and fuzzy matches, see modelsearch) instead of scrolling
+        self.modelNameSelect.setEditable(True)
+        self.modelNameSelect.setInsertPolicy(QtGui.QComboBox.NoInsert)
+        # The completer shows our own search results as they are, rather than filtering them again
+        self.modelCompleter.setCompletionMode(QtGui.QCompleter.UnfilteredPopupCompletion)
+        self.modelCompleter.setMaxVisibleItems(10)
+        self.modelNameSelect.setCompleter(self.modelCompleter)
+        self.modelNameSelect.lineEdit().textEdited.connect(self.onModelSearch)
+        self.modelCompleter.activated[str].connect(self.onModelCompleted)
+        self.modelNameSelect.currentIndexChanged.connect(self.onModelNameChange)
+        self.modelNameSelect.editTextChanged.connect(self.onModelNameChange)
+
+        # Address type, radio buttons
+        group = QtGui.QButtonGroup()
+        group.addButton(self.ipRadio)
+        group.addButton(self.nodeRadio)
+        group.setExclusive(True)
+        self.ipRadio.toggled.connect(self.onRadioToggle)
+        self.nodeRadio.toggled.connect(self.onRadioToggle)
+
+        # Errors are shown below the fields while typing instead of in message boxes
+        self.validationLabel.setStyleSheet("QLabel { color: red; }")
+        self.validationLabel.setWordWrap(True)
+        self.validationLabel.setAlignment(QtCore.Qt.AlignTop)
+        self.validationTimer.setSingleShot(True)
+        self.validationTimer.setInterval(VALIDATION_DELAY)
+        self.validationTimer.timeout.connect(self.validateEditedFields)
+
+        # IP address, split into four 3-digit sections (IPv4)
+        # If brsaneconfig3 ever supports IPv6, everything *should* still work by simply adding more boxes
+        ipSegmentValidator = QtGui.QIntValidator(0, 255, self)
+        self.ipEdits = [QtGui.QLineEdit(),
+                        QtGui.QLineEdit(),
+                        QtGui.QLineEdit(),
+                        QtGui.QLineEdit()]
+        ipLayout = QtGui.QHBoxLayout()
+        ipLayout.setSpacing(0)
+
+        # Only allow numbers up to 3 digits in each part of the IP (the range is checked by validation)
+        for i, textbox in enumerate(self.ipEdits):
+            textbox.setValidator(ipSegmentValidator)
+            textbox.setMaxLength(3)
+            textbox.setAlignment(QtCore.Qt.AlignCenter)
+            textbox.textEdited.connect(self.onIPChange)
+            if i > 0:
+                ipLayout.addWidget(QtGui.QLabel("."))
+            ipLayout.addWidget(self.ipEdits[i])
+
+        self.ipWidget.setLayout(ipLayout)
+        self.ipWidget.setContentsMargins(0, 0, 0, 0)
+        self.ipWidget.layout().setContentsMargins(0, 0, 0, 0)
+
+        # Node name, user does not need to worry about the "BRN_" prefix
+        nodePrefix = QtGui.QLabel("BRN_")
+        nodeNameLayout = QtGui.QHBoxLayout()
+        nodeNameLayout.setSpacing(0)
+        nodeNameLayout.addWidget(nodePrefix)
+        nodeNameLayout.addWidget(self.nodeEdit)
+        self.nodeNameWidget.setLayout(nodeNameLayout)
+        self.nodeNameWidget.setContentsMargins(0, 0, 0, 0)
+        self.nodeNameWidget.layout().setContentsMargins(0, 0, 0, 0)
+        self.nodeEdit.textEdited.connect(self.onNodeChange)
+
+        # "Save" and "delete" buttons
+        self.saveBtn.setEnabled(False)
+        # TODO: Allow return key to trigger save
+        self.saveBtn.clicked.connect(self.saveCurrentDevice)
+        self.deleteButton.clicked.connect(self.deleteCurrentDevice)
+
+        buttonsLayout = QtGui.QHBoxLayout()
+        buttonsLayout.addWidget(self.deleteButton)
+        buttonsLayout.addWidget(self.saveBtn)
+        buttonsWidget = QtGui.QWidget()
+        buttonsWidget.setLayout(buttonsLayout)
+        buttonsWidget.setContentsMargins(0, 0, 0, 0)
+        buttonsWidget.layout().setContentsMargins(0, 0, 0, 0)
+
+        # Info for the selected device is displayed to the right of the device list
+        grid = QtGui.QGridLayout()
+        grid.setSpacing(10)
+
+        grid.addWidget(friendlyName, 0, 0)
+        grid.addWidget(self.friendlyNameEdit, 0, 1)
+
+        grid.addWidget(modelName, 1, 0)
+        grid.addWidget(self.modelNameSelect, 1, 1)
+
+        grid.addWidget(self.ipRadio, 2, 0)
+        grid.addWidget(self.ipWidget, 2, 1)
+        grid.addWidget(self.nodeRadio, 3, 0)
+        grid.addWidget(self.nodeNameWidget, 3, 1)
+
+        grid.addWidget(self.validationLabel, 4, 0, 1, 2)
+        grid.setRowStretch(4, 1)
+        grid.addWidget(buttonsWidget, 5, 0, 1, 2)
+
+        self.infoPanel.setLayout(grid)
+        self.infoPanel.setContentsMargins(0, 0, 0, 0)
+        self.infoPanel.layout().setContentsMargins(0, 0, 0, 0)
+
+        # Queued changes below the device info, applied (or discarded) all at once
+        self.applyBtn.clicked.connect(self.applyPendingChanges)
+        self.discardBtn.clicked.connect(self.discardPendingChanges)
+        self.historyBtn.clicked.connect(self.showHistory)
+        pendingButtonsLayout = QtGui.QHBoxLayout()
+        pendingButtonsLayout.addWidget(self.historyBtn)
+        pendingButtonsLayout.addStretch(1)
+        pendingButtonsLayout.addWidget(self.discardBtn)
+        pendingButtonsLayout.addWidget(self.applyBtn)
+        pendingLayout = QtGui.QVBoxLayout()
+        pendingLayout.addWidget(QtGui.QLabel("Pending changes:"))
+        pendingLayout.addWidget(self.pendingList)
+        pendingLayout.addLayout(pendingButtonsLayout)
+        self.pendingPanel.setLayout(pendingLayout)
+        self.pendingPanel.setContentsMargins(0, 0, 0, 0)
+        self.pendingPanel.layout().setContentsMargins(0, 0, 0, 0)
+        self.refreshPendingChanges()
+
+        rightVBox = QtGui.QVBoxLayout()
+        rightVBox.addWidget(self.infoPanel)
+        rightVBox.addWidget(self.pendingPanel)
+        mainHBox.addLayout(rightVBox)
+
+        # Hidden debug panel with timings of the brsaneconfig3 calls
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Shift+L"), self, self.showOperationsPanel)
+
+        # Nothing is selected until the query finishes
+        self.currentDevice = None
+        self.updateFields()
+
+        # Resize and show window
+        self.resize(self.minimumSizeHint().width(), self.minimumSizeHint().height())
+        self.setWindowTitle(WINDOW_TITLE)
+        self.center()
+        self.show()
+
+        # TODO: Confirm exit if there are unsaved changes
+
+    def closeEvent(self, event):
+        if len(self.pendingChanges) > 0:
+            discard = QtGui.QMessageBox.question(None, "", "Discard {} pending change(s)?".format(len(self.pendingChanges)),
+                                                 QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                                                 QtGui.QMessageBox.No)
+            if discard != QtGui.QMessageBox.Yes:
+                event.ignore()
+                return
+        # A bulk job stops after the device it is on
+        if self.bulkCancelled is not None:
+            self.bulkCancelled.set()
+        self.executor.shutdown()
+        self.probeTimer.stop()
+        self.configTimer.stop()
+        if self.prober is not None:
+            self.prober.cancel()
+        if self.operationsPanel is not None:
+            self.operationsPanel.detach()
+            self.operationsPanel.close()
+        super(ConfigWindow, self).closeEvent(event)
+
+    def showOperationsPanel(self):
+        if self.operationsPanel is None:
+            self.operationsPanel = OperationsPanel(self)
+        self.operationsPanel.show()
+        self.operationsPanel.raise_()
+
+    # Disable only the panel that a running command affects
+    def onWidgetBusy(self, widget, isBusy):
+        if isBusy:
+            widget.setEnabled(False)
+        elif widget is self.infoPanel:
+            # The info panel stays disabled if there is no device to show
+            widget.setEnabled(self.currentDevice is not None)
+        else:
+            widget.setEnabled(True)
+
+    def onBusyChanged(self, isBusy):
+        self.progressBar.setVisible(isBusy)
+        if isBusy:
+            self.statusBar().showMessage(BUSY_MESSAGE)
+        # Leave messages shown by the finished command alone
+        elif self.statusBar().currentMessage() == BUSY_MESSAGE:
+            self.statusBar().clearMessage()
+        # Config file changes seen while the command ran are checked now
+        if not isBusy and self.configChangePending:
+            self.configTimer.start()
+
+    # Center the window on the screen
+    def center(self):
+        ourRect = self.frameGeometry()
+        screenCenter = QtGui.QDesktopWidget().availableGeometry().center()
+        ourRect.moveCenter(screenCenter)
+        self.move(ourRect.topLeft())
+
+    # Update fields in GUI based on current device
+    def updateFields(self):
+        # If there is no current device, disable all of the input fields
+        if self.currentDevice is None:
+            self.infoPanel.setEnabled(False)
+            self.clearAllFields()
+        else:
+            self.infoPanel.setEnabled(not self.executor.isBusy(self.infoPanel))
+            # Disable signals until all fields have been populated
+            # Prevents the handlers from recording the new values as edits
+            self.disableSignals()
+
+            self.friendlyNameEdit.setText(self.currentDevice.name)
+
+            self.modelNameSelect.setCurrentIndex(self.modelIndex.position(self.currentDevice.model))
+
+            if self.currentDevice.usesIP:
+                self.ipWidget.setEnabled(True)
+                self.ipRadio.setChecked(True)
+                for textbox, segment in zip(self.ipEdits, self.currentDevice.addr.split('.')):
+                    textbox.setText(segment)
+                self.nodeNameWidget.setEnabled(False)
+                self.nodeEdit.setText("")
+            else:
+                self.nodeNameWidget.setEnabled(True)
+                self.nodeRadio.setChecked(True)
+                self.nodeEdit.setText(self.currentDevice.addr)
+                self.ipWidget.setEnabled(False)
+                for textbox in self.ipEdits:
+                    textbox.setText("")
+
+            self.enableSignals()
+
+        # The fields now show the device as it is, so nothing is edited or invalid
+        self.editState.reset(self.currentDevice)
+        self.validationTimer.stop()
+        self.unvalidatedGroups.clear()
+        self.fieldErrors = {}
+        self.showFieldErrors()
+
+    # Join the IP address components together, in canonical form ("10.0.0.5" rather than "010.000.000.005")
+    # Only call once the fields are valid (see validateFieldValues())
+    def getIP(self):
+        return normalizeIP('.'.join(self.getIPEditsContents()))
+
+    # Pressed the "Add Device" button
+    def addNewDevice(self):
+        self.infoPanel.setEnabled(True)
+        # Create the new device and add it to the devices list
+        newDevice = BrotherDevice()
+        self.deviceModel.appendDevice(newDevice)
+        # TODO: Try to extract common dialog code
+        # Check if there are changes we need to save
+        if self.hasEditedCurrentDevice:
+            saveChanges = QtGui.QMessageBox.question(None, "", "Save changes to current device?",
+                                                     QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                                                     QtGui.QMessageBox.No)
+            if saveChanges == QtGui.QMessageBox.Yes:
+                # If the user wants to save changes, attempt to do so before switching to the new device
+                # If the save operation fails, the user must fix things before they can switch to adding a new device
+                if not self.saveHelper():
+                    self.deviceModel.removeDevice(newDevice)
+                    return
+
+        # If the save operation succeeds or if there are no changes to save, switch to the new device
+        self.selectDevice(newDevice)
+        self.currentDevice = newDevice
+        self.hasEditedCurrentDevice = True
+        self.updateFields()
+        self.friendlyNameEdit.setFocus()
+
+    # Sweep a network range for scanners; the ones the user picks are queued as pending additions
+    def discoverDevices(self):
+        dialog = DiscoveryDialog(self.deviceModel, self.modelIndex, self)
+        if dialog.exec_() != QtGui.QDialog.Accepted:
+            return
+        for device in dialog.selectedDevices():
+            self.deviceModel.appendDevice(device)
+            self.pendingChanges.recordSave(device, None)
+            device.isNew = False
+        self.refreshPendingChanges()
+
+    # Common save operation (does not update name displayed in device list)
+    # The change is only queued, see applyPendingChanges()
+    def saveHelper(self):
+        # Nothing effective changed (e.g. a field was edited and then changed back), so there is nothing to queue
+        if not self.currentDevice.isNew and not self.editState.isDirty():
+            self.hasEditedCurrentDevice = False
+            self.saveBtn.setEnabled(False)
+            return True
+        # Stop here if input is invalid
+        if not self.validateFieldValues():
+            return False
+        # Remember the device as brsaneconfig3 knows it (nothing, if it has never been applied)
+        self.pendingChanges.recordSave(self.currentDevice, None if self.currentDevice.isNew else self.currentDevice.copy())
+        # Save changes
+        self.updateCurrentDevice()
+        # Reset flags; further edits are compared with the values just saved
+        self.currentDevice.isNew = False
+        self.hasEditedCurrentDevice = False
+        self.saveBtn.setEnabled(False)
+        self.editState.reset(self.currentDevice)
+        self.refreshPendingChanges()
+        return True
+
+    # Save device (the model redraws its row with the new name)
+    def saveCurrentDevice(self):
+        self.saveHelper()
+
+    # Delete device (queued like a save, so it can still be discarded)
+    def deleteCurrentDevice(self):
+        device = self.currentDevice
+        # A device that was never saved has nothing to undo
+        if not device.isNew:
+            self.pendingChanges.recordDelete(device, device.copy())
+        self.deviceModel.removeDevice(device)
+        self.currentDevice = self.deviceModel.device(self.currentRow())
+        self.hasEditedCurrentDevice = False
+        self.updateFields()
+        self.refreshPendingChanges()
+
+    # Saved devices selected in the list, in list order
+    def selectedDevices(self):
+        rows = sorted(index.row() for index in self.deviceList.selectionModel().selectedRows())
+        return [device for device in (self.deviceModel.device(row) for row in rows) if not device.isNew]
+
+    def updateBulkButtons(self):
+        hasSelection = len(self.selectedDevices()) > 0
+        self.bulkDeleteBtn.setEnabled(hasSelection)
+        self.readdressBtn.setEnabled(hasSelection)
+
+    # The selected devices a bulk job can change, and a SKIPPED result for those with queued changes or unsaved edits
+    # (what the list shows for them is not what brsaneconfig3 has)
+    def bulkTargets(self):
+        devices = []
+        skipped = []
+        for device in self.selectedDevices():
+            hasEdits = device is self.currentDevice and self.hasEditedCurrentDevice
+            if device in self.pendingChanges.byDevice or hasEdits:
+                skipped.append(bulkedit.BulkResult(bulkedit.BulkItem(device, device.copy(), None), bulkedit.SKIPPED,
+                                                   "has changes that are not applied yet"))
+            else:
+                devices.append(device)
+        return devices, skipped
+
+    def deleteSelectedDevices(self):
+        devices, skipped = self.bulkTargets()
+        if not devices:
+            self.showBulkResults(skipped)
+            return
+        confirm = QtGui.QMessageBox.question(None, "Delete devices",
+                                             "Delete {} device(s)? This is applied right away and can't be discarded."
+                                             .format(len(devices)),
+                                             QtGui.QMessageBox.Yes | QtGui.QMessageBox.No, QtGui.QMessageBox.No)
+        if confirm == QtGui.QMessageBox.Yes:
+            self.runBulkJob("Deleting devices...", bulkedit.deletionItems(devices), skipped)
+
+    def readdressSelectedDevices(self):
+        devices, skipped = self.bulkTargets()
+        if not devices:
+            self.showBulkResults(skipped)
+            return
+        dialog = ReaddressDialog(devices, self.deviceModel.devicesAt, self)
+        if dialog.exec_() != QtGui.QDialog.Accepted:
+            return
+        items, notMatching = dialog.plan()
+        self.runBulkJob("Changing addresses...", items, skipped + notMatching)
+
+    # Bulk jobs bypass the pending changes: they run right away, one device at a time on the command thread (see
+    # bulkedit.runBulk()), and can be cancelled between devices; skipped results are added to the summary
+    def runBulkJob(self, title, items, skipped):
+        self.bulkCancelled = threading.Event()
+        self.bulkProgressDialog = QtGui.QProgressDialog(title, "Cancel", 0, len(items), self)
+        self.bulkProgressDialog.setWindowModality(QtCore.Qt.WindowModal)
+        self.bulkProgressDialog.setMinimumDuration(0)
+        self.bulkProgressDialog.setAutoClose(False)
+        self.bulkProgressDialog.setAutoReset(False)
+        self.bulkProgressDialog.canceled.connect(self.bulkCancelled.set)
+        self.bulkProgressDialog.setValue(0)
+        self.executor.submit([self.deviceListWidget, self.infoPanel, self.pendingPanel],
+                             bulkedit.runBulk, (items, self.configToken, self.bulkProgress.emit, self.bulkCancelled,
+                                                self.pendingChanges.appliedSettings(self.deviceModel)),
+                             onSuccess = lambda results: self.onBulkFinished(results + skipped),
+                             onFailure = self.onBulkFailed)
+
+    def onBulkProgress(self, done, total):
+        if self.bulkProgressDialog is not None and not self.bulkCancelled.is_set():
+            self.bulkProgressDialog.setValue(done)
+
+    def closeBulkProgress(self):
+        if self.bulkProgressDialog is not None:
+            self.bulkProgressDialog.close()
+            self.bulkProgressDialog = None
+
+    def onBulkFailed(self, error):
+        self.closeBulkProgress()
+        QtGui.QMessageBox.warning(None, "Error", error)
+
+    # Show what the job did to the list: done devices (and those someone else already changed the same way) are
+    # deleted or re-addressed, failed and cancelled ones are left as they were
+    def onBulkFinished(self, results):
+        self.closeBulkProgress()
+        current = self.currentDevice
+        currentSettings = current.settings() if current is not None else None
+        for result in results:
+            device = result.item.device
+            if result.status not in (bulkedit.DONE, bulkedit.UNCHANGED) or device not in self.deviceModel:
+                continue
+            if result.item.updated is None:
+                self.deviceModel.removeDevice(device)
+            else:
+                device.assign(result.item.updated)
+                self.deviceModel.deviceChanged(device)
+
+        if current is not None and current not in self.deviceModel:
+            if self.currentRow() < 0 and len(self.deviceModel) > 0:
+                self.selectDevice(self.deviceModel.device(0))
+            self.currentDevice = self.deviceModel.device(self.currentRow())
+        # The current device had no unsaved edits if it was changed (see bulkTargets())
+        if self.currentDevice is not current or (current is not None and current.settings() != currentSettings):
+            self.hasEditedCurrentDevice = False
+            self.saveBtn.setEnabled(False)
+            self.updateFields()
+        self.fitDeviceList()
+        self.updateBulkButtons()
+        self.saveSnapshot()
+        self.probeDevices()
+        self.showBulkResults(results)
+
+    def showBulkResults(self, results):
+        failed = [result for result in results if result.status == bulkedit.FAILED]
+        box = QtGui.QMessageBox(QtGui.QMessageBox.Warning if failed else QtGui.QMessageBox.Information,
+                                "Bulk changes", bulkedit.summarize(results).capitalize() + ".",
+                                QtGui.QMessageBox.Ok, self)
+        box.setDetailedText("\n".join(bulkedit.describeResult(result) for result in results))
+        box.exec_()
+
+    # Show the queued changes as a diff against what brsaneconfig3 currently has
+    def refreshPendingChanges(self):
+        self.pendingList.clear()
+        self.pendingList.addItems(self.pendingChanges.describe())
+        hasChanges = len(self.pendingChanges) > 0
+        self.applyBtn.setEnabled(hasChanges)
+        self.discardBtn.setEnabled(hasChanges)
+
+    # Run the smallest set of removals/additions that produces the queued state, as one batch that is rolled back if any
+    # step fails
+    def applyPendingChanges(self):
+        removals, additions = self.pendingChanges.operations()
+        self.submitChanges(removals, additions, self.configToken, self.pendingChanges.appliedSettings(self.deviceModel))
+
+    # base is the settings of the devices as of token, which the history snapshot is worked out from
+    def submitChanges(self, removals, additions, token, base):
+        # Everything cancelled out, brsaneconfig3 already has the queued state
+        if not removals and not additions:
+            self.onPendingChangesApplied('')
+            return
+        self.executor.submit([self.deviceListWidget, self.infoPanel, self.pendingPanel],
+                             ConfigWindow.applyIfCurrent, (removals, additions, token, "applied changes", base),
+                             onSuccess = self.onApplyFinished,
+                             onFailure = lambda error: QtGui.QMessageBox.warning(
+                                 None, "Error", "Could not apply changes, nothing was changed.\n" + error))
+
+    # Runs on the command thread; a conflict is returned rather than raised so that it can be resolved, otherwise the
+    # token of the config that was just written is; reason and base are for the history (see
+    # BrotherDevice.applyChanges())
+    @staticmethod
+    def applyIfCurrent(removals, additions, token, reason, base):
+        try:
+            return BrotherDevice.applyChanges(removals, additions, token, reason, base)[2]
+        except ConflictError as e:
+            return e
+
+    def onApplyFinished(self, result):
+        if isinstance(result, ConflictError):
+            self.resolveConflicts(result)
+            return
+        self.configToken = result
+        self.onPendingChangesApplied('')
+
+    # Some of the queued changes touch devices that were changed elsewhere; only those devices are compared, and the
+    # user picks whose version of them wins
+    def resolveConflicts(self, error):
+        box = QtGui.QMessageBox(QtGui.QMessageBox.Warning, "Conflicting changes", str(error),
+                                QtGui.QMessageBox.Cancel, self)
+        keepMineBtn = box.addButton("Keep Mine", QtGui.QMessageBox.AcceptRole)
+        takeTheirsBtn = box.addButton("Take Theirs", QtGui.QMessageBox.DestructiveRole)
+        box.exec_()
+        if box.clickedButton() == keepMineBtn:
+            removals, additions = self.pendingChanges.operations()
+            removals, additions, conflicts = mergeBatch(removals, additions, error.current, preferOurs = True)
+            self.submitChanges(removals, additions, error.token, list(error.current.values()))
+        elif box.clickedButton() == takeTheirsBtn:
+            self.takeTheirs(error)
+
+    # Drop the queued changes to the conflicting devices and show those devices as they are now; the other queued
+    # changes stay queued
+    def takeTheirs(self, error):
+        conflictNames = set(conflict.name for conflict in error.conflicts)
+        dropped = self.pendingChanges.discard(conflictNames)
+        names = set(conflictNames)
+        current = self.currentDevice
+        for change in dropped:
+            names.add(change.device.name)
+            if change.original is not None:
+                names.add(change.original.name)
+            if change.device in self.deviceModel:
+                self.deviceModel.removeDevice(change.device)
+        for name in sorted(names):
+            theirs = error.current.get(name)
+            if theirs is not None and self.deviceModel.deviceNamed(name) is None:
+                self.deviceModel.appendDevice(BrotherDevice(DeviceRecord('-1', *theirs)))
+
+        if current is not None and current not in self.deviceModel:
+            if self.currentRow() < 0 and len(self.deviceModel) > 0:
+                self.selectDevice(self.deviceModel.device(0))
+            self.currentDevice = self.deviceModel.device(self.currentRow())
+            self.hasEditedCurrentDevice = False
+            self.saveBtn.setEnabled(False)
+            self.updateFields()
+        self.fitDeviceList()
+        self.refreshPendingChanges()
+        self.saveSnapshot()
+        self.statusBar().showMessage("Took the current version of {}".format(', '.join(sorted(conflictNames))))
+
+    def onPendingChangesApplied(self, output):
+        self.pendingChanges.clear()
+        self.refreshPendingChanges()
+        self.saveSnapshot()
+        # Addresses may have changed
+        self.probeDevices()
+
+    # Add the configuration the list shows to the history (see history.History), for states the window learns about
+    # itself (loading, outside changes); changes made through BrotherDevice are recorded where they are made
+    # Runs on a background thread since it serializes and hashes every device; a configuration that is the same as the
+    # latest snapshot is not recorded again
+    def recordHistory(self, reason):
+        settings = self.pendingChanges.appliedSettings(self.deviceModel)
+        thread = threading.Thread(target = HISTORY.record, args = (settings, reason))
+        thread.daemon = True
+        thread.start()
+
+    def showHistory(self):
+        dialog = HistoryDialog(HISTORY, self.pendingChanges.appliedSettings(self.deviceModel),
+                               canRestore = len(self.pendingChanges) == 0 and not self.hasEditedCurrentDevice,
+                               parent = self)
+        if dialog.exec_() == QtGui.QDialog.Accepted:
+            self.restoreSnapshot(*dialog.restoreTarget())
+
+    # Bring brsaneconfig3 back to a snapshot with the fewest commands: only the devices that differ from it are removed
+    # and added, as one conditional batch (see applyIfCurrent())
+    def restoreSnapshot(self, snapshot, target):
+        current = self.pendingChanges.appliedSettings(self.deviceModel)
+        removals, additions = [[BrotherDevice(DeviceRecord('-1', *settings)) for settings in rows]
+                               for rows in restoreOperations(current, target)]
+        confirm = QtGui.QMessageBox.question(None, "Restore",
+                                             "Remove {} and add {} device(s) to restore the configuration from {}?"
+                                             .format(len(removals), len(additions), time.strftime(
+                                                 '%Y-%m-%d %H:%M:%S', time.localtime(snapshot.time))),
+                                             QtGui.QMessageBox.Yes | QtGui.QMessageBox.No, QtGui.QMessageBox.No)
+        if confirm != QtGui.QMessageBox.Yes:
+            return
+        self.executor.submit([self.deviceListWidget, self.infoPanel, self.pendingPanel],
+                             ConfigWindow.applyIfCurrent, (removals, additions, self.configToken, "restored", current),
+                             onSuccess = lambda result: self.onRestoreFinished(result, removals, additions),
+                             onFailure = lambda error: QtGui.QMessageBox.warning(
+                                 None, "Error", "Could not restore, nothing was changed.\n" + error))
+
+    def onRestoreFinished(self, result, removals, additions):
+        if isinstance(result, ConflictError):
+            QtGui.QMessageBox.warning(None, "Conflicting changes", str(result) + "\n\nNothing was restored.")
+            return
+        self.configToken = result
+        current = self.currentDevice
+        for device in removals:
+            shown = self.deviceModel.deviceNamed(device.name)
+            if shown is not None:
+                self.deviceModel.removeDevice(shown)
+        for device in additions:
+            self.deviceModel.appendDevice(device)
+        if current is not None and current not in self.deviceModel:
+            if self.currentRow() < 0 and len(self.deviceModel) > 0:
+                self.selectDevice(self.deviceModel.device(0))
+            self.currentDevice = self.deviceModel.device(self.currentRow())
+            self.hasEditedCurrentDevice = False
+            self.saveBtn.setEnabled(False)
+            self.updateFields()
+        self.fitDeviceList()
+        self.saveSnapshot()
+        self.probeDevices()
+        self.statusBar().showMessage("Restored: removed {}, added {} device(s)".format(len(removals), len(additions)))
+
+    # Forget the queued changes and reload the devices as brsaneconfig3 has them
+    def discardPendingChanges(self):
+        self.pendingChanges.clear()
+        self.refreshPendingChanges()
+        self.hasEditedCurrentDevice = False
+        self.saveBtn.setEnabled(False)
+        self.refreshDevices()
+
+    # When the selected device changes, remember the previous one in case there's an error and we need to go back to it
+    def rememberPreviousItem(self, current, previous):
+        if previous.isValid():
+            self.previousDevice = self.deviceModel.device(previous.row())
+
+    # Check if there are changes to be saved when the user presses on a different device, and update the GUI accordingly
+    # This gives control over whether or not to allow switching to a new device if there are errors with the current one
+    # Orignally rememberPreviousItem() was used with the currentItemChanged signal, but the code would get stuck in a
+    # loop when calling setCurrentItem(previous) because doing so would trigger the signal all over again
+    # TODO: BUG:
+    # TODO:   1. Have two devices saved
+    # TODO:   2. Invalidate a field on one device (clear it)
+    # TODO:   3. Click on another device in the device list
+    # TODO:   4. Answer "yes" in the save dialog, validation will prevent selection of new device
+    # TODO:   5. Click on the current (invalid) device
+    # TODO:   6. Save dialog will appear; click "yes"
+    # TODO:   7. Device list will now show the wrong device selected
+    def onDevicePressed(self, index):
+        device = self.deviceModel.device(index.row())
+        # Pressed on a different one than was previously selected
+        if device is not self.previousDevice and self.previousDevice is not None:
+            # Ask the user if they want to save any changes that have been made
+            if self.hasEditedCurrentDevice:
+                saveChanges = QtGui.QMessageBox.question(None, "", "Save changes to current device?",
+                                                         QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                                                         QtGui.QMessageBox.No)
+                if saveChanges == QtGui.QMessageBox.Yes:
+                    if self.saveHelper():
+                        self.previousDevice = device
+                        self.currentDevice = device
+                    else:
+                        self.selectDevice(self.previousDevice)
+                        # Don't reset all of the fields back to original values if the save failed
+                        return
+                else:
+                    # If the device did not already exist, discard it
+                    # This is if the user clicks "Add Device" and then selects another device before saving the new one
+                    if self.currentDevice.isNew:
+                        self.deviceModel.removeDevice(self.currentDevice)
+                        self.previousDevice = None
+                    self.currentDevice = device
+                    self.hasEditedCurrentDevice = False
+            else:
+                self.previousDevice = device
+                self.currentDevice = device
+        else:
+            # TODO: Ask if the user wants to reset to original values. For now, do nothing
+            return
+
+        self.updateFields()
+
+    # React when name changes
+    def onNameInputChange(self):
+        self.onFieldEdited('name', str(self.friendlyNameEdit.text()))
+
+    # React when selected model changes
+    def onModelNameChange(self):
+        self.onFieldEdited('model', str(self.modelNameSelect.currentText()))
+
+    # Show the models matching what has been typed so far
+    def onModelSearch(self, text):
+        self.modelMatches.setNames(self.modelIndex.search(str(text)))
+        self.modelCompleter.complete()
+
+    def onModelCompleted(self, text):
+        self.modelNameSelect.setCurrentIndex(self.modelIndex.position(str(text)))
+
+    # React when address type changes
+    def onRadioToggle(self, isChecked):
+        # Enable the appropriate GUI components depending on which radio button is selected
+        if self.ipRadio.isChecked():
+            self.ipWidget.setEnabled(True)
+            self.nodeNameWidget.setEnabled(False)
+        elif self.nodeRadio.isChecked():
+            self.ipWidget.setEnabled(False)
+            self.nodeNameWidget.setEnabled(True)
+        self.onFieldEdited('usesIP', self.ipRadio.isChecked())
+
+    # React when one of the IP address boxes changes
+    def onIPChange(self):
+        box = self.sender()
+        self.onFieldEdited(IP_FIELDS[self.ipEdits.index(box)], str(box.text()))
+
+    # React when node name changes
+    def onNodeChange(self):
+        self.onFieldEdited('node', str(self.nodeEdit.text()))
+
+    # Only the edited field is compared with the original; validation waits until typing pauses, so that fast typing
+    # or pasting doesn't re-check everything on every keystroke
+    def onFieldEdited(self, field, value):
+        self.editState.setField(field, value)
+        self.hasEditedCurrentDevice = self.editState.isDirty()
+        self.saveBtn.setEnabled(self.hasEditedCurrentDevice)
+        self.unvalidatedGroups.add(GROUPS[field])
+        self.validationTimer.start()
+
+    # Check the fields edited since the last check and show the results inline
+    def validateEditedFields(self):
+        errors = groupErrors(self.unvalidatedGroups, self.editState.values,
+                             lambda name: self.deviceModel.nameTaken(name, self.currentDevice), self.modelIndex,
+                             self.addressOwner)
+        for group in self.unvalidatedGroups:
+            self.fieldErrors.pop(group, None)
+        self.fieldErrors.update(errors)
+        self.unvalidatedGroups.clear()
+        self.showFieldErrors()
+
+    # Name of another device at the address key the fields show, looked up in the device list's address index
+    # Only moving a device onto another one's address is an error; devices that already shared an address (configured
+    # outside the GUI) can still be edited
+    def addressOwner(self, key):
+        device = self.currentDevice
+        if device is not None and key == addressKey(device.usesIP, device.addr):
+            return None
+        return self.deviceModel.addressOwner(key, device)
+
+    def showFieldErrors(self):
+        self.validationLabel.setText("\n".join(self.fieldErrors[group] for group in GROUP_ORDER
+                                               if group in self.fieldErrors))
+        self.validationLabel.setVisible(len(self.fieldErrors) > 0)
+
+    # Update the properties of self.currentDevice based on the entered values
+    def updateCurrentDevice(self):
+        self.currentDevice.name = str(self.friendlyNameEdit.text())
+        self.currentDevice.model = str(self.modelNameSelect.currentText())
+        if self.ipRadio.isChecked():
+            self.currentDevice.usesIP = True
+            self.currentDevice.addr = self.getIP()
+        else:
+            self.currentDevice.usesIP = False
+            self.currentDevice.addr = str(self.nodeEdit.text())
+        # Re-index the device and redraw its row
+        self.deviceModel.deviceChanged(self.currentDevice)
+
+    # TODO: Decide if empty (invalid) fields should be left blank or repopulated with their original values
+    # Validate everything before saving; the errors are shown inline and, since the save is refused, in a message box
+    def validateFieldValues(self):
+        self.validationTimer.stop()
+        self.unvalidatedGroups.clear()
+        self.fieldErrors = groupErrors(GROUP_ORDER, self.editState.values,
+                                       lambda name: self.deviceModel.nameTaken(name, self.currentDevice),
+                                       self.modelIndex, self.addressOwner)
+        self.showFieldErrors()
+        if len(self.fieldErrors) > 0:
+            QtGui.QMessageBox.warning(None, "Error", self.validationLabel.text())
+            return False
+        return True
+
+    def disableSignals(self):
+        self.friendlyNameEdit.blockSignals(True)
+        self.modelNameSelect.blockSignals(True)
+        self.ipRadio.blockSignals(True)
+        for box in self.ipEdits:
+            box.blockSignals(True)
+        self.nodeRadio.blockSignals(True)
+        self.nodeEdit.blockSignals(True)
+
+    def enableSignals(self):
+        self.friendlyNameEdit.blockSignals(False)
+        self.modelNameSelect.blockSignals(False)
+        self.ipRadio.blockSignals(False)
+        for box in self.ipEdits:
+            box.blockSignals(False)
+        self.nodeRadio.blockSignals(False)
+        self.nodeEdit.blockSignals(False)
+
+    # Generator for the IP address entered by the user
+    # Note: Does not separate components with dots
+    def getIPEditsContents(self):
+        for box in self.ipEdits:
+            yield str(box.text())
+
+    def clearAllFields(self):
+        self.disableSignals()
+
+        self.friendlyNameEdit.setText('')
+        self.modelNameSelect.setCurrentIndex(-1)
+        self.ipRadio.setChecked(False)
+        for box in self.ipEdits:
+            box.setText('')
+        self.nodeRadio.setChecked(False)
+        self.nodeEdit.setText('')
+
+        self.enableSignals()
@@ -0,0 +1,277 @@
+#! /usr/bin/env python
+
+# Long-running service that owns brsaneconfig3 for everyone on the machine, so that scripts and users running at the
+# same time neither fork a query each nor overwrite each other's edits; deliberately does not import PyQt
+#
+#   python daemon.py --backend native --mode 660
+#   BRSANECONFIG_BACKEND=daemon python gui.py        (or: python cli.py --backend daemon export)
+#
+# Queries are answered from memory. Changes are queued and run one at a time by a single writer thread, which keeps
+# the cached state up to date as it goes; the cache is reloaded if the config files change behind the daemon's back
+# Protocol: one JSON object per line on a Unix socket, answered by one JSON object per line (see DaemonBackend)
+import os, sys, json, signal, socket, argparse, threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from brotherdevice import (BrotherDevice, BrotherError, ConflictError, NativeBackend, SubprocessBackend,
+                           daemonSocket, parseQueryOutput, queryLines, selectBackend)
+from configwatch import fileSignature
+from history import HISTORY
+
+
+# Runs functions one at a time on its own thread, in the order they were submitted
+class Writer:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        thread = threading.Thread(target = self.run)
+        thread.daemon = True
+        thread.start()
+
+    # Run func(*args) on the writer thread and return its result (or raise its BrotherError) once it is done
+    def call(self, func, *args):
+        job = {'done': threading.Event(), 'result': None, 'error': None}
+        self.jobs.put((func, args, job))
+        job['done'].wait()
+        if job['error'] is not None:
+            raise job['error']
+        return job['result']
+
+    def run(self):
+        while True:
+            func, args, job = self.jobs.get()
+            try:
+                job['result'] = func(*args)
+            except BrotherError as e:
+                job['error'] = e
+            except Exception as e:
+                # The writer has to survive anything, or every later request would wait forever
+                job['error'] = BrotherError("Unexpected error in the daemon: {}".format(e))
+            finally:
+                job['done'].set()
+
+
+# The models and (name, model, usesIP, addr) devices as the backend last reported them; only the writer thread
+# changes them, readers take the query lines under the lock
+class DeviceService:
+    def __init__(self, backend):
+        self.backend = backend
+        self.writer = Writer()
+        self.lock = threading.Lock()
+        self.models = []
+        self.devices = []
+        self.lines = []
+        # Config files as of the cached state
+        self.signature = None
+
+    def configSignature(self):
+        return (fileSignature(self.backend.deviceFile), fileSignature(self.backend.modelFile))
+
+    # The only full query, at startup and when someone changed the config without going through the daemon
+    def load(self):
+        signature = self.configSignature()
+        models, devices = parseQueryOutput(BrotherDevice.queryDevices())
+        self.setState(models, [device.settings() for device in devices], signature)
+
+    def reloadIfChanged(self):
+        if self.configSignature() != self.signature:
+            self.load()
+
+    def setState(self, models, devices, signature):
+        lines = queryLines(models, devices)
+        with self.lock:
+            self.models = models
+            self.devices = devices
+            self.lines = lines
+            self.signature = signature
+
+    def query(self):
+        if self.configSignature() != self.signature:
+            self.writer.call(self.reloadIfChanged)
+        with self.lock:
+            return self.lines
+
+    # Runs on the writer thread: apply a change through the backend, then patch the cached devices the way the
+    # backend changed them (additions are appended; the native backend replaces a device in place)
+    # Returns what func returned; batches return the (removals, additions) that actually ran (and the token after them),
+    # which are patched in instead of the ones requested (see BrotherDevice.applyChanges()), and False means nothing was changed (see
+    # BrotherDevice.replaceDevice()), so there is nothing to patch
+    # The cached devices afterwards are added to the history with reason (BrotherDevice doesn't record changes made
+    # by the daemon, see BrotherDevice.recordHistory())
+    def change(self, func, args, removedNames, additions, inPlace = False, reason = "applied changes"):
+        stale = self.configSignature() != self.signature
+        result = func(*args)
+        if isinstance(result, tuple):
+            removedNames = set(device.name for device in result[0])
+            additions = result[1]
+            changed = bool(result[0] or result[1])
+        else:
+            changed = result is not False
+        if stale:
+            # Patching would hide the outside change
+            self.load()
+        elif changed:
+            self.patch(removedNames, additions, inPlace)
+        if changed:
+            HISTORY.record(self.devices, reason)
+        return result
+
+    # Removing and appending a device that didn't change would move it to the end, unlike brsaneconfig3, so this is
+    # only done for real changes
+    def patch(self, removedNames, additions, inPlace):
+        devices = list(self.devices)
+        position = len(devices)
+        for i in reversed(range(len(devices))):
+            if devices[i][0] in removedNames:
+                del devices[i]
+                position = i
+        if not inPlace:
+            position = len(devices)
+        devices[position:position] = [device.settings() for device in additions]
+        self.setState(self.models, devices, self.configSignature())
+
+    # Answer one request (a dict, see DaemonBackend) with a reply dict
+    def handle(self, request):
+        try:
+            op = request['op']
+            if op == 'query':
+                return {'lines': self.query()}
+            if op == 'info':
+                return {'backend': self.backend.name, 'catalogueFile': self.backend.catalogueFile()}
+            if op == 'add':
+                device = BrotherDevice.fromDict(request['device'])
+                self.writer.call(self.change, BrotherDevice.addDevice, (device,), set(), [device], False,
+                                 "added {}".format(device.name))
+            elif op == 'remove':
+                name = request['name']
+                self.writer.call(self.change, BrotherDevice.removeDevice, (name,), set([name]), [], False,
+                                 "removed {}".format(name))
+            elif op == 'replace':
+                previous = BrotherDevice.fromDict(request['previous']) if request['previous'] is not None else None
+                device = BrotherDevice.fromDict(request['device'])
+                self.writer.call(self.change, BrotherDevice.replaceDevice, (previous, device),
+                                 set([previous.name]) if previous is not None else set(), [device],
+                                 isinstance(self.backend, NativeBackend), "changed {}".format(device.name))
+            elif op == 'applyBatch':
+                removals = [BrotherDevice.fromDict(values) for values in request['removals']]
+                additions = [BrotherDevice.fromDict(values) for values in request['additions']]
+                removals, additions, token = self.writer.call(self.change, BrotherDevice.applyChanges,
+                                                              (removals, additions, request.get('token'), None),
+                                                              set(device.name for device in removals), additions)
+                return {'removals': [device.toDict() for device in removals],
+                        'additions': [device.toDict() for device in additions], 'token': token}
+            else:
+                return {'error': "Unknown request '{}'.".format(op)}
+            return {}
+        except ConflictError as e:
+            return {'error': str(e), 'conflict': e.toDict()}
+        except BrotherError as e:
+            return {'error': str(e)}
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            return {'error': "Invalid request: {}".format(e)}
+
+
+# One client connection, which may send any number of requests
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = {'error': "Invalid request: not JSON."}
+            else:
+                response = self.server.service.handle(request) if isinstance(request, dict) \
+                    else {'error': "Invalid request: not an object."}
+            try:
+                self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+                self.wfile.flush()
+            except (socket.error, OSError):
+                # The client went away
+                return
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    # Clients that connect while the backlog is full have to wait, so leave room for many at once
+    request_queue_size = 128
+
+    def __init__(self, path, service):
+        self.service = service
+        socketserver.ThreadingUnixStreamServer.__init__(self, path, RequestHandler)
+
+
+# A socket left behind by a daemon that died is removed; one that still answers means a daemon is running
+def removeStaleSocket(path):
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (socket.error, OSError):
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise BrotherError("Another daemon is already listening on {}.".format(path))
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description = "Serve brsaneconfig3 devices to local clients over a Unix socket.")
+    parser.add_argument('--backend', choices = [SubprocessBackend.name, NativeBackend.name],
+                        help = "how the daemon talks to brsaneconfig3 (default: $BRSANECONFIG_BACKEND or subprocess)")
+    parser.add_argument('--socket', default = daemonSocket(), help = "socket path (default: %(default)s)")
+    parser.add_argument('--mode', default = '600', type = lambda value: int(value, 8),
+                        help = "permissions of the socket, in octal (default: 600, only the daemon's user); use e.g. "
+                               "660 and a shared group to let other users in")
+    return parser.parse_args(argv)
+
+
+def main(argv = None):
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+    try:
+        # The daemon's own backend can't be the daemon
+        if (args.backend or os.environ.get('BRSANECONFIG_BACKEND')) == 'daemon':
+            raise BrotherError("The daemon needs the subprocess or native backend.")
+        backend = selectBackend(args.backend)
+        for message in BrotherDevice.recoverInterrupted():
+            sys.stderr.write(message + "\n")
+        service = DeviceService(backend)
+        service.writer.call(service.load)
+        removeStaleSocket(args.socket)
+        # Created with the right permissions rather than changed afterwards, so there is no window where anyone can
+        # connect
+        umask = os.umask(0o777 & ~args.mode)
+        try:
+            server = Server(args.socket, service)
+        finally:
+            os.umask(umask)
+    except BrotherError as e:
+        sys.stderr.write("Error: {}\n".format(e))
+        return 1
+    except (IOError, OSError, socket.error) as e:
+        sys.stderr.write("Error: {}\n".format(e))
+        return 1
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    sys.stderr.write("Serving {} devices ({} backend) on {}\n".format(len(service.devices), backend.name, args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.remove(args.socket)
+        except OSError:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import os, json
+
+from modelcache import CACHE_DIR, writeJSON
+
+
+# Last device list seen by the GUI, drawn at startup while brsaneconfig3 is queried again in the background
+SNAPSHOT_FILE = os.path.join(CACHE_DIR, 'devices.json')
+
+
+# Return the saved list of device dicts, or None if there is no usable snapshot
+def loadSnapshot(snapshotFile = SNAPSHOT_FILE):
+    try:
+        with open(snapshotFile) as f:
+            devices = json.load(f)
+        if not isinstance(devices, list):
+            return None
+        return devices
+    except (IOError, OSError, ValueError):
+        return None
+
+
+# Save a list of device dicts (see BrotherDevice.toDict()); failures are ignored since the snapshot is only a preview
+def saveSnapshot(devices, snapshotFile = SNAPSHOT_FILE):
+    return writeJSON(snapshotFile, devices)
@@ -0,0 +1,165 @@
+from PyQt4 import QtGui, QtCore
+
+import reachability
+from addresses import addressKey
+
+
+# Badge colour for each probe status (see reachability)
+STATUS_COLORS = {reachability.UNKNOWN: QtCore.Qt.lightGray, reachability.REACHABLE: QtCore.Qt.darkGreen,
+                 reachability.UNREACHABLE: QtCore.Qt.red, reachability.UNRESOLVED: QtCore.Qt.darkYellow}
+# Drawn on first use, there has to be a QApplication first
+statusIcons = {}
+
+
+def statusIcon(status):
+    if status not in statusIcons:
+        pixmap = QtGui.QPixmap(10, 10)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(QtCore.Qt.NoPen)
+        painter.setBrush(QtGui.QColor(STATUS_COLORS[status]))
+        painter.drawEllipse(1, 1, 8, 8)
+        painter.end()
+        statusIcons[status] = QtGui.QIcon(pixmap)
+    return statusIcons[status]
+
+
+# Qt model behind the device list, replacing the QListWidget that had to be kept in sync with a separate Python list
+# Devices are indexed by row, name and address so that lookups and duplicate checks don't scan the whole list
+class DeviceListModel(QtCore.QAbstractListModel):
+    # Role that returns the BrotherDevice itself
+    DeviceRole = QtCore.Qt.UserRole
+
+    def __init__(self, parent = None):
+        super(DeviceListModel, self).__init__(parent)
+        self.devices = []
+        # device -> row, renumbered from the affected row on insert/remove
+        self.rows = {}
+        # name -> device, address key (see addresses.addressKey()) -> list of devices (several devices may share an
+        # address, e.g. when they were configured that way outside the GUI)
+        self.byName = {}
+        self.byAddress = {}
+        # device -> (name, address key) it is currently indexed under, so that it can be re-indexed after an edit
+        self.indexedKeys = {}
+        # (usesIP, addr) -> latest reachability.ProbeResult, shown as a badge next to the name
+        self.probeResults = {}
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.devices)
+
+    def data(self, index, role = QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.devices):
+            return QtCore.QVariant()
+        device = self.devices[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            # Devices being added have no name until they are saved
+            return device.name or 'New Device'
+        if role == DeviceListModel.DeviceRole:
+            return device
+        if device.isNew:
+            return QtCore.QVariant()
+        result = self.probeResults.get((device.usesIP, device.addr))
+        if role == QtCore.Qt.DecorationRole:
+            return statusIcon(result.status if result is not None else reachability.UNKNOWN)
+        if role == QtCore.Qt.ToolTipRole:
+            return "{}: {}".format(result.status.capitalize(), result.detail) if result is not None else "Not checked yet"
+        return QtCore.QVariant()
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __contains__(self, device):
+        return device in self.rows
+
+    def device(self, row):
+        return self.devices[row] if 0 <= row < len(self.devices) else None
+
+    def rowOf(self, device):
+        return self.rows.get(device, -1)
+
+    def deviceNamed(self, name):
+        return self.byName.get(name)
+
+    # True if another device already uses the name
+    def nameTaken(self, name, exclude = None):
+        device = self.byName.get(name)
+        return device is not None and device is not exclude
+
+    def devicesAt(self, usesIP, addr):
+        return list(self.byAddress.get(addressKey(usesIP, addr), []))
+
+    # Name of a device other than exclude at the address key, or None
+    def addressOwner(self, key, exclude = None):
+        for device in self.byAddress.get(key, []):
+            if device is not exclude:
+                return device.name
+        return None
+
+    def insertDevice(self, row, device):
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.devices.insert(row, device)
+        self.renumber(row)
+        self.addToIndexes(device)
+        self.endInsertRows()
+
+    def appendDevice(self, device):
+        self.insertDevice(len(self.devices), device)
+
+    def removeDevice(self, device):
+        row = self.rows[device]
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.devices[row]
+        del self.rows[device]
+        self.renumber(row)
+        self.removeFromIndexes(device)
+        self.endRemoveRows()
+
+    def moveDevice(self, device, row):
+        oldRow = self.rows[device]
+        if oldRow == row:
+            return
+        # beginMoveRows() wants the destination as it is before the move
+        self.beginMoveRows(QtCore.QModelIndex(), oldRow, oldRow, QtCore.QModelIndex(), row if row < oldRow else row + 1)
+        del self.devices[oldRow]
+        self.devices.insert(row, device)
+        self.renumber(min(row, oldRow))
+        self.endMoveRows()
+
+    # Call after changing a device's attributes: updates the indexes and redraws only its row
+    def deviceChanged(self, device):
+        self.removeFromIndexes(device)
+        self.addToIndexes(device)
+        index = self.index(self.rows[device])
+        self.dataChanged.emit(index, index)
+
+    # Record a probe result and redraw the rows of the devices at that address
+    def setProbeResult(self, result):
+        self.probeResults[result.key] = result
+        for device in self.byAddress.get(addressKey(*result.key), []):
+            index = self.index(self.rows[device])
+            self.dataChanged.emit(index, index)
+
+    def renumber(self, start):
+        for row in range(start, len(self.devices)):
+            self.rows[self.devices[row]] = row
+
+    def addToIndexes(self, device):
+        # Devices being added have no name yet
+        if device.name:
+            self.byName[device.name] = device
+        key = addressKey(device.usesIP, device.addr)
+        self.byAddress.setdefault(key, []).append(device)
+        self.indexedKeys[device] = (device.name, key)
+
+    def removeFromIndexes(self, device):
+        name, key = self.indexedKeys.pop(device)
+        if self.byName.get(name) is device:
+            del self.byName[name]
+        sameAddress = self.byAddress[key]
+        sameAddress.remove(device)
+        if not sameAddress:
+            del self.byAddress[key]
@@ -0,0 +1,217 @@
+import re, socket, struct, random, threading
+from collections import namedtuple
+
+import reachability
+from brotherdevice import BrotherDevice
+
+
+# Hosts on a LAN answer quickly; with WORKERS connections in flight a /22 takes about four of these
+TIMEOUT = 1.0
+# Refuse ranges larger than a /16, which would take minutes and is almost certainly a typo
+MAX_HOSTS = 65536
+SNMP_PORT = 161
+SNMP_COMMUNITY = 'public'
+# Brother's private MIB entry holding the IEEE 1284 device ID, e.g. "MFG:Brother;CMD:PJL;MDL:MFC-9340CDW;CLS:PRINTER;"
+DEVICE_ID_OID = '1.3.6.1.4.1.2435.2.3.9.1.1.7.0'
+
+# One probed address; status is reachability.REACHABLE if the scan port is open (every host is reported, so that
+# progress can be counted), model is the name the device reported over SNMP, or None
+DiscoveredHost = namedtuple('DiscoveredHost', ['addr', 'status', 'model', 'detail'])
+
+
+# IPv4 addresses in a CIDR range ("192.168.1.0/24", or a single address), without the network and broadcast
+# addresses; raises ValueError if the range is malformed or too large
+def parseNetwork(cidr):
+    address, slash, prefix = cidr.strip().partition('/')
+    try:
+        start = struct.unpack('!I', socket.inet_aton(address))[0]
+    except (socket.error, OSError):
+        raise ValueError("'{}' is not an IPv4 address".format(address))
+    # inet_aton() also accepts shorthands like "10.1"
+    if address.count('.') != 3:
+        raise ValueError("'{}' is not an IPv4 address".format(address))
+    if slash and not (prefix.isdigit() and 0 <= int(prefix) <= 32):
+        raise ValueError("'{}' is not a prefix length between 0 and 32".format(prefix))
+    length = int(prefix) if slash else 32
+    size = 1 << (32 - length)
+    if size > MAX_HOSTS:
+        raise ValueError("/{} is too large a range, use /16 or smaller".format(length))
+    start &= ~(size - 1) & 0xffffffff
+    numbers = range(start, start + size)
+    # /31 and /32 have no network/broadcast addresses
+    if size > 2:
+        numbers = numbers[1:-1]
+    return [socket.inet_ntoa(struct.pack('!I', number)) for number in numbers]
+
+
+# The local network as a /24, as a starting point for the range field; None without a network connection
+def guessLocalNetwork():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Connecting a UDP socket only picks the outgoing interface, nothing is sent
+        probe.connect(('192.0.2.1', 9))
+        address = probe.getsockname()[0]
+    except (socket.error, OSError):
+        return None
+    finally:
+        probe.close()
+    if address.startswith('127.') or address == '0.0.0.0':
+        return None
+    return address.rsplit('.', 1)[0] + '.0/24'
+
+
+def berLength(length):
+    if length < 0x80:
+        return bytearray([length])
+    encoded = bytearray()
+    while length:
+        encoded.insert(0, length & 0xff)
+        length >>= 8
+    return bytearray([0x80 | len(encoded)]) + encoded
+
+
+def ber(tag, value):
+    return bytearray([tag]) + berLength(len(value)) + value
+
+
+def berInteger(number):
+    encoded = bytearray([number & 0xff])
+    number >>= 8
+    while number or encoded[0] & 0x80:
+        encoded.insert(0, number & 0xff)
+        number >>= 8
+    return ber(0x02, encoded)
+
+
+def berOID(oid):
+    arcs = [int(arc) for arc in oid.split('.')]
+    encoded = bytearray([40 * arcs[0] + arcs[1]])
+    for arc in arcs[2:]:
+        chunk = bytearray([arc & 0x7f])
+        arc >>= 7
+        while arc:
+            chunk.insert(0, 0x80 | (arc & 0x7f))
+            arc >>= 7
+        encoded += chunk
+    return ber(0x06, encoded)
+
+
+# SNMPv1 GetRequest for a single OID
+def snmpGetRequest(oid, requestID, community = SNMP_COMMUNITY):
+    varbind = ber(0x30, berOID(oid) + bytearray([0x05, 0x00]))
+    pdu = ber(0xa0, berInteger(requestID) + berInteger(0) + berInteger(0) + ber(0x30, varbind))
+    return bytes(ber(0x30, berInteger(0) + ber(0x04, bytearray(community.encode('ascii'))) + pdu))
+
+
+# (tag, value, offset after the value) of the element starting at offset
+def berElement(data, offset):
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7f
+        length = 0
+        for byte in data[offset:offset + count]:
+            length = (length << 8) | byte
+        offset += count
+    if offset + length > len(data):
+        raise ValueError("truncated SNMP response")
+    return tag, data[offset:offset + length], offset + length
+
+
+# Value of the first variable in a GetResponse if it is a string, otherwise None
+def snmpResponseString(data, requestID):
+    data = bytearray(data)
+    tag, message, end = berElement(data, 0)
+    version = berElement(message, 0)
+    community = berElement(message, version[2])
+    tag, pdu, end = berElement(message, community[2])
+    if tag != 0xa2:
+        return None
+    responseID = berElement(pdu, 0)
+    if int(''.join('{:02x}'.format(byte) for byte in responseID[1]) or '0', 16) != requestID:
+        return None
+    errorStatus = berElement(pdu, responseID[2])
+    if any(errorStatus[1]):
+        return None
+    errorIndex = berElement(pdu, errorStatus[2])
+    varbinds = berElement(pdu, errorIndex[2])[1]
+    varbind = berElement(varbinds, 0)[1]
+    name = berElement(varbind, 0)
+    tag, value, end = berElement(varbind, name[2])
+    return bytes(value).decode('latin-1') if tag == 0x04 else None
+
+
+# Model name from the device's IEEE 1284 ID over SNMP, or None if it doesn't answer
+def queryModel(addr, timeout = TIMEOUT, port = SNMP_PORT):
+    requestID = random.randint(1, 0x7fffffff)
+    connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        connection.settimeout(timeout)
+        connection.sendto(snmpGetRequest(DEVICE_ID_OID, requestID), (addr, port))
+        data = connection.recvfrom(4096)[0]
+        deviceID = snmpResponseString(data, requestID)
+    except (socket.error, OSError, ValueError, IndexError):
+        return None
+    finally:
+        connection.close()
+    match = re.search(r'(?:^|;)\s*(?:MDL|MODEL):([^;]+)', deviceID or '')
+    return match.group(1).strip() if match else None
+
+
+# Closest supported model for a name reported by a device ("Brother MFC-9340CDW" -> "MFC-9340CDW"), or ''
+def matchModel(reported, modelIndex):
+    if not reported:
+        return ''
+    name = reported.replace('Brother', '').strip()
+    if name in modelIndex:
+        return name
+    matches = modelIndex.search(name, limit = 1)
+    return matches[0] if matches else ''
+
+
+# New (unsaved) devices for (address, model) hosts, named after their model and address; nameTaken(name) says whether
+# a name is already used by a configured device, names are also kept unique among the new devices
+def newDevices(hosts, nameTaken):
+    devices = []
+    names = set()
+    for addr, model in hosts:
+        base = '{}-{}'.format(model, addr.replace('.', '-'))
+        name = base
+        suffix = 2
+        while nameTaken(name) or name in names:
+            name = '{}-{}'.format(base, suffix)
+            suffix += 1
+        names.add(name)
+        device = BrotherDevice()
+        device.name = name
+        device.model = model
+        device.usesIP = True
+        device.addr = addr
+        devices.append(device)
+    return devices
+
+
+# Sweeps a range for hosts with the scan port open; call sweep() from a background thread and cancel() from anywhere
+class Discovery:
+    def __init__(self, port = reachability.SCAN_PORT, timeout = TIMEOUT, workers = reachability.WORKERS,
+                 snmpPort = SNMP_PORT):
+        self.port = port
+        self.timeout = timeout
+        self.workers = workers
+        self.snmpPort = snmpPort
+        self.cancelled = threading.Event()
+
+    def probeHost(self, addr):
+        status, detail = reachability.connect(addr, self.port, self.timeout)
+        model = None
+        if status == reachability.REACHABLE and not self.cancelled.is_set():
+            model = queryModel(addr, self.timeout, self.snmpPort)
+        return DiscoveredHost(addr, status, model, detail)
+
+    # onResult is called on the worker threads for every host, as soon as it has been probed
+    def sweep(self, addresses, onResult = None):
+        return reachability.runConcurrently(addresses, self.probeHost, self.workers, onResult, self.cancelled)
+
+    def cancel(self):
+        self.cancelled.set()
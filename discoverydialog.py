@@ -0,0 +1,133 @@
+import threading
+from PyQt4 import QtGui, QtCore
+
+import discovery, reachability
+
+
+# Sweeps a network range for Brother scanners and lets the user pick which ones to add
+# Hosts show up as soon as they answer; the sweep runs on background threads and can be stopped at any time
+class DiscoveryDialog(QtGui.QDialog):
+    # Emitted from the sweep's threads with each discovery.DiscoveredHost, and once when the sweep ends
+    hostProbed = QtCore.pyqtSignal(object)
+    sweepFinished = QtCore.pyqtSignal()
+
+    # deviceModel is used to skip addresses that are already configured and to pick unused names
+    def __init__(self, deviceModel, modelIndex, parent = None):
+        super(DiscoveryDialog, self).__init__(parent)
+        self.deviceModel = deviceModel
+        self.modelIndex = modelIndex
+        self.sweep = None
+        self.probed = 0
+        # (list item, address, model) for every host that can be added
+        self.found = []
+
+        self.rangeEdit = QtGui.QLineEdit(discovery.guessLocalNetwork() or '192.168.1.0/24')
+        self.startBtn = QtGui.QPushButton("Scan")
+        self.progressBar = QtGui.QProgressBar()
+        self.hostList = QtGui.QListWidget()
+        self.addBtn = QtGui.QPushButton("Add Selected")
+        cancelBtn = QtGui.QPushButton("Cancel")
+
+        self.hostProbed.connect(self.onHostProbed)
+        self.sweepFinished.connect(self.onSweepFinished)
+        self.startBtn.clicked.connect(self.onStartStop)
+        self.rangeEdit.returnPressed.connect(self.onStartStop)
+        self.hostList.itemChanged.connect(self.updateAddButton)
+        self.addBtn.clicked.connect(self.accept)
+        cancelBtn.clicked.connect(self.reject)
+
+        rangeLayout = QtGui.QHBoxLayout()
+        rangeLayout.addWidget(QtGui.QLabel("Network:"))
+        rangeLayout.addWidget(self.rangeEdit)
+        rangeLayout.addWidget(self.startBtn)
+        buttonsLayout = QtGui.QHBoxLayout()
+        buttonsLayout.addStretch(1)
+        buttonsLayout.addWidget(cancelBtn)
+        buttonsLayout.addWidget(self.addBtn)
+        layout = QtGui.QVBoxLayout()
+        layout.addLayout(rangeLayout)
+        layout.addWidget(self.progressBar)
+        layout.addWidget(self.hostList)
+        layout.addLayout(buttonsLayout)
+        self.setLayout(layout)
+
+        self.progressBar.setVisible(False)
+        self.addBtn.setEnabled(False)
+        self.setWindowTitle("Discover devices")
+        self.resize(450, 350)
+
+    def onStartStop(self):
+        if self.sweep is not None:
+            self.sweep.cancel()
+            return
+        try:
+            addresses = discovery.parseNetwork(str(self.rangeEdit.text()))
+        except ValueError as e:
+            QtGui.QMessageBox.warning(self, "Error", str(e))
+            return
+        self.hostList.clear()
+        self.found = []
+        self.probed = 0
+        self.progressBar.setRange(0, len(addresses))
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(True)
+        self.rangeEdit.setEnabled(False)
+        self.startBtn.setText("Stop")
+        self.updateAddButton()
+
+        self.sweep = discovery.Discovery()
+        thread = threading.Thread(target = self.runSweep, args = (self.sweep, addresses))
+        thread.daemon = True
+        thread.start()
+
+    # Runs on a background thread
+    def runSweep(self, sweep, addresses):
+        try:
+            sweep.sweep(addresses, self.hostProbed.emit)
+        finally:
+            self.sweepFinished.emit()
+
+    def onHostProbed(self, host):
+        self.probed += 1
+        self.progressBar.setValue(self.probed)
+        if host.status != reachability.REACHABLE:
+            return
+        model = discovery.matchModel(host.model, self.modelIndex)
+        configured = self.deviceModel.devicesAt(True, host.addr)
+        item = QtGui.QListWidgetItem("{}  {}".format(host.addr, model or host.model or "(unknown model)"))
+        # Hosts that can't be added are still listed, so that the user knows the scan found them
+        if configured:
+            item.setText(item.text() + "  - already configured as " + configured[0].name)
+            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEnabled)
+        elif not model:
+            item.setText(item.text() + "  - unsupported or unknown model, add it by hand")
+            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEnabled)
+        else:
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Checked)
+            self.found.append((item, host.addr, model))
+        self.hostList.addItem(item)
+
+    def onSweepFinished(self):
+        self.sweep = None
+        self.progressBar.setVisible(False)
+        self.rangeEdit.setEnabled(True)
+        self.startBtn.setText("Scan")
+        if self.hostList.count() == 0:
+            self.hostList.addItem("No devices found.")
+
+    def updateAddButton(self):
+        self.addBtn.setEnabled(len(self.checkedHosts()) > 0)
+
+    # (address, model) of the checked hosts
+    def checkedHosts(self):
+        return [(addr, model) for item, addr, model in self.found if item.checkState() == QtCore.Qt.Checked]
+
+    # New (unsaved) devices for the checked hosts, see discovery.newDevices()
+    def selectedDevices(self):
+        return discovery.newDevices(self.checkedHosts(), self.deviceModel.nameTaken)
+
+    def done(self, result):
+        if self.sweep is not None:
+            self.sweep.cancel()
+        super(DiscoveryDialog, self).done(result)
@@ -0,0 +1,122 @@
+from addresses import addressKey, ipError
+
+
+# Field-by-field edit tracking for the device panel, so that a keystroke only compares the field it changed
+# Fields: name, model, usesIP, ip0-ip3 (the four boxes of the IP address) and node
+IP_FIELDS = ['ip0', 'ip1', 'ip2', 'ip3']
+# Fields are validated in groups: the address is one group since its fields depend on the radio buttons
+GROUPS = {'name': 'name', 'model': 'model', 'usesIP': 'address', 'node': 'address'}
+GROUPS.update((field, 'address') for field in IP_FIELDS)
+# Order in which the groups' messages are shown
+GROUP_ORDER = ['name', 'model', 'address']
+
+
+# Values of the edit fields as they are shown for a device (or for no device)
+def fieldValues(device):
+    values = {'name': '', 'model': '', 'usesIP': True, 'node': ''}
+    segments = ['', '', '', '']
+    if device is not None:
+        values['name'] = device.name
+        values['model'] = device.model
+        values['usesIP'] = device.usesIP
+        if device.usesIP:
+            # New devices have the address '...'
+            segments = (device.addr.split('.') + segments)[:4]
+        else:
+            values['node'] = device.addr
+    values.update(zip(IP_FIELDS, segments))
+    return values
+
+
+class EditState:
+    def __init__(self):
+        self.reset(None)
+
+    # Start tracking edits of device (or of the empty panel)
+    def reset(self, device):
+        self.original = fieldValues(device)
+        self.values = dict(self.original)
+        self.dirty = set()
+
+    def setField(self, field, value):
+        self.values[field] = value
+        if value != self.original[field]:
+            self.dirty.add(field)
+        else:
+            self.dirty.discard(field)
+
+    # Only the address fields that belong to the selected address type count
+    def isDirty(self):
+        if not self.dirty:
+            return False
+        if 'name' in self.dirty or 'model' in self.dirty or 'usesIP' in self.dirty:
+            return True
+        if self.values['usesIP']:
+            return any(field in self.dirty for field in IP_FIELDS)
+        return 'node' in self.dirty
+
+    # Names of the fields that differ from the original
+    def dirtyFields(self):
+        return sorted(self.dirty)
+
+
+# The checks below return an error message, or None if the value is fine
+
+def nameError(name, nameTaken):
+    if len(name) < 1:
+        return "You must enter a name."
+    if any(c.isspace() for c in name):
+        return "The name cannot contain whitespace."
+    if nameTaken(name):
+        return "A device with that name already exists."
+    return None
+
+
+def modelError(model, knownModels):
+    if len(model) < 1:
+        return "You must select a model."
+    if model not in knownModels:
+        return "Unknown model, pick one from the list."
+    return None
+
+
+# addressOwner, if given, returns the name of another device at an address key (see addresses.addressKey()) or None
+def addressError(values, addressOwner = None):
+    if values['usesIP']:
+        segments = [values[field] for field in IP_FIELDS]
+        if not all(segments):
+            return "You must enter a full IP address."
+        error = ipError('.'.join(segments))
+        if error is not None:
+            return error
+    else:
+        if len(values['node']) < 1:
+            return "You must enter a node name."
+        if any(c.isspace() for c in values['node']):
+            return "The node name cannot contain whitespace."
+    owner = addressOwner(addressOf(values)) if addressOwner is not None else None
+    if owner is not None:
+        return "{} already uses this address.".format(owner)
+    return None
+
+
+# Address key (see addresses.addressKey()) of the values
+def addressOf(values):
+    if values['usesIP']:
+        return addressKey(True, '.'.join(values[field] for field in IP_FIELDS))
+    return addressKey(False, values['node'])
+
+
+# Errors for the given validation groups of the current values, as a {group: message} dict
+def groupErrors(groups, values, nameTaken, knownModels, addressOwner = None):
+    errors = {}
+    for group in groups:
+        if group == 'name':
+            error = nameError(values['name'], nameTaken)
+        elif group == 'model':
+            error = modelError(values['model'], knownModels)
+        else:
+            error = addressError(values, addressOwner)
+        if error is not None:
+            errors[group] = error
+    return errors
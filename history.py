@@ -0,0 +1,163 @@
+import os, json, time, zlib, hashlib, tempfile, threading
+from collections import namedtuple
+
+from brotherdevice import describeSettings
+from journal import stateDir
+
+
+# Snapshots listed in the history; older ones are forgotten, along with device lists no remaining snapshot uses
+MAX_SNAPSHOTS = 200
+
+# One entry of the history: when it was taken (time.time()), the digest of its device list, how many devices that
+# has, and why it was taken (e.g. "applied changes")
+Snapshot = namedtuple('Snapshot', ['time', 'digest', 'count', 'reason'])
+# Row-level difference between two device lists: settings only in the newer one, settings only in the older one, and
+# (older, newer) settings pairs for devices (by name) that exist in both but differ
+SnapshotDiff = namedtuple('SnapshotDiff', ['added', 'removed', 'changed'])
+
+
+# Applied device configurations over time, so that an earlier one can be compared with or restored
+# Device lists are stored once each under the SHA-1 of their contents (objects/<digest>, zlib-compressed JSON), so a
+# snapshot of a configuration that was seen before only costs a line in the log; a snapshot identical to the latest one
+# is not recorded at all
+class History:
+    # directory defaults to history/ in the journal's state directory, since like the journal it must survive a cache
+    # cleanup
+    def __init__(self, directory = None):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def historyDir(self):
+        return self.directory or os.path.join(stateDir(), 'history')
+
+    def logPath(self):
+        return os.path.join(self.historyDir(), 'log.jsonl')
+
+    def objectDir(self):
+        return os.path.join(self.historyDir(), 'objects')
+
+    # Record (name, model, usesIP, addr) device settings as they are now; returns the new Snapshot, or None if the
+    # configuration is the same as in the latest snapshot or the history can't be written
+    def record(self, settings, reason):
+        rows = sorted([list(device) for device in settings])
+        data = json.dumps(rows, separators = (',', ':')).encode('utf-8')
+        digest = hashlib.sha1(data).hexdigest()
+        with self.lock:
+            entries = self.readLog()
+            if entries and entries[-1].digest == digest:
+                return None
+            snapshot = Snapshot(time.time(), digest, len(rows), reason)
+            try:
+                self.writeObject(digest, data)
+                if len(entries) >= MAX_SNAPSHOTS:
+                    self.prune(entries[len(entries) - MAX_SNAPSHOTS + 1:], digest)
+                with open(self.logPath(), 'a') as f:
+                    f.write(json.dumps(snapshot._asdict(), sort_keys = True) + "\n")
+            except (IOError, OSError):
+                return None
+            return snapshot
+
+    # Record the configuration that removing and adding (name, model, usesIP, addr) settings produced from base, the
+    # settings before the change, or from the latest snapshot if base is None (nothing is recorded without either)
+    def recordChange(self, removals, additions, reason, base = None):
+        if base is None:
+            entries = self.snapshots()
+            if not entries:
+                return None
+            try:
+                base = self.load(entries[-1].digest)
+            except (IOError, OSError, ValueError, zlib.error):
+                return None
+        return self.record(applyOperations(base, removals, additions), reason)
+
+    # Snapshots, oldest first
+    def snapshots(self):
+        with self.lock:
+            return self.readLog()
+
+    # The device settings of a snapshot, in name order; raises IOError/OSError if they are missing or unreadable
+    def load(self, digest):
+        with open(os.path.join(self.objectDir(), digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha1(data).hexdigest() != digest:
+            raise IOError("Snapshot {} is corrupt.".format(digest))
+        return [tuple(row) for row in json.loads(data.decode('utf-8'))]
+
+    def readLog(self):
+        try:
+            with open(self.logPath()) as f:
+                lines = f.read().splitlines()
+        except (IOError, OSError):
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(Snapshot(**json.loads(line)))
+            except (ValueError, TypeError):
+                # A line torn by a crash in the middle of a write
+                continue
+        return entries
+
+    # Written to a temporary file and renamed, so a crash never leaves a partial object under a valid digest
+    def writeObject(self, digest, data):
+        path = os.path.join(self.objectDir(), digest)
+        if os.path.exists(path):
+            return
+        if not os.path.isdir(self.objectDir()):
+            os.makedirs(self.objectDir())
+        fd, tempPath = tempfile.mkstemp(dir = self.objectDir(), prefix = '.' + digest + '-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(zlib.compress(data))
+        os.rename(tempPath, path)
+
+    # Keep only the given snapshots, and the objects they or the snapshot being recorded (digest) use
+    def prune(self, kept, digest):
+        fd, tempPath = tempfile.mkstemp(dir = self.historyDir(), prefix = '.log-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(''.join(json.dumps(snapshot._asdict(), sort_keys = True) + "\n" for snapshot in kept))
+        os.rename(tempPath, self.logPath())
+        used = set(snapshot.digest for snapshot in kept)
+        used.add(digest)
+        for name in os.listdir(self.objectDir()):
+            if name not in used and not name.startswith('.'):
+                os.remove(os.path.join(self.objectDir(), name))
+
+
+# Compare two lists of device settings; devices are matched by name, which brsaneconfig3 keeps unique
+# Identical rows are dropped with one set operation first, so only the rows that differ are looked at by name
+def diffSettings(old, new):
+    oldRows = set(old)
+    newRows = set(new)
+    onlyOld = dict((row[0], row) for row in oldRows - newRows)
+    onlyNew = dict((row[0], row) for row in newRows - oldRows)
+    added = [onlyNew[name] for name in sorted(onlyNew) if name not in onlyOld]
+    removed = [onlyOld[name] for name in sorted(onlyOld) if name not in onlyNew]
+    changed = [(onlyOld[name], onlyNew[name]) for name in sorted(onlyNew) if name in onlyOld]
+    return SnapshotDiff(added, removed, changed)
+
+
+# Settings after removing and adding settings to base: removed devices (by name) are dropped and additions appended,
+# which is where brsaneconfig3 puts them
+def applyOperations(base, removals, additions):
+    removedNames = set(settings[0] for settings in removals)
+    return [settings for settings in base if settings[0] not in removedNames] + list(additions)
+
+
+# (removals, additions) settings that turn the current configuration into target: the devices that differ in any way
+# are removed and added again (brsaneconfig3 can't edit a device in place), everything else is left alone
+def restoreOperations(current, target):
+    diff = diffSettings(current, target)
+    return (diff.removed + [old for old, new in diff.changed],
+            [new for old, new in diff.changed] + diff.added)
+
+
+# Lines describing a SnapshotDiff, in the style of the pending changes list
+def describeDiff(diff):
+    lines = ['+ {}: {}'.format(row[0], describeSettings(row)) for row in diff.added]
+    lines.extend('- {}: {}'.format(row[0], describeSettings(row)) for row in diff.removed)
+    lines.extend('~ {}: {} -> {}'.format(old[0], describeSettings(old), describeSettings(new))
+                 for old, new in diff.changed)
+    return lines
+
+
+HISTORY = History()
@@ -0,0 +1,99 @@
+import time
+from PyQt4 import QtGui
+
+import history
+
+
+# Lists the history snapshots and shows what changed: since the selected snapshot, or between two selected ones
+# Accepting the dialog asks for the selected snapshot to be restored (see restoreTarget())
+class HistoryDialog(QtGui.QDialog):
+    # current is the applied device settings now; restoring is only offered if canRestore
+    def __init__(self, snapshotHistory, current, canRestore = True, parent = None):
+        super(HistoryDialog, self).__init__(parent)
+        self.history = snapshotHistory
+        self.current = current
+        self.canRestore = canRestore
+        # Newest first, like the list
+        self.snapshots = list(reversed(snapshotHistory.snapshots()))
+        # digest -> settings, loaded when first selected
+        self.loaded = {}
+
+        self.snapshotList = QtGui.QListWidget()
+        self.diffLabel = QtGui.QLabel()
+        self.diffList = QtGui.QListWidget()
+        self.restoreBtn = QtGui.QPushButton("Restore")
+        closeBtn = QtGui.QPushButton("Close")
+
+        self.snapshotList.setSelectionMode(QtGui.QAbstractItemView.ExtendedSelection)
+        for snapshot in self.snapshots:
+            self.snapshotList.addItem("{}  {} ({} devices)".format(
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.time)), snapshot.reason, snapshot.count))
+        self.diffLabel.setWordWrap(True)
+        self.snapshotList.itemSelectionChanged.connect(self.updateDiff)
+        self.restoreBtn.clicked.connect(self.accept)
+        closeBtn.clicked.connect(self.reject)
+
+        buttonsLayout = QtGui.QHBoxLayout()
+        buttonsLayout.addStretch(1)
+        buttonsLayout.addWidget(closeBtn)
+        buttonsLayout.addWidget(self.restoreBtn)
+        diffLayout = QtGui.QVBoxLayout()
+        diffLayout.addWidget(self.diffLabel)
+        diffLayout.addWidget(self.diffList)
+        listsLayout = QtGui.QHBoxLayout()
+        listsLayout.addWidget(self.snapshotList)
+        listsLayout.addLayout(diffLayout, 1)
+        layout = QtGui.QVBoxLayout()
+        layout.addLayout(listsLayout)
+        layout.addLayout(buttonsLayout)
+        self.setLayout(layout)
+
+        if self.snapshots:
+            self.snapshotList.setCurrentRow(0)
+        self.updateDiff()
+        self.setWindowTitle("History")
+        self.resize(800, 400)
+
+    def selectedSnapshots(self):
+        rows = sorted(index.row() for index in self.snapshotList.selectionModel().selectedRows())
+        return [self.snapshots[row] for row in rows]
+
+    # Device settings of a snapshot, or None if they can't be read
+    def settingsOf(self, snapshot):
+        if snapshot.digest not in self.loaded:
+            try:
+                self.loaded[snapshot.digest] = self.history.load(snapshot.digest)
+            except (IOError, OSError, ValueError) as e:
+                self.diffLabel.setText("Could not read the snapshot: {}".format(e))
+                return None
+        return self.loaded[snapshot.digest]
+
+    def updateDiff(self):
+        self.diffList.clear()
+        self.restoreBtn.setEnabled(False)
+        selected = self.selectedSnapshots()
+        if not selected:
+            self.diffLabel.setText("Select a snapshot to see what changed since, or two to compare them.")
+            return
+        if len(selected) > 2:
+            self.diffLabel.setText("Select at most two snapshots.")
+            return
+        # The list is newest first
+        older = self.settingsOf(selected[-1])
+        newer = self.settingsOf(selected[0]) if len(selected) == 2 else self.current
+        if older is None or newer is None:
+            return
+        lines = history.describeDiff(history.diffSettings(older, newer))
+        if len(selected) == 2:
+            self.diffLabel.setText("Changes between the two snapshots:")
+        else:
+            self.diffLabel.setText("Changes since this snapshot:")
+        self.diffList.addItems(lines or ["(no changes)"])
+        self.restoreBtn.setEnabled(len(selected) == 1 and len(lines) > 0 and self.canRestore)
+        if not self.canRestore:
+            self.restoreBtn.setToolTip("Apply or discard the pending changes and unsaved edits first.")
+
+    # (snapshot, its settings) to restore once the dialog was accepted
+    def restoreTarget(self):
+        snapshot = self.selectedSnapshots()[0]
+        return snapshot, self.settingsOf(snapshot)
@@ -0,0 +1,215 @@
+import sys, os, json, time, types, threading, collections
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+# Number of operations kept for the operations log; older ones are dropped (the Prometheus totals keep counting)
+CAPACITY = 500
+
+# One brsaneconfig3 process: exitCode is None if it could not be started, outputSize is in bytes
+CommandRecord = namedtuple('CommandRecord', ['argv', 'seconds', 'exitCode', 'outputSize'])
+# One backend call (queryDevices, addDevice, ...) and the processes it ran; the native backend runs none
+# seconds only counts time spent in the backend, not in whoever consumes a streamed query
+OperationRecord = namedtuple('OperationRecord', ['started', 'operation', 'backend', 'caller', 'seconds', 'error',
+                                                 'commands'])
+
+
+# Exit code of the last process an operation ran, or None
+def exitCode(record):
+    return record.commands[-1].exitCode if record.commands else None
+
+
+def outputSize(record):
+    return sum(command.outputSize for command in record.commands)
+
+
+# An operation that is still running on some thread
+class ActiveOperation:
+    def __init__(self, operation, backend, caller):
+        self.started = time.time()
+        self.operation = operation
+        self.backend = backend
+        self.caller = caller
+        self.seconds = 0.0
+        self.error = None
+        self.commands = []
+
+
+# Ring buffer of the most recent backend operations, so that slowness can be pinned on brsaneconfig3 or on the GUI
+# Operations may run on any thread; listeners are called on the thread that finished the operation
+class OperationLog:
+    def __init__(self, capacity = CAPACITY):
+        self.records = collections.deque(maxlen = capacity)
+        self.lock = threading.Lock()
+        self.listeners = []
+        # The operation being run and the caller reported for it, per thread
+        self.local = threading.local()
+        # Totals since startup for the Prometheus export
+        # (operation, backend, result) -> [count, seconds] and (option, exit code) -> [count, seconds, output bytes]
+        self.operationTotals = {}
+        self.commandTotals = {}
+
+    def addListener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    # Oldest first
+    def snapshot(self):
+        with self.lock:
+            return list(self.records)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    # Report calls made inside the block as coming from caller instead of the frame that made them, e.g. the code
+    # that queued a job on the CommandExecutor rather than the executor's worker
+    @contextmanager
+    def callerContext(self, caller):
+        previous = getattr(self.local, 'caller', None)
+        self.local.caller = caller
+        try:
+            yield
+        finally:
+            self.local.caller = previous
+
+    # "file.py:123 in function" for the first frame outside this module and brotherdevice.py, skipping depth frames
+    def callerOf(self, depth = 1):
+        frame = sys._getframe(depth + 1)
+        while frame is not None and os.path.basename(frame.f_code.co_filename).split('.')[0] in IGNORED_MODULES:
+            frame = frame.f_back
+        if frame is None:
+            return None
+        return "{}:{} in {}".format(os.path.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name)
+
+    # Run func(*args) as the named operation of the given backend
+    # Streamed results (generators) are wrapped, and the operation is recorded once they are exhausted or closed
+    def call(self, operation, backend, func, *args):
+        caller = getattr(self.local, 'caller', None) or self.callerOf()
+        active = ActiveOperation(operation, backend.name, caller)
+        try:
+            result = self.runAs(active, func, *args)
+        except BaseException:
+            self.finish(active)
+            raise
+        if isinstance(result, types.GeneratorType):
+            return self.track(active, result)
+        self.finish(active)
+        return result
+
+    def runAs(self, active, func, *args):
+        previous = getattr(self.local, 'active', None)
+        self.local.active = active
+        begin = time.time()
+        try:
+            return func(*args)
+        except StopIteration:
+            raise
+        except Exception as e:
+            active.error = str(e)
+            raise
+        finally:
+            active.seconds += time.time() - begin
+            self.local.active = previous
+
+    def track(self, active, iterator):
+        try:
+            while True:
+                try:
+                    item = self.runAs(active, next, iterator)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            self.finish(active)
+
+    # Called by the backends for every brsaneconfig3 process; belongs to the operation running on this thread
+    def command(self, argv, seconds, exitCode, outputSize):
+        record = CommandRecord(list(argv), seconds, exitCode, outputSize)
+        active = getattr(self.local, 'active', None)
+        if active is not None:
+            active.commands.append(record)
+        with self.lock:
+            totals = self.commandTotals.setdefault((argv[1] if len(argv) > 1 else '', exitCode), [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += outputSize
+
+    def finish(self, active):
+        record = OperationRecord(active.started, active.operation, active.backend, active.caller, active.seconds,
+                                 active.error, active.commands)
+        with self.lock:
+            self.records.append(record)
+            totals = self.operationTotals.setdefault(
+                (record.operation, record.backend, 'error' if record.error is not None else 'ok'), [0, 0.0])
+            totals[0] += 1
+            totals[1] += record.seconds
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(record)
+
+    def writeJSONLines(self, stream):
+        for record in self.snapshot():
+            stream.write(json.dumps(recordToDict(record), sort_keys = True) + "\n")
+
+    # Text exposition format, e.g. for node_exporter's textfile collector
+    def prometheusText(self):
+        with self.lock:
+            operationTotals = sorted(self.operationTotals.items())
+            commandTotals = sorted(self.commandTotals.items(), key = lambda item: (item[0][0], str(item[0][1])))
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("{}{{{}}} {}".format(name, ','.join('{}="{}"'.format(key, escapeLabel(labelValue))
+                                                                  for key, labelValue in labels), value))
+
+        metric('brsaneconfig_operations_total', 'counter', "Backend operations by result.",
+               [((('operation', op), ('backend', backend), ('result', result)), totals[0])
+                for (op, backend, result), totals in operationTotals])
+        metric('brsaneconfig_operation_seconds_total', 'counter', "Time spent in backend operations.",
+               [((('operation', op), ('backend', backend), ('result', result)), repr(totals[1]))
+                for (op, backend, result), totals in operationTotals])
+        metric('brsaneconfig_commands_total', 'counter', "brsaneconfig3 processes by option and exit code.",
+               [((('option', option), ('exit_code', 'none' if code is None else code)), totals[0])
+                for (option, code), totals in commandTotals])
+        metric('brsaneconfig_command_seconds_total', 'counter', "Time spent waiting for brsaneconfig3 processes.",
+               [((('option', option), ('exit_code', 'none' if code is None else code)), repr(totals[1]))
+                for (option, code), totals in commandTotals])
+        metric('brsaneconfig_command_output_bytes_total', 'counter', "Bytes printed by brsaneconfig3 processes.",
+               [((('option', option), ('exit_code', 'none' if code is None else code)), totals[2])
+                for (option, code), totals in commandTotals])
+        return "\n".join(lines) + "\n"
+
+    # JSON lines, or the Prometheus text format for files ending in .prom
+    def export(self, path):
+        with open(path, 'w') as f:
+            if path.endswith('.prom'):
+                f.write(self.prometheusText())
+            else:
+                self.writeJSONLines(f)
+
+
+# Modules whose frames are never reported as the caller of an operation
+IGNORED_MODULES = ('instrumentation', 'brotherdevice')
+
+
+def recordToDict(record):
+    return {'started': record.started, 'operation': record.operation, 'backend': record.backend,
+            'caller': record.caller, 'seconds': record.seconds, 'error': record.error,
+            'exitCode': exitCode(record), 'outputSize': outputSize(record),
+            'commands': [command._asdict() for command in record.commands]}
+
+
+def escapeLabel(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+OPERATIONS = OperationLog()
@@ -0,0 +1,137 @@
+import sys, csv, json
+
+from brotherdevice import BrotherDevice, BrotherError
+from addresses import validateIPs
+
+
+# Columns of an inventory file; exactly one of ip/node is set for each device
+FIELDS = ['name', 'model', 'ip', 'node']
+FORMATS = ['json', 'csv']
+# Invalid addresses listed in the error for an inventory, the rest are counted
+MAX_REPORTED = 10
+
+
+# Inventory row for a device
+def deviceToRow(device):
+    return {'name': device.name,
+            'model': device.model,
+            'ip': device.addr if device.usesIP else '',
+            'node': '' if device.usesIP else device.addr}
+
+
+# BrotherDevice for an inventory row, where is used to point at the offending entry in error messages
+# models is the set of supported model names, if the model should be checked against it
+def rowToDevice(row, where, models = None):
+    values = dict((field, (row.get(field) or '').strip()) for field in FIELDS)
+    if not values['name'] or len(values['name'].split()) != 1:
+        raise BrotherError("{}: the name must be a single word.".format(where))
+    if not values['model']:
+        raise BrotherError("{}: no model given for '{}'.".format(where, values['name']))
+    if models is not None and values['model'] not in models:
+        raise BrotherError("{}: unsupported model '{}' for '{}'.".format(where, values['model'], values['name']))
+    if bool(values['ip']) == bool(values['node']):
+        raise BrotherError("{}: give either an IP address or a node name for '{}'.".format(where, values['name']))
+    node = values['node']
+    # The "BRN_" prefix is optional in inventory files, same as in the GUI
+    if node.startswith('BRN_'):
+        node = node[len('BRN_'):]
+    if values['node'] and len(node.split()) != 1:
+        raise BrotherError("{}: the node name for '{}' must be a single word.".format(where, values['name']))
+    return BrotherDevice.fromDict({'devID': -1,
+                                   'name': values['name'],
+                                   'model': values['model'],
+                                   'usesIP': bool(values['ip']),
+                                   'addr': values['ip'] or node})
+
+
+# Guess the format from the file name, defaulting to JSON
+def guessFormat(path):
+    return 'csv' if path.lower().endswith('.csv') else 'json'
+
+
+# csv wants binary files on Python 2 and newline='' on Python 3
+def openForCSV(path, mode):
+    if sys.version_info[0] < 3:
+        return open(path, mode + 'b')
+    return open(path, mode, newline = '')
+
+
+def writeInventory(devices, f, fmt):
+    rows = [deviceToRow(device) for device in devices]
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writerow(dict((field, field) for field in FIELDS))
+        writer.writerows(rows)
+    else:
+        json.dump(rows, f, indent = 2, sort_keys = True)
+        f.write('\n')
+
+
+# List of BrotherDevice from an inventory file; duplicate names are rejected since brsaneconfig3 cannot hold them
+# IP addresses are validated together once every row has been read, so that one error lists all of the bad ones, and
+# are stored in canonical form; models is the list of supported model names, if models should be checked against it
+def readInventory(f, fmt, models = None):
+    if fmt == 'csv':
+        # Line 1 is the header
+        entries = [("line {}".format(i + 2), row) for i, row in enumerate(csv.DictReader(f))]
+    else:
+        try:
+            rows = json.load(f)
+        except ValueError as e:
+            raise BrotherError("Invalid JSON inventory.\n" + str(e))
+        if not isinstance(rows, list):
+            raise BrotherError("A JSON inventory must be a list of devices.")
+        entries = [("entry {}".format(i + 1), row) for i, row in enumerate(rows)]
+
+    supported = set(models) if models is not None else None
+    devices = []
+    seen = set()
+    located = []
+    for where, row in entries:
+        if not isinstance(row, dict):
+            raise BrotherError("{}: expected an object with the fields {}.".format(where, ', '.join(FIELDS)))
+        device = rowToDevice(row, where, supported)
+        if device.name in seen:
+            raise BrotherError("{}: duplicate name '{}'.".format(where, device.name))
+        seen.add(device.name)
+        devices.append(device)
+        if device.usesIP:
+            located.append((where, device))
+
+    addrs, errors = validateIPs([device.addr for where, device in located])
+    if errors:
+        lines = ["{}: {}".format(located[i][0], message) for i, message in errors[:MAX_REPORTED]]
+        if len(errors) > MAX_REPORTED:
+            lines.append("... and {} more.".format(len(errors) - MAX_REPORTED))
+        raise BrotherError("{} invalid IP address(es):\n{}".format(len(errors), "\n".join(lines)))
+    for (where, device), addr in zip(located, addrs):
+        device.addr = addr
+    return devices
+
+
+# Compare the configured devices with the wanted ones, by name
+# Returns (added, removed, modified) where modified holds (current, wanted) pairs; devices missing from wanted are only
+# reported as removed if removeMissing is True
+def diffDevices(current, wanted, removeMissing = True):
+    currentByName = dict((device.name, device) for device in current)
+    wantedNames = set(device.name for device in wanted)
+    added = []
+    modified = []
+    for device in wanted:
+        existing = currentByName.get(device.name)
+        if existing is None:
+            added.append(device)
+        elif not sameConfiguration(existing, device):
+            modified.append((existing, device))
+    removed = [device for device in current if device.name not in wantedNames] if removeMissing else []
+    return added, removed, modified
+
+
+# Like BrotherDevice.hasSameSettings(), but ignores the device number that brsaneconfig3 assigns
+def sameConfiguration(device, other):
+    return device.settings() == other.settings()
+
+
+# Removals and additions for BrotherDevice.applyChanges() (a modification is a removal followed by an addition)
+def diffOperations(added, removed, modified):
+    return removed + [current for current, wanted in modified], [wanted for current, wanted in modified] + added
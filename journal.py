@@ -0,0 +1,155 @@
+import os, json, time, errno, fcntl, threading
+from contextlib import contextmanager
+
+
+# Unlike the caches, the journal must survive a cache cleanup, so it lives in the state directory
+# Looked up on every use rather than on import, so that the benchmarks and tests can point $XDG_STATE_HOME elsewhere
+def stateDir():
+    return os.path.join(os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state'), 'brsaneconfig-gui')
+
+
+# Write-ahead log for multi-step edits (brsaneconfig3 can only remove and add, so a rename is two commands)
+# A batch is written as one "begin" line listing every intended removal and addition, then one "step" line per command
+# that completed and an "end" line; see BrotherDevice.recoverInterrupted() for what happens to batches without an end
+# Only begin and end are synced to disk, so a batch costs two fsyncs however many devices it touches; a lost step line
+# is harmless because recovery checks what brsaneconfig3 actually has before doing anything
+# Several processes (the GUI, cli.py, the daemon) share the journal: every read and write holds an flock on the file,
+# and a batch only counts as interrupted once the process that began it (its ID starts with the pid) has gone
+class Journal:
+    # path defaults to journal.jsonl in stateDir()
+    def __init__(self, path = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.counter = 0
+        # Batches begun by this process and not ended yet
+        self.running = set()
+
+    def journalFile(self):
+        return self.path or os.path.join(stateDir(), 'journal.jsonl')
+
+    # Record the intent to run a batch (device dicts, see BrotherDevice.toDict()) and return its ID
+    # Raises IOError/OSError if the journal can't be written, in which case nothing should be run
+    def begin(self, removals, additions):
+        with self.lock:
+            self.counter += 1
+            batchID = '{}-{}-{}'.format(os.getpid(), int(time.time() * 1000), self.counter)
+            self.running.add(batchID)
+        self.append({'type': 'begin', 'id': batchID, 'time': time.time(), 'removals': removals,
+                     'additions': additions}, sync = True)
+        return batchID
+
+    # op is 'remove' or 'add'
+    def step(self, batchID, op, name):
+        self.append({'type': 'step', 'id': batchID, 'op': op, 'name': name}, sync = False)
+
+    # outcome is 'committed', 'rolledBack' or 'failed' (could not be undone completely)
+    def end(self, batchID, outcome):
+        self.append({'type': 'end', 'id': batchID, 'outcome': outcome}, sync = True)
+        with self.lock:
+            self.running.discard(batchID)
+        self.checkpoint()
+
+    def append(self, entry, sync):
+        with self.lock:
+            path = self.journalFile()
+            makeDirectory(path)
+            with open(path, 'a') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                f.write(json.dumps(entry, sort_keys = True) + "\n")
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+
+    # Batches that were begun but never ended by a process that has gone, oldest first, as
+    # {'id', 'removals', 'additions', 'done'} dicts where done is the list of (op, name) steps that were recorded
+    # Batches still running here or in another process are left alone
+    def unfinished(self):
+        with self.lock:
+            try:
+                with open(self.journalFile()) as f:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+                    lines = f.read().splitlines()
+            except (IOError, OSError):
+                return []
+            running = set(self.running)
+        return [batch for batch in openBatches(lines)
+                if batch['id'] not in running and not processAlive(batch['id'])]
+
+    # Held while interrupted batches are recovered (see BrotherDevice.recoverInterrupted()), so that two processes
+    # starting at once don't both recover the same batch; on its own file, since the journal is written meanwhile
+    @contextmanager
+    def recovering(self):
+        path = self.journalFile() + '.lock'
+        try:
+            makeDirectory(path)
+            f = open(path, 'a')
+        except (IOError, OSError):
+            # Then nothing can have been journalled either
+            yield
+            return
+        with f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    # Empty the journal once nothing in it is still needed, so that it never grows beyond the batches in progress
+    # The check and the truncation happen under one lock, so that a batch another process begins meanwhile is kept
+    def checkpoint(self):
+        with self.lock:
+            try:
+                with open(self.journalFile(), 'r+') as f:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                    if openBatches(f.read().splitlines()):
+                        return
+                    f.seek(0)
+                    f.truncate()
+                    f.flush()
+                    os.fsync(f.fileno())
+            except (IOError, OSError):
+                pass
+
+
+def makeDirectory(path):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+
+# Batches in journal lines that have a begin but no end, in the order they were begun
+def openBatches(lines):
+    batches = {}
+    order = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # A line torn by a crash in the middle of a write
+            continue
+        if entry.get('type') == 'begin':
+            batches[entry['id']] = {'id': entry['id'], 'removals': entry['removals'],
+                                    'additions': entry['additions'], 'done': []}
+            order.append(entry['id'])
+        elif entry.get('type') == 'step' and entry.get('id') in batches:
+            batches[entry['id']]['done'].append((entry['op'], entry['name']))
+        elif entry.get('type') == 'end':
+            batches.pop(entry.get('id'), None)
+    return [batches[batchID] for batchID in order if batchID in batches]
+
+
+# Whether the process that began a batch is still running; a batch ID this process didn't begin but with its pid was
+# left by an earlier process that had the same pid
+def processAlive(batchID):
+    try:
+        pid = int(batchID.split('-')[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # EPERM: running as another user
+        return e.errno == errno.EPERM
+    return True
+
+
+JOURNAL = Journal()
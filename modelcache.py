@@ -0,0 +1,65 @@
+import os, json, tempfile
+
+from brotherdevice import BrotherDevice
+
+
+# The list of supported models only changes when the driver package is upgraded, so it is cached on disk instead of
+# being re-parsed and re-sorted on every launch
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'brsaneconfig-gui')
+CACHE_FILE = os.path.join(CACHE_DIR, 'models.json')
+
+
+# Identifies the model catalogue's source file (the brsaneconfig3 binary, or Brsane3.ini for the native backend); any
+# change (e.g. an upgrade of the driver package) invalidates the cache
+def sourceKey(path):
+    info = os.stat(path)
+    return {'path': path, 'mtime': info.st_mtime, 'size': info.st_size}
+
+
+# Return the cached list of model names, or None if there is no cache or it belongs to a different source
+def loadModels(cacheFile = CACHE_FILE, source = None):
+    source = source or BrotherDevice.backend.catalogueFile()
+    if source is None:
+        return None
+    try:
+        with open(cacheFile) as f:
+            cache = json.load(f)
+        if cache.get('key') != sourceKey(source):
+            return None
+        return cache['models']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        # Missing or corrupt cache, fall back to parsing the query output
+        return None
+
+
+# Write the model names to the cache; failures are ignored since the cache is only an optimization
+def saveModels(models, cacheFile = CACHE_FILE, source = None):
+    source = source or BrotherDevice.backend.catalogueFile()
+    if source is None:
+        return False
+    try:
+        key = sourceKey(source)
+    except OSError:
+        # The source went away since it was queried
+        return False
+    return writeJSON(cacheFile, {'key': key, 'models': models})
+
+
+# Write data to a temporary file and rename it so that a concurrent launch never reads a partial cache
+def writeJSON(path, data):
+    directory = os.path.dirname(path)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tempPath = tempfile.mkstemp(dir = directory, prefix = '.' + os.path.basename(path) + '-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.rename(tempPath, path)
+        except:
+            # Don't leave a partial file behind for every failed write
+            os.remove(tempPath)
+            raise
+        return True
+    except (IOError, OSError):
+        return False
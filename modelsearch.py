@@ -0,0 +1,111 @@
+import bisect
+
+
+# Search key for a model name: case and punctuation are ignored, so "mfc9440" finds "MFC-9440CN"
+def normalize(name):
+    return ''.join(c for c in name.lower() if c.isalnum())
+
+
+# Precomputed lookups over the supported model catalogue
+# Prefix matches use a sorted key list, substring matches a bigram/trigram index and fuzzy (subsequence) matches a
+# per-character index, so a search only looks at the names that can possibly match
+# The search indexes are built on the first search, so that startup only pays for the name -> position lookup
+class ModelSearchIndex(object):
+    def __init__(self, models):
+        # Display order (the catalogue is already sorted)
+        self.models = list(models)
+        self.positions = dict((name, i) for i, name in enumerate(self.models))
+        self.keys = None
+
+    def buildIndexes(self):
+        self.keys = [normalize(name) for name in self.models]
+        self.sortedKeys = sorted((key, i) for i, key in enumerate(self.keys))
+        # n-gram -> positions of the keys containing it, for n = 1, 2 and 3
+        self.grams = {}
+        for i, key in enumerate(self.keys):
+            for n in (1, 2, 3):
+                for j in range(len(key) - n + 1):
+                    self.grams.setdefault(key[j:j + n], set()).add(i)
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    # Row of the model in the catalogue, or -1 (same convention as QComboBox.findText())
+    def position(self, name):
+        return self.positions.get(name, -1)
+
+    # Model names matching query, best first: prefix matches, then substring matches, then fuzzy matches
+    def search(self, query, limit = 50):
+        query = normalize(query)
+        if not query:
+            return self.models[:limit]
+        if self.keys is None:
+            self.buildIndexes()
+        found = []
+        seen = set()
+
+        def collect(positions):
+            for i in positions:
+                if i not in seen and len(found) < limit:
+                    seen.add(i)
+                    found.append(i)
+
+        collect(self.prefixMatches(query, limit))
+        if len(found) < limit:
+            collect(self.substringMatches(query))
+        if len(found) < limit:
+            collect(self.fuzzyMatches(query))
+        return [self.models[i] for i in found]
+
+    def prefixMatches(self, query, limit):
+        matches = []
+        start = bisect.bisect_left(self.sortedKeys, (query,))
+        for key, i in self.sortedKeys[start:start + limit]:
+            if not key.startswith(query):
+                break
+            matches.append(i)
+        return matches
+
+    # Ordered by where the match starts, then by name
+    def substringMatches(self, query):
+        n = min(len(query), 3)
+        candidates = self.intersect(self.grams, [query[j:j + n] for j in range(len(query) - n + 1)])
+        matches = [(self.keys[i].find(query), i) for i in candidates]
+        return [i for offset, i in sorted(match for match in matches if match[0] >= 0)]
+
+    # Names containing the query's characters in order (e.g. "m9440" finds "MFC-9440CN"), tightest match first
+    def fuzzyMatches(self, query):
+        matches = []
+        for i in self.intersect(self.grams, set(query)):
+            span = subsequenceSpan(query, self.keys[i])
+            if span is not None:
+                matches.append((span, i))
+        return [i for span, i in sorted(matches)]
+
+    # Positions present under every one of the given index keys
+    def intersect(self, index, keys):
+        sets = [index.get(key, set()) for key in keys]
+        if not sets:
+            return set()
+        sets.sort(key = len)
+        return sets[0].intersection(*sets[1:])
+
+
+# Length of the shortest stretch of key that contains query as a subsequence, or None if it doesn't
+def subsequenceSpan(query, key):
+    best = None
+    start = key.find(query[0])
+    while start >= 0:
+        end = start
+        for c in query[1:]:
+            end = key.find(c, end + 1)
+            if end < 0:
+                return best
+        span = end - start + 1
+        if best is None or span < best:
+            best = span
+        start = key.find(query[0], start + 1)
+    return best
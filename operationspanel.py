@@ -0,0 +1,144 @@
+import time
+from PyQt4 import QtGui, QtCore
+
+from instrumentation import OPERATIONS, CAPACITY, exitCode, outputSize
+
+
+# Recent backend operations as table rows, newest last
+class OperationLogModel(QtCore.QAbstractTableModel):
+    COLUMNS = ['Time', 'Operation', 'Backend', 'Command', 'Exit', 'Output (bytes)', 'Backend (ms)',
+               'brsaneconfig3 (ms)', 'Caller', 'Error']
+
+    def __init__(self, records, parent = None):
+        super(OperationLogModel, self).__init__(parent)
+        self.records = list(records)
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent = QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(OperationLogModel.COLUMNS)
+
+    def headerData(self, section, orientation, role = QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return OperationLogModel.COLUMNS[section]
+        return QtCore.QVariant()
+
+    def data(self, index, role = QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid() or index.row() >= len(self.records):
+            return QtCore.QVariant()
+        record = self.records[index.row()]
+        column = index.column()
+        if column == 0:
+            return time.strftime('%H:%M:%S', time.localtime(record.started))
+        if column == 1:
+            return record.operation
+        if column == 2:
+            return record.backend
+        if column == 3:
+            return '; '.join(' '.join(command.argv) for command in record.commands)
+        if column == 4:
+            code = exitCode(record)
+            return '' if code is None else str(code)
+        if column == 5:
+            return str(outputSize(record)) if record.commands else ''
+        if column == 6:
+            return '{:.1f}'.format(record.seconds * 1000)
+        if column == 7:
+            if not record.commands:
+                return ''
+            return '{:.1f}'.format(sum(command.seconds for command in record.commands) * 1000)
+        if column == 8:
+            return record.caller or ''
+        return (record.error or '').replace('\n', ' ')
+
+    # Drops the oldest row once the log is full, like the ring buffer behind it
+    def appendRecord(self, record):
+        if len(self.records) >= CAPACITY:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, 0)
+            del self.records[0]
+            self.endRemoveRows()
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.records), len(self.records))
+        self.records.append(record)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.records = []
+        self.endResetModel()
+
+
+# Debug window listing the last brsaneconfig3/backend operations with their timings, with JSON lines and Prometheus
+# export; opened with Ctrl+Shift+L from the main window
+class OperationsPanel(QtGui.QDialog):
+    # Operations finish on the command thread, this carries them over to the GUI thread
+    recorded = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent = None):
+        super(OperationsPanel, self).__init__(parent)
+        self.model = OperationLogModel(OPERATIONS.snapshot(), self)
+        self.table = QtGui.QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+
+        self.recorded.connect(self.onRecorded)
+        # Kept so that the same object can be removed again
+        self.listener = self.recorded.emit
+        OPERATIONS.addListener(self.listener)
+
+        exportJSONBtn = QtGui.QPushButton("Export JSON Lines...")
+        exportJSONBtn.clicked.connect(lambda: self.export(False))
+        exportPrometheusBtn = QtGui.QPushButton("Export Prometheus...")
+        exportPrometheusBtn.clicked.connect(lambda: self.export(True))
+        clearBtn = QtGui.QPushButton("Clear")
+        clearBtn.clicked.connect(self.clearLog)
+        closeBtn = QtGui.QPushButton("Close")
+        closeBtn.clicked.connect(self.close)
+
+        buttonsLayout = QtGui.QHBoxLayout()
+        buttonsLayout.addWidget(exportJSONBtn)
+        buttonsLayout.addWidget(exportPrometheusBtn)
+        buttonsLayout.addStretch(1)
+        buttonsLayout.addWidget(clearBtn)
+        buttonsLayout.addWidget(closeBtn)
+        layout = QtGui.QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addLayout(buttonsLayout)
+        self.setLayout(layout)
+        self.setWindowTitle("Operations log")
+        self.resize(900, 400)
+
+    def onRecorded(self, record):
+        atBottom = self.table.verticalScrollBar().value() == self.table.verticalScrollBar().maximum()
+        self.model.appendRecord(record)
+        if atBottom:
+            self.table.scrollToBottom()
+
+    # The Prometheus totals are kept since startup; clearing only empties the list
+    def clearLog(self):
+        OPERATIONS.clear()
+        self.model.clear()
+
+    def export(self, prometheus):
+        if prometheus:
+            path = QtGui.QFileDialog.getSaveFileName(self, "Export metrics", "brsaneconfig.prom",
+                                                     "Prometheus text (*.prom)")
+        else:
+            path = QtGui.QFileDialog.getSaveFileName(self, "Export operations", "operations.jsonl",
+                                                     "JSON lines (*.jsonl)")
+        if not path:
+            return
+        try:
+            with open(str(path), 'w') as f:
+                if prometheus:
+                    f.write(OPERATIONS.prometheusText())
+                else:
+                    OPERATIONS.writeJSONLines(f)
+        except (IOError, OSError) as e:
+            QtGui.QMessageBox.warning(self, "Error", "Could not export the operations log.\n" + str(e))
+
+    # Stop listening once the main window goes away
+    def detach(self):
+        OPERATIONS.removeListener(self.listener)
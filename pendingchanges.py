@@ -0,0 +1,121 @@
+# Saves and deletes recorded against one device; only the state before the first edit and the latest state matter
+class PendingChange:
+    def __init__(self, device, original):
+        # The live BrotherDevice (its attributes always hold the latest saved values)
+        self.device = device
+        # Copy of the device as brsaneconfig3 knows it, or None if it was added in this session
+        self.original = original
+        self.deleted = False
+
+    # Nothing needs to run: added then deleted, or edited back to the original values
+    def isNoOp(self):
+        if self.original is None:
+            return self.deleted
+        return not self.deleted and self.device.hasSameSettings(self.original)
+
+    # Lines describing this change for the pending changes list
+    def describe(self):
+        if self.original is None:
+            return ['+ {}'.format(describeDevice(self.device))]
+        if self.deleted:
+            return ['- {}'.format(describeDevice(self.original))]
+        lines = ['~ {}'.format(self.original.name)]
+        for field, label in (('name', 'name'), ('model', 'model'), ('addr', 'address')):
+            old, new = getattr(self.original, field), getattr(self.device, field)
+            if field == 'addr':
+                old, new = describeAddress(self.original), describeAddress(self.device)
+            if old != new:
+                lines.append('    {}: {} -> {}'.format(label, old, new))
+        return lines
+
+
+# Edits made in the GUI that have not been applied yet
+# Every save/delete is recorded here instead of running brsaneconfig3 right away; apply() later collapses them into the
+# smallest set of removals and additions and runs that as one batch (see BrotherDevice.applyChanges())
+class PendingChanges:
+    def __init__(self):
+        # Insertion-ordered list of PendingChange, and the same changes indexed by device (compared by identity)
+        self.changes = []
+        self.byDevice = {}
+
+    def __len__(self):
+        return len([change for change in self.changes if not change.isNoOp()])
+
+    def changeFor(self, device, original):
+        change = self.byDevice.get(device)
+        if change is None:
+            change = PendingChange(device, original)
+            self.changes.append(change)
+            self.byDevice[device] = change
+        return change
+
+    # Record that device was saved; original is a copy from before the save, or None if the device has never been applied
+    def recordSave(self, device, original):
+        self.changeFor(device, original)
+
+    def recordDelete(self, device, original):
+        self.changeFor(device, original).deleted = True
+
+    # Removals run before additions so that renames into a freed name (or swapped names) work
+    # A removal and an addition of identical settings (e.g. a device deleted and then added again by hand) cancel out,
+    # since brsaneconfig3 would end up exactly where it started
+    def operations(self):
+        removals = []
+        additions = []
+        for change in self.changes:
+            if change.isNoOp():
+                continue
+            if change.original is not None:
+                removals.append(change.original)
+            if not change.deleted:
+                additions.append(change.device.copy())
+        removed = set(device.settings() for device in removals)
+        unchanged = removed.intersection(device.settings() for device in additions)
+        return ([device for device in removals if device.settings() not in unchanged],
+                [device for device in additions if device.settings() not in unchanged])
+
+    # Every name a queued change uses or will remove, i.e. the devices that queued changes are based on
+    def names(self):
+        names = set()
+        for change in self.changes:
+            if change.device.name:
+                names.add(change.device.name)
+            if change.original is not None:
+                names.add(change.original.name)
+        return names
+
+    # Forget the changes involving any of the names (e.g. to take someone else's version of those devices instead);
+    # returns the changes that were dropped
+    def discard(self, names):
+        dropped = [change for change in self.changes if change.device.name in names
+                   or (change.original is not None and change.original.name in names)]
+        for change in dropped:
+            self.changes.remove(change)
+            del self.byDevice[change.device]
+        return dropped
+
+    # (name, model, usesIP, addr) settings of the devices as brsaneconfig3 has them, given the devices shown in the
+    # list (which show the queued changes as if they were applied)
+    def appliedSettings(self, devices):
+        settings = [device.settings() for device in devices if not device.isNew and device not in self.byDevice]
+        settings.extend(change.original.settings() for change in self.changes if change.original is not None)
+        return settings
+
+    def describe(self):
+        lines = []
+        for change in self.changes:
+            if not change.isNoOp():
+                lines.extend(change.describe())
+        return lines
+
+    def clear(self):
+        self.changes = []
+        self.byDevice = {}
+
+
+def describeDevice(device):
+    return '{} ({}, {})'.format(device.name, device.model, describeAddress(device))
+
+
+def describeAddress(device):
+    return device.addr if device.usesIP else 'BRN_' + device.addr
@@ -0,0 +1,111 @@
+import time, socket, threading, collections
+from collections import namedtuple
+
+
+# TCP port Brother's network scanners listen on for scan jobs
+SCAN_PORT = 54921
+# Seconds per host; all hosts are probed at once, so a whole run takes about this long
+TIMEOUT = 2.0
+# Upper bound on simultaneous probes (one thread each)
+WORKERS = 256
+
+# Probe outcomes (UNKNOWN: not probed yet)
+UNKNOWN = 'unknown'
+REACHABLE = 'reachable'
+UNREACHABLE = 'unreachable'
+UNRESOLVED = 'unresolved'
+
+# key is the (usesIP, addr) pair that was probed, seconds how long the probe took, detail a human readable reason
+ProbeResult = namedtuple('ProbeResult', ['key', 'status', 'seconds', 'detail'])
+
+
+# Host name brsaneconfig3 uses for a node name (BrotherDevice.addr leaves out the BRN_ prefix)
+def nodeHostName(addr):
+    return 'BRN_' + addr
+
+
+# Try to open a TCP connection to the scan port; returns (status, detail)
+def connect(host, port, timeout):
+    try:
+        connection = socket.create_connection((host, port), timeout)
+    except socket.timeout:
+        return UNREACHABLE, "timed out"
+    except socket.gaierror as e:
+        return UNRESOLVED, "could not resolve {}: {}".format(host, e.args[-1])
+    except (socket.error, OSError) as e:
+        return UNREACHABLE, e.strerror or str(e)
+    connection.close()
+    return REACHABLE, "port {} open".format(port)
+
+
+# Check one configured address: IP addresses are connected to directly, node names have to resolve first
+# Name resolution has no timeout of its own, so a slow resolver can make a node name probe take longer than timeout
+def probe(usesIP, addr, port = SCAN_PORT, timeout = TIMEOUT):
+    begin = time.time()
+    if usesIP:
+        status, detail = connect(addr, port, timeout)
+    else:
+        host = nodeHostName(addr)
+        try:
+            resolved = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4][0]
+        except (socket.gaierror, socket.error) as e:
+            status, detail = UNRESOLVED, "could not resolve {}: {}".format(host, e.args[-1])
+        else:
+            status, detail = connect(resolved, port, timeout)
+            detail = "{} is {}, {}".format(host, resolved, detail)
+    return ProbeResult((usesIP, addr), status, time.time() - begin, detail)
+
+
+# Call func on every item from up to workers threads, passing each result to onResult (on the worker thread) as soon
+# as it is ready; returns the results in completion order
+# Items that have not started when cancelled is set are skipped, and the results of those still running are dropped
+def runConcurrently(items, func, workers = WORKERS, onResult = None, cancelled = None):
+    remaining = collections.deque(items)
+    results = []
+    lock = threading.Lock()
+
+    def work():
+        while cancelled is None or not cancelled.is_set():
+            try:
+                item = remaining.popleft()
+            except IndexError:
+                return
+            result = func(item)
+            if cancelled is not None and cancelled.is_set():
+                return
+            with lock:
+                results.append(result)
+            if onResult is not None:
+                onResult(result)
+
+    threads = [threading.Thread(target = work) for i in range(min(workers, len(remaining)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# Probes every configured device at once; call probeAll() from a background thread and cancel() from anywhere
+class Prober:
+    def __init__(self, port = SCAN_PORT, timeout = TIMEOUT, workers = WORKERS):
+        self.port = port
+        self.timeout = timeout
+        self.workers = workers
+        self.cancelled = threading.Event()
+
+    # devices are BrotherDevice objects; devices sharing an address are only probed once
+    def probeAll(self, devices, onResult = None):
+        keys = []
+        seen = set()
+        for device in devices:
+            key = (device.usesIP, device.addr)
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+        return runConcurrently(keys, lambda key: probe(key[0], key[1], self.port, self.timeout), self.workers,
+                               onResult, self.cancelled)
+
+    def cancel(self):
+        self.cancelled.set()
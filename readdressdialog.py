@@ -0,0 +1,100 @@
+from PyQt4 import QtGui, QtCore
+
+import bulkedit
+
+
+# Asks for an address rewrite (see bulkedit.IPRewrite and NodeRewrite) for the selected devices, previewing what each
+# of them would become while the patterns are typed
+class ReaddressDialog(QtGui.QDialog):
+    # devicesAt looks up the devices at an address, to skip moves onto an address that is taken (see
+    # bulkedit.rewriteItems())
+    def __init__(self, devices, devicesAt = None, parent = None):
+        super(ReaddressDialog, self).__init__(parent)
+        self.devices = devices
+        self.devicesAt = devicesAt
+        self.items = []
+        self.skipped = []
+
+        self.ipRadio = QtGui.QRadioButton("IP addresses")
+        self.nodeRadio = QtGui.QRadioButton("Node names")
+        self.fromEdit = QtGui.QLineEdit()
+        self.toEdit = QtGui.QLineEdit()
+        self.errorLabel = QtGui.QLabel()
+        self.preview = QtGui.QListWidget()
+        self.okBtn = QtGui.QPushButton("Change Addresses")
+        cancelBtn = QtGui.QPushButton("Cancel")
+
+        self.ipRadio.toggled.connect(self.onTypeChanged)
+        self.fromEdit.textEdited.connect(self.updatePreview)
+        self.toEdit.textEdited.connect(self.updatePreview)
+        self.okBtn.clicked.connect(self.accept)
+        cancelBtn.clicked.connect(self.reject)
+
+        typeLayout = QtGui.QHBoxLayout()
+        typeLayout.addWidget(self.ipRadio)
+        typeLayout.addWidget(self.nodeRadio)
+        typeLayout.addStretch(1)
+        grid = QtGui.QGridLayout()
+        grid.addWidget(QtGui.QLabel("Change:"), 0, 0)
+        grid.addLayout(typeLayout, 0, 1)
+        grid.addWidget(QtGui.QLabel("From:"), 1, 0)
+        grid.addWidget(self.fromEdit, 1, 1)
+        grid.addWidget(QtGui.QLabel("To:"), 2, 0)
+        grid.addWidget(self.toEdit, 2, 1)
+        buttonsLayout = QtGui.QHBoxLayout()
+        buttonsLayout.addStretch(1)
+        buttonsLayout.addWidget(cancelBtn)
+        buttonsLayout.addWidget(self.okBtn)
+        layout = QtGui.QVBoxLayout()
+        layout.addLayout(grid)
+        layout.addWidget(self.errorLabel)
+        layout.addWidget(self.preview)
+        layout.addLayout(buttonsLayout)
+        self.setLayout(layout)
+
+        self.errorLabel.setStyleSheet("QLabel { color: red; }")
+        # Start with the kind of address most of the devices have
+        usingIP = len([device for device in devices if device.usesIP])
+        if usingIP * 2 >= len(devices):
+            self.ipRadio.setChecked(True)
+        else:
+            self.nodeRadio.setChecked(True)
+        self.onTypeChanged()
+        self.setWindowTitle("Change addresses of {} device(s)".format(len(devices)))
+        self.resize(450, 350)
+
+    def onTypeChanged(self):
+        if self.ipRadio.isChecked():
+            self.fromEdit.setPlaceholderText("e.g. 10.1.x.y")
+            self.toEdit.setPlaceholderText("e.g. 10.2.x.y")
+        else:
+            self.fromEdit.setPlaceholderText("e.g. * or OFFICE*")
+            self.toEdit.setPlaceholderText("e.g. {name} or LAB*")
+        self.updatePreview()
+
+    def updatePreview(self):
+        self.preview.clear()
+        self.items = []
+        self.skipped = []
+        self.errorLabel.setText('')
+        self.okBtn.setEnabled(False)
+        fromPattern = str(self.fromEdit.text())
+        toPattern = str(self.toEdit.text())
+        if not fromPattern or not toPattern:
+            return
+        try:
+            rewrite = (bulkedit.IPRewrite if self.ipRadio.isChecked() else bulkedit.NodeRewrite)(fromPattern, toPattern)
+        except ValueError as e:
+            self.errorLabel.setText(str(e))
+            return
+        self.items, self.skipped = bulkedit.rewriteItems(self.devices, rewrite, self.devicesAt)
+        self.preview.addItems([bulkedit.describeItem(item) for item in self.items])
+        for result in self.skipped:
+            item = QtGui.QListWidgetItem(bulkedit.describeResult(result))
+            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEnabled)
+            self.preview.addItem(item)
+        self.okBtn.setEnabled(len(self.items) > 0)
+
+    # (items to run, SKIPPED results) for the accepted patterns
+    def plan(self):
+        return self.items, self.skipped
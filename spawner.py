@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+
+import os, sys, json, errno, signal, threading, subprocess
+
+
+# Largest piece of output read or forwarded at once
+CHUNK_SIZE = 65536
+HELPER_SCRIPT = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+# Every command runs in a session (and process group) of its own, so that a timeout also kills whatever it started:
+# if brsaneconfig3 is a wrapper script, its children hold the output pipe open after the script itself is killed
+if sys.version_info[0] >= 3:
+    SESSION_OPTIONS = {'start_new_session': True}
+else:
+    SESSION_OPTIONS = {'preexec_fn': os.setsid}
+
+
+# Runs brsaneconfig3 for the subprocess backend
+# Forking the GUI to run a command copies the page tables of the whole Python + Qt process, so the cost of every
+# command grows with the GUI's memory. start() launches a small helper process (this script) while the process is
+# still small; commands are then forked from the helper and their output is passed back through a pipe. Without the
+# helper (not started, or it died) commands are spawned directly, which recent Pythons do with vfork
+class Spawner:
+    def __init__(self):
+        self.helper = None
+        # The helper says "R" once it is serving; read before the first command rather than slowing down start()
+        self.ready = False
+        # One command at a time goes through the helper's pipes
+        self.lock = threading.Lock()
+
+    # Call before importing anything large (see gui.py); does nothing if the helper can't be started
+    def start(self):
+        if self.helper is not None:
+            return
+        try:
+            self.helper = subprocess.Popen([sys.executable, HELPER_SCRIPT], stdin = subprocess.PIPE,
+                                           stdout = subprocess.PIPE, bufsize = -1, close_fds = True)
+        except (OSError, ValueError):
+            self.helper = None
+
+    # The helper exits once its stdin is closed
+    def stop(self):
+        with self.lock:
+            if self.helper is not None:
+                self.helper.stdin.close()
+                self.helper.wait()
+                self.helper = None
+
+    # Run argv and yield its output line by line; once the output ends, status gets 'returnCode' (negative if it was
+    # killed) and 'timedOut' (killed after timeout seconds)
+    # Raises OSError if argv could not be started
+    def stream(self, argv, timeout, status):
+        with self.lock:
+            for line in splitLines(self.chunks(argv, timeout, status)):
+                yield line
+
+    def chunks(self, argv, timeout, status):
+        if self.helper is not None and not self.ready:
+            # Failed to start (e.g. the script is missing)
+            self.ready = self.helper.stdout.readline() == b'R\n'
+            if not self.ready:
+                self.helper = None
+        if self.helper is None or self.helper.poll() is not None:
+            return runLocal(argv, timeout, status)
+        try:
+            request = json.dumps({'argv': argv, 'timeout': timeout}) + '\n'
+            self.helper.stdin.write(request.encode('utf-8'))
+            self.helper.stdin.flush()
+        except (IOError, OSError):
+            self.helper = None
+            return runLocal(argv, timeout, status)
+        return self.remoteChunks(status)
+
+    # Reply frames: "D <size>" followed by that many bytes of output, then "X <return code> <timed out>" or
+    # "E <errno> <message>" if the command could not be started
+    def remoteChunks(self, status):
+        done = False
+        try:
+            while True:
+                header = self.helper.stdout.readline().decode('utf-8').split(' ', 2)
+                if header[0] == 'D':
+                    yield self.helper.stdout.read(int(header[1]))
+                elif header[0] == 'X':
+                    done = True
+                    status['returnCode'] = int(header[1])
+                    status['timedOut'] = header[2].strip() == '1'
+                    return
+                elif header[0] == 'E':
+                    done = True
+                    raise OSError(int(header[1]), header[2].strip())
+                else:
+                    # The helper died; later commands are spawned directly
+                    done = True
+                    self.helper = None
+                    raise OSError(errno.EPIPE, "The command helper exited unexpectedly.")
+        finally:
+            # Stopped reading early, the rest of this reply has to be read before the next command
+            if not done and self.helper is not None:
+                for chunk in self.remoteChunks(status):
+                    pass
+
+
+# Run argv in this process and yield its output in chunks as it arrives; see Spawner.stream() for status
+def runLocal(argv, timeout, status):
+    # Python 2 would encode unicode arguments as ASCII
+    argv = [arg.encode('utf-8') if not isinstance(arg, str) else arg for arg in argv]
+    try:
+        with open(os.devnull, 'rb') as devnull:
+            # stdin is not inherited, in the helper it is the request pipe
+            process = subprocess.Popen(argv, stdin = devnull, stdout = subprocess.PIPE, close_fds = True,
+                                       **SESSION_OPTIONS)
+    except ValueError:
+        raise OSError(errno.EINVAL, "Invalid arguments passed to Popen.")
+    timedOut = threading.Event()
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, killOnTimeout, (process, timedOut))
+        timer.daemon = True
+        timer.start()
+    try:
+        for chunk in iter(lambda: os.read(process.stdout.fileno(), CHUNK_SIZE), b''):
+            yield chunk
+    finally:
+        # If the reader stopped early, the command gets SIGPIPE instead of waiting for someone to read the rest; a
+        # command that hangs is still killed by the timer
+        process.stdout.close()
+        status['returnCode'] = process.wait()
+        if timer is not None:
+            timer.cancel()
+        status['timedOut'] = timedOut.is_set()
+
+
+# The whole process group is killed, also when the command itself has already exited but something it started still
+# holds the output open; until the command is waited for, its group ID can't belong to anyone else
+def killOnTimeout(process, timedOut):
+    if process.returncode is None:
+        timedOut.set()
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+# Lines (with their newline) of the output in chunks
+def splitLines(chunks):
+    partial = b''
+    for chunk in chunks:
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if partial:
+        yield partial
+
+
+# The helper: run one request per line of stdin until it is closed, replying on stdout (see Spawner.remoteChunks())
+def serve():
+    # Ctrl+C in the terminal reaches the whole process group; the helper ends when the GUI does
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    requests = os.fdopen(0, 'rb')
+    replies = os.fdopen(1, 'wb')
+    try:
+        replies.write(b'R\n')
+        replies.flush()
+        for line in iter(requests.readline, b''):
+            serveRequest(json.loads(line.decode('utf-8')), replies)
+    except (IOError, OSError):
+        # The GUI went away
+        pass
+
+
+def serveRequest(request, replies):
+    status = {}
+    try:
+        for chunk in runLocal(request['argv'], request['timeout'], status):
+            replies.write(('D {}\n'.format(len(chunk))).encode('utf-8') + chunk)
+            replies.flush()
+    except OSError as e:
+        if e.errno == errno.EPIPE:
+            raise
+        message = (e.strerror or str(e)).replace('\n', ' ')
+        replies.write('E {} {}\n'.format(e.errno or 0, message).encode('utf-8'))
+    else:
+        replies.write('X {} {}\n'.format(status['returnCode'], int(status['timedOut'])).encode('utf-8'))
+    replies.flush()
+
+
+SPAWNER = Spawner()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,107 @@
+import sys, time, threading, traceback
+from collections import namedtuple
+
+
+# Default for --profile-threshold, in milliseconds
+THRESHOLD = 200
+# Stack samples kept per stall; while the event loop stays blocked the GUI thread is sampled once per threshold
+MAX_SAMPLES = 5
+# Innermost frames kept in each sample
+STACK_DEPTH = 20
+
+# A stretch of time the event loop did not run: when it started (time.time()), for how many seconds, and samples of
+# the GUI thread's stack taken meanwhile (traceback.extract_stack() entries, innermost last; empty if it ended before
+# the watchdog looked)
+Stall = namedtuple('Stall', ['started', 'seconds', 'samples'])
+
+
+# Notices when the GUI's event loop is blocked, e.g. by a slot like onDevicePressed() or saveHelper() that takes too
+# long, and records what the GUI thread was doing at the time
+# The event loop calls beat() every interval seconds from a timer (see gui.py); a thread of the watchdog's own checks
+# that the beats keep coming and samples the GUI thread's stack when they don't
+class StallWatchdog:
+    # Create on the GUI thread, which is the one that gets sampled
+    def __init__(self, threshold = THRESHOLD / 1000.0):
+        self.threshold = threshold
+        # Beats come this often when the loop is idle, so a gap longer than threshold + interval is a stall
+        self.interval = threshold / 4
+        self.threadID = threading.current_thread().ident
+        self.lastBeat = time.time()
+        # Samples of the stall in progress, or None, and when the next one is due
+        self.samples = None
+        self.nextSample = 0.0
+        self.stalls = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.lastBeat = time.time()
+        self.thread = threading.Thread(target = self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # A stall still in progress (e.g. a hang while the window closes) is kept, up to now
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            self.endStall(time.time())
+
+    # Called from the event loop; ends the stall in progress, including one that was too short for the watchdog's
+    # thread to catch
+    def beat(self):
+        now = time.time()
+        with self.lock:
+            self.endStall(now)
+            self.lastBeat = now
+
+    # Call with the lock held
+    def endStall(self, now):
+        blocked = now - self.lastBeat - self.interval
+        if self.samples is not None or blocked > self.threshold:
+            self.stalls.append(Stall(self.lastBeat + self.interval, blocked, self.samples or []))
+        self.samples = None
+
+    def run(self):
+        while not self.stopped.wait(self.interval / 2):
+            with self.lock:
+                now = time.time()
+                if now - self.lastBeat - self.interval <= self.threshold:
+                    continue
+                if self.samples is None:
+                    self.samples = []
+                    self.nextSample = now
+                if now >= self.nextSample and len(self.samples) < MAX_SAMPLES:
+                    self.samples.append(self.sample())
+                    self.nextSample = now + self.threshold
+
+    # Where the GUI thread is right now
+    def sample(self):
+        frame = sys._current_frames().get(self.threadID)
+        if frame is None:
+            return []
+        return [tuple(entry) for entry in traceback.extract_stack(frame, STACK_DEPTH)]
+
+    # Print the stalls, longest first; samples that are the same as the one before are only printed once
+    def report(self, stream):
+        with self.lock:
+            stalls = sorted(self.stalls, key = lambda stall: -stall.seconds)
+        stream.write("Event loop stalls over {:.0f} ms: {}\n".format(self.threshold * 1000, len(stalls)))
+        for stall in stalls:
+            stream.write("\n{:.1f} ms, from {}\n".format(stall.seconds * 1000, time.strftime(
+                '%H:%M:%S', time.localtime(stall.started))))
+            if not stall.samples:
+                stream.write("  (ended before a stack sample was taken)\n")
+            previous = None
+            for i, sample in enumerate(stall.samples):
+                if sample == previous:
+                    stream.write("  Sample {}: same as above\n".format(i + 1))
+                    continue
+                stream.write("  Sample {}, after {:.0f} ms:\n".format(i + 1, (self.threshold * (i + 1)) * 1000))
+                for line in ''.join(traceback.format_list(sample)).splitlines():
+                    stream.write("  " + line + "\n")
+                previous = sample
+        stream.flush()
@@ -0,0 +1,65 @@
+import sys, time, threading
+from contextlib import contextmanager
+
+
+# Wall-clock time spent in each startup phase (imports, query, parsing, widgets, ...)
+# Phases are always timed since it costs next to nothing; the report is only printed when --startup-profile is given
+class StartupProfile:
+    def __init__(self):
+        # The first import of this module is as close to process start as we can get without help from the interpreter
+        self.start = time.time()
+        self.enabled = False
+        # Budget for the whole startup in milliseconds, or None
+        self.budget = None
+        self.finished = False
+        # Phase names in the order they were first seen, and their accumulated seconds
+        self.order = []
+        self.seconds = {}
+        # The query phase runs on the command thread
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            if name not in self.seconds:
+                self.order.append(name)
+                self.seconds[name] = 0.0
+            self.seconds[name] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        begin = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - begin)
+
+    # Wrap func so that every call is recorded as the given phase
+    def timed(self, name, func):
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    # Call once the window is fully populated; prints the report (once) if profiling is enabled
+    # Returns False if the startup went over budget
+    def finish(self, stream = None):
+        if self.finished:
+            return True
+        self.finished = True
+        total = (time.time() - self.start) * 1000
+        if self.enabled:
+            self.report(total, stream or sys.stderr)
+        return self.budget is None or total <= self.budget
+
+    def report(self, total, stream):
+        stream.write("Startup profile (ms):\n")
+        for name in self.order:
+            stream.write("  {:<12} {:9.1f}\n".format(name, self.seconds[name] * 1000))
+        stream.write("  {:<12} {:9.1f}".format('total', total))
+        if self.budget is not None:
+            stream.write("  (budget {}, {})".format(self.budget, 'ok' if total <= self.budget else 'OVER BUDGET'))
+        stream.write("\n")
+        stream.flush()
+
+
+PROFILE = StartupProfile()
@@ -0,0 +1,84 @@
+import os, sys, json
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import fakebrsaneconfig3
+from brotherdevice import BrotherDevice, NativeBackend, SubprocessBackend
+
+
+MODELS = ['DCP-7065DN', 'MFC-9440CN', 'MFC-L2710DW']
+# (name, model, usesIP, addr), as brsaneconfig3 stores them
+DEVICES = [('office', 'MFC-9440CN', True, '192.168.1.10'),
+           ('lab', 'DCP-7065DN', False, '000BA1'),
+           ('desk', 'MFC-L2710DW', True, '192.168.1.12')]
+
+
+def makeDevice(name, model = 'MFC-9440CN', usesIP = True, addr = '192.168.1.99'):
+    device = BrotherDevice()
+    device.isNew = False
+    device.name, device.model, device.usesIP, device.addr = name, model, usesIP, addr
+    return device
+
+
+# brsaneconfig3 replaced by benchmarks/fakebrsaneconfig3.py, keeping its devices in a JSON store
+class FakeConfig:
+    def __init__(self, directory):
+        self.binDir = os.path.join(directory, 'bin')
+        os.mkdir(self.binDir)
+        self.executable = os.path.join(self.binDir, 'brsaneconfig3')
+        self.writeExecutable('')
+        self.store = os.path.join(directory, 'store.json')
+        self.setDevices(DEVICES)
+        # Only used for the model catalogue and to notice changes; the fake doesn't write it
+        self.configDir = os.path.join(directory, 'sane')
+        os.mkdir(self.configDir)
+
+    # extra is shell code run after the fake with "$1" being the operation, e.g. to make a command hang
+    def writeExecutable(self, extra):
+        with open(self.executable, 'w') as f:
+            f.write('#!/bin/sh\n"{}" "{}" "$@"\nstatus=$?\n{}\nexit $status\n'.format(
+                sys.executable, fakebrsaneconfig3.__file__.replace('.pyc', '.py'), extra))
+        os.chmod(self.executable, 0o755)
+
+    def devices(self):
+        with open(self.store) as f:
+            return [tuple(device) for device in json.load(f)['devices']]
+
+    def setDevices(self, devices):
+        fakebrsaneconfig3.writeStore(self.store, MODELS, [list(device) for device in devices])
+
+
+# Journal and history in a temporary state directory
+@pytest.fixture
+def stateDir(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_STATE_HOME', str(tmpdir.join('state')))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('cache')))
+    return str(tmpdir.join('state'))
+
+
+# The subprocess backend, running the fake brsaneconfig3
+@pytest.fixture
+def fake(tmpdir, monkeypatch, stateDir):
+    config = FakeConfig(str(tmpdir))
+    monkeypatch.setenv('PATH', config.binDir + os.pathsep + os.environ.get('PATH', ''))
+    monkeypatch.setenv(fakebrsaneconfig3.STORE_VARIABLE, config.store)
+    monkeypatch.setattr(BrotherDevice, 'backend', SubprocessBackend(config.configDir))
+    return config
+
+
+# The native backend, on config files in a temporary directory
+@pytest.fixture
+def native(tmpdir, monkeypatch, stateDir):
+    configDir = str(tmpdir.join('sane'))
+    os.mkdir(configDir)
+    with open(os.path.join(configDir, 'Brsane3.ini'), 'w') as f:
+        f.write('[Driver]\nversion=0.2.13\n\n[Support Model]\n')
+        f.write(''.join('0x{:04x},1,1,"{}"\n'.format(i + 1, model) for i, model in enumerate(MODELS)))
+    backend = NativeBackend(configDir)
+    backend.applyBatch([], [makeDevice(*device) for device in DEVICES])
+    monkeypatch.setattr(BrotherDevice, 'backend', backend)
+    return backend
@@ -0,0 +1,46 @@
+import pytest
+
+from addresses import addressKey, ipError, normalizeIP, validateIPs
+from editstate import addressError, fieldValues
+from tests.conftest import makeDevice
+
+
+def testNormalizeIPStripsLeadingZeros():
+    assert normalizeIP('010.000.000.005') == '10.0.0.5'
+    assert normalizeIP(' 192.168.1.10 ') == '192.168.1.10'
+
+
+@pytest.mark.parametrize('text', ['256.1.1.1', '1.2.3', 'printer', '1.2.3.4.5', ''])
+def testNormalizeIPRejectsInvalidAddresses(text):
+    with pytest.raises(ValueError):
+        normalizeIP(text)
+
+
+def testIPv6IsUnderstoodButNotUsable():
+    pytest.importorskip('ipaddress')
+    assert normalizeIP('FE80:0::1') == 'fe80::1'
+    assert ipError('fe80::1') == "brsaneconfig3 only supports IPv4 addresses."
+
+
+def testValidateIPsReportsPositions():
+    normalized, errors = validateIPs(['10.0.0.1', '10.0.0.01', '300.0.0.1', '10.0.0.1'])
+    assert normalized == ['10.0.0.1', '10.0.0.1', None, '10.0.0.1']
+    assert [position for position, message in errors] == [2]
+
+
+def testAddressKeyMatchesEquivalentAddresses():
+    assert addressKey(True, '010.000.000.005') == addressKey(True, '10.0.0.5')
+    assert addressKey(False, 'brn_00aa') == addressKey(False, 'BRN_00AA')
+    assert addressKey(True, '10.0.0.5') != addressKey(False, '10.0.0.5')
+
+
+def testAddressErrorNamesTheOwner():
+    owners = {addressKey(True, '10.0.0.5'): 'office'}
+    values = fieldValues(makeDevice('desk', addr = '10.0.0.005'))
+    assert addressError(values, owners.get) == "office already uses this address."
+    assert addressError(fieldValues(makeDevice('desk', addr = '10.0.0.6')), owners.get) is None
+
+
+def testAddressErrorChecksTheFields():
+    assert addressError(fieldValues(makeDevice('desk', addr = '10.0..5'))) == "You must enter a full IP address."
+    assert addressError(fieldValues(makeDevice('desk', usesIP = False, addr = ''))) == "You must enter a node name."
@@ -0,0 +1,155 @@
+import pytest
+
+import brotherdevice
+from brotherdevice import (BrotherDevice, BrotherError, CommandTimeout, ConflictError, DeviceRecord, ModelRecord,
+                           ParseWarning, checkGeneration, configToken, iterQueryOutput, mergeBatch, parseQueryOutput)
+from instrumentation import OPERATIONS
+from journal import JOURNAL
+from tests.conftest import DEVICES, makeDevice
+
+
+def testIterQueryOutputYieldsModelsDevicesAndWarnings():
+    lines = [b'  0 "MFC-9440CN"\n', b'  1\n', b'oops "X" "Y"\n', b'Devices on network\n',
+             b'  0 office "MFC-9440CN" I:192.168.1.10\n', b'  1 lab "DCP-7065DN" N:BRN_000BA1\n', b'  2 broken\n']
+    records = list(iterQueryOutput(lines))
+    assert records[0] == ModelRecord('0', 'MFC-9440CN')
+    assert isinstance(records[1], ParseWarning) and records[1].lineNumber == 3
+    assert records[2] == DeviceRecord('0', 'office', 'MFC-9440CN', True, '192.168.1.10')
+    assert records[3] == DeviceRecord('1', 'lab', 'DCP-7065DN', False, '000BA1')
+    assert isinstance(records[4], ParseWarning) and records[4].lineNumber == 7
+
+
+def testIterQueryOutputWarnsAboutMissingHeader():
+    records = list(iterQueryOutput(['  0 "MFC-9440CN"']))
+    assert records[-1] == ParseWarning(None, '', "the 'Devices on network' header is missing after 1 lines")
+
+
+def testIterQueryOutputRejectsUsage():
+    with pytest.raises(BrotherError):
+        list(iterQueryOutput(['USAGE : brsaneconfig3 -q']))
+
+
+def testParseQueryOutputSortsModelsAndCollectsWarnings():
+    warnings = []
+    models, devices = parseQueryOutput(['  0 "MFC-9440CN"', '  1 "DCP-7065DN"', 'Devices on network',
+                                        '  0 office "MFC-9440CN" I:192.168.1.10', '  1 broken'], warnings = warnings)
+    assert models == ['DCP-7065DN', 'MFC-9440CN']
+    assert [device.settings() for device in devices] == [DEVICES[0]]
+    assert [warning.lineNumber for warning in warnings] == [5]
+
+
+def testMergeBatchRunsStepsNobodyElseTouched():
+    old, new = makeDevice('office', addr = '10.0.0.1'), makeDevice('office', addr = '10.0.0.2')
+    removals, additions, conflicts = mergeBatch([old], [new], {'office': old.settings()})
+    assert (removals, additions, conflicts) == ([old], [new], [])
+
+
+def testMergeBatchSkipsChangesAlreadyMade():
+    old, new = makeDevice('office', addr = '10.0.0.1'), makeDevice('office', addr = '10.0.0.2')
+    assert mergeBatch([old], [new], {'office': new.settings()}) == ([], [], [])
+
+
+def testMergeBatchReportsConflicts():
+    old, new = makeDevice('office', addr = '10.0.0.1'), makeDevice('office', addr = '10.0.0.2')
+    theirs = makeDevice('office', addr = '10.0.0.3').settings()
+    removals, additions, conflicts = mergeBatch([old], [new], {'office': theirs})
+    assert (removals, additions) == ([], [])
+    assert [(conflict.name, conflict.base, conflict.ours, conflict.theirs) for conflict in conflicts] == \
+        [('office', old.settings(), new.settings(), theirs)]
+
+
+def testMergeBatchPreferringOursReplacesTheirs():
+    old, new = makeDevice('office', addr = '10.0.0.1'), makeDevice('office', addr = '10.0.0.2')
+    theirs = makeDevice('office', addr = '10.0.0.3').settings()
+    removals, additions, conflicts = mergeBatch([old], [new], {'office': theirs}, preferOurs = True)
+    assert [device.settings() for device in removals] == [theirs]
+    assert additions == [new] and conflicts == []
+
+
+def testMergeBatchKeepsTheBatchOrder():
+    added = [makeDevice(name) for name in ('zeta', 'alpha', 'mid')]
+    removals, additions, conflicts = mergeBatch([], added, {})
+    assert additions == added
+
+
+def testCheckGenerationPassesBatchThroughWhenUnchanged(native):
+    token = configToken(native.deviceFile)
+    removals = [makeDevice(*DEVICES[0])]
+    assert checkGeneration(native.deviceFile, token, removals, []) == (removals, [])
+
+
+def testCheckGenerationMergesUnrelatedOutsideChanges(native):
+    token = configToken(native.deviceFile)
+    native.applyBatch([makeDevice(*DEVICES[1])], [])
+    old = makeDevice(*DEVICES[0])
+    new = makeDevice(DEVICES[0][0], addr = '10.9.9.9')
+    assert checkGeneration(native.deviceFile, token, [old], [new]) == ([old], [new])
+
+
+def testCheckGenerationRaisesOnConflict(native):
+    token = configToken(native.deviceFile)
+    old = makeDevice(*DEVICES[0])
+    theirs = makeDevice(DEVICES[0][0], addr = '10.8.8.8')
+    native.applyBatch([old], [theirs])
+    with pytest.raises(ConflictError) as info:
+        checkGeneration(native.deviceFile, token, [old], [makeDevice(DEVICES[0][0], addr = '10.9.9.9')])
+    assert info.value.current == {DEVICES[0][0]: theirs.settings()}
+    assert info.value.token == configToken(native.deviceFile)
+
+
+def testApplyChangesReturnsTheTokenOfItsOwnWrite(native):
+    token = BrotherDevice.applyChanges([makeDevice(*DEVICES[0])], [], reason = None)[2]
+    assert token == configToken(native.deviceFile)
+    native.applyBatch([makeDevice(*DEVICES[1])], [])
+    assert token != configToken(native.deviceFile)
+
+
+def testApplyChangesThroughTheFake(fake):
+    old = makeDevice(*DEVICES[0])
+    renamed = makeDevice('office2', *DEVICES[0][1:])
+    assert BrotherDevice.applyChanges([old], [renamed])[:2] == ([old], [renamed])
+    assert fake.devices() == DEVICES[1:] + [renamed.settings()]
+
+
+def testFailedBatchIsRolledBack(fake):
+    # The second addition reuses a name that is still taken, so the whole batch is undone
+    with pytest.raises(BrotherError):
+        BrotherDevice.applyChanges([makeDevice(*DEVICES[0])],
+                                   [makeDevice('new', 'MFC-9440CN'), makeDevice(DEVICES[1][0], 'MFC-9440CN')])
+    assert sorted(fake.devices()) == sorted(DEVICES)
+
+
+def testTimedOutStepThatWasMadeContinuesTheBatch(fake, monkeypatch):
+    monkeypatch.setattr(brotherdevice, 'COMMAND_TIMEOUT', 1.0)
+    # Adds are made, then hang
+    fake.writeExecutable('[ "$1" = "-a" ] && sleep 10')
+    old = makeDevice(*DEVICES[0])
+    renamed = makeDevice('office2', *DEVICES[0][1:])
+    BrotherDevice.applyChanges([old], [renamed], reason = None)
+    assert fake.devices() == DEVICES[1:] + [renamed.settings()]
+
+
+def testTimedOutStepThatCannotBeCheckedIsUndoneOnTheNextStart(fake, monkeypatch):
+    monkeypatch.setattr(brotherdevice, 'COMMAND_TIMEOUT', 1.0)
+    # The add is made, but neither it nor the query that would check it returns
+    fake.writeExecutable('if [ "$1" = "-a" ] || [ "$1" = "-q" ]; then sleep 10; fi')
+    with pytest.raises(CommandTimeout) as error:
+        BrotherDevice.applyChanges([], [makeDevice('new')], reason = None)
+    assert "may or may not have been applied; it will be checked on the next start" in str(error.value)
+    assert "Could not undo" not in str(error.value)
+
+    # As if the program had been started again
+    fake.writeExecutable('')
+    JOURNAL.running.clear()
+    assert BrotherDevice.recoverInterrupted() == ["Finished an interrupted change to new."]
+    assert fake.devices() == list(DEVICES)
+
+
+def testReplaceDeviceReportsWhetherItChangedAnything(fake):
+    device = makeDevice(*DEVICES[0])
+    OPERATIONS.clear()
+    assert BrotherDevice.replaceDevice(device, device.copy()) is False
+    # Not even a process was started
+    assert OPERATIONS.snapshot() == []
+    assert BrotherDevice.replaceDevice(device, makeDevice(DEVICES[0][0], addr = '10.1.1.1')) is True
+    assert fake.devices() == DEVICES[1:] + [(DEVICES[0][0], 'MFC-9440CN', True, '10.1.1.1')]
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+import bulkedit
+from addresses import addressKey
+from bulkedit import IPRewrite, NodeRewrite, rewriteItems, runBulk
+from history import HISTORY
+from tests.conftest import DEVICES, makeDevice
+
+
+# devicesAt() over a list of devices, like DeviceModel.devicesAt()
+def addressIndex(devices):
+    index = {}
+    for device in devices:
+        index.setdefault(addressKey(device.usesIP, device.addr), []).append(device)
+    return lambda usesIP, addr: index.get(addressKey(usesIP, addr), [])
+
+
+def testIPRewriteCopiesCapturedParts():
+    rewrite = IPRewrite('10.1.x.y', '10.2.x.y')
+    assert rewrite.apply(makeDevice('a', addr = '10.1.3.4')) == '10.2.3.4'
+    assert rewrite.apply(makeDevice('a', addr = '10.3.3.4')) is None
+    assert rewrite.apply(makeDevice('a', usesIP = False, addr = 'X')) is None
+
+
+def testIPRewriteNeedsTheSameNumberForTheSameName():
+    rewrite = IPRewrite('10.x.x.y', '10.0.0.y')
+    assert rewrite.apply(makeDevice('a', addr = '10.5.5.1')) == '10.0.0.1'
+    assert rewrite.apply(makeDevice('a', addr = '10.5.6.1')) is None
+
+
+@pytest.mark.parametrize('fromPattern, toPattern', [('10.1.x', '10.2.x.y'), ('10.1.x.y', '10.2.x.z')])
+def testIPRewriteRejectsBadPatterns(fromPattern, toPattern):
+    with pytest.raises(ValueError):
+        IPRewrite(fromPattern, toPattern)
+
+
+def testNodeRewrite():
+    assert NodeRewrite('OFFICE*', 'LAB*').apply(makeDevice('a', usesIP = False, addr = 'OFFICE12')) == 'LAB12'
+    assert NodeRewrite('*', '{name}').apply(makeDevice('desk', usesIP = False, addr = 'X')) == 'desk'
+
+
+def testRewrittenAddressesAreNormalized():
+    items, skipped = rewriteItems([makeDevice('a', addr = '010.001.000.005')], IPRewrite('10.1.x.y', '10.2.x.y'))
+    assert [item.updated.addr for item in items] == ['10.2.0.5']
+
+
+def testMovesOntoTakenAddressesAreSkipped():
+    staying = makeDevice('staying', addr = '10.2.0.7')
+    moving = [makeDevice('a', addr = '10.1.0.5'), makeDevice('b', addr = '10.1.0.7')]
+    items, skipped = rewriteItems(moving, IPRewrite('10.1.x.y', '10.2.x.y'), addressIndex(moving + [staying]))
+    assert [item.device.name for item in items] == ['a']
+    assert [(result.item.device.name, result.detail) for result in skipped] == \
+        [('b', "10.2.0.7: staying already uses this address")]
+
+
+def testTwoMovesOntoTheSameAddressKeepTheFirst():
+    moving = [makeDevice('a', addr = '10.1.0.5'), makeDevice('b', addr = '10.1.0.6')]
+    items, skipped = rewriteItems(moving, IPRewrite('10.1.0.y', '10.2.0.1'), addressIndex(moving))
+    assert [item.device.name for item in items] == ['a']
+    assert [result.item.device.name for result in skipped] == ['b']
+
+
+def testAddressVacatedByASkippedMoveIsNotReused():
+    # e may take f's address only if f moves, but f's target is taken
+    e = makeDevice('e', addr = '10.1.0.8')
+    f = makeDevice('f', addr = '10.1.0.9')
+    g = makeDevice('g', addr = '10.2.0.9')
+
+    class Rewrite:
+        def apply(self, device):
+            return {'e': '10.1.0.9', 'f': '10.2.0.9'}[device.name]
+
+    items, skipped = rewriteItems([e, f], Rewrite(), addressIndex([e, f, g]))
+    assert items == []
+    assert sorted(result.item.device.name for result in skipped) == ['e', 'f']
+
+
+def testRunBulkAppliesEachItemAndStopsWhenCancelled(fake):
+    devices = [makeDevice(*device) for device in DEVICES]
+    items = bulkedit.deletionItems(devices)
+    cancelled = threading.Event()
+    progress = []
+
+    def onProgress(done, total):
+        progress.append((done, total))
+        if done == 2:
+            cancelled.set()
+
+    results = runBulk(items, None, onProgress, cancelled, list(DEVICES))
+    assert [result.status for result in results] == [bulkedit.DONE, bulkedit.DONE, bulkedit.CANCELLED]
+    assert progress == [(1, 3), (2, 3)]
+    assert fake.devices() == [DEVICES[2]]
+    assert bulkedit.summarize(results) == "2 done, 1 cancelled"
+    # One snapshot for the whole job
+    snapshot, = HISTORY.snapshots()
+    assert (snapshot.reason, HISTORY.load(snapshot.digest)) == ("bulk changes", [DEVICES[2]])
@@ -0,0 +1,34 @@
+import os
+
+from brotherdevice import configToken
+from configwatch import DeviceFileTracker, fileSignature
+from tests.conftest import DEVICES, makeDevice
+
+
+def testNothingIsReportedForAnUnchangedFile(native):
+    tracker = DeviceFileTracker(native.deviceFile)
+    tracker.reset()
+    assert tracker.update() is None
+    assert tracker.token == configToken(native.deviceFile)
+
+
+def testOnlyTheChangedDevicesAreReported(native):
+    tracker = DeviceFileTracker(native.deviceFile)
+    tracker.reset()
+    edited = makeDevice(DEVICES[0][0], addr = '10.1.1.1')
+    native.applyBatch([makeDevice(*DEVICES[0]), makeDevice(*DEVICES[1])], [edited, makeDevice('new')])
+    delta = tracker.update()
+    assert delta.removed == ['lab']
+    assert [(record.name, record.addr) for record in delta.changed] == [('office', '10.1.1.1'), ('new', '192.168.1.99')]
+    assert delta.names == ['desk', 'office', 'new']
+    assert tracker.token == configToken(native.deviceFile)
+
+
+def testMissingFileIsNotReportedAsEmpty(native):
+    tracker = DeviceFileTracker(native.deviceFile)
+    tracker.reset()
+    os.rename(native.deviceFile, native.deviceFile + '.old')
+    assert fileSignature(native.deviceFile) is None
+    assert tracker.update() is None
+    os.rename(native.deviceFile + '.old', native.deviceFile)
+    assert tracker.update() is None
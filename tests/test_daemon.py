@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from brotherdevice import ConflictError, DaemonBackend, configToken, parseQueryOutput
+from daemon import DeviceService, Server
+from history import HISTORY
+from tests.conftest import DEVICES, makeDevice
+
+
+@pytest.fixture
+def service(native):
+    service = DeviceService(native)
+    service.writer.call(service.load)
+    return service
+
+
+def settingsOf(lines):
+    return [device.settings() for device in parseQueryOutput(lines, parseModels = False)[1]]
+
+
+def testChangesPatchTheCachedDevices(service, native):
+    assert service.handle({'op': 'add', 'device': makeDevice('new').toDict()}) == {}
+    edited = makeDevice(DEVICES[0][0], addr = '10.1.1.1')
+    assert service.handle({'op': 'replace', 'previous': makeDevice(*DEVICES[0]).toDict(),
+                           'device': edited.toDict()}) == {}
+    assert service.handle({'op': 'remove', 'name': 'lab'}) == {}
+    # The native backend edits in place, the cache keeps the same order
+    assert settingsOf(service.query()) == settingsOf(native.query())
+    assert settingsOf(service.query())[0] == edited.settings()
+    assert [snapshot.reason for snapshot in HISTORY.snapshots()] == ["added new", "changed office", "removed lab"]
+
+
+def testChangeMadeBehindTheDaemonsBackIsPickedUp(service, native):
+    native.applyBatch([makeDevice(*DEVICES[1])], [])
+    assert settingsOf(service.query()) == [DEVICES[0], DEVICES[2]]
+
+
+def testConflictsAndErrorsAreReplies(service, native):
+    token = configToken(native.deviceFile)
+    native.applyBatch([makeDevice(*DEVICES[0])], [makeDevice(DEVICES[0][0], addr = '10.8.8.8')])
+    reply = service.handle({'op': 'applyBatch', 'removals': [makeDevice(*DEVICES[0]).toDict()],
+                            'additions': [makeDevice(DEVICES[0][0], addr = '10.9.9.9').toDict()], 'token': token})
+    assert ConflictError.fromDict(reply['conflict']).current == {'office': (DEVICES[0][0], 'MFC-9440CN', True,
+                                                                            '10.8.8.8')}
+    assert 'error' in service.handle({'op': 'remove', 'name': 'nobody'})
+    assert service.handle({'op': 'explode'}) == {'error': "Unknown request 'explode'."}
+    assert service.handle({'op': 'add'})['error'].startswith("Invalid request")
+
+
+def testClientsTalkToTheDaemonOverItsSocket(service, native, tmpdir):
+    path = str(tmpdir.join('daemon.sock'))
+    server = Server(path, service)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        client = DaemonBackend(path, tmpdir.strpath)
+        removals, additions, token = client.applyBatch([makeDevice(*DEVICES[1])], [makeDevice('new')],
+                                                       configToken(native.deviceFile))
+        assert [device.name for device in removals + additions] == ['lab', 'new']
+        assert token == configToken(native.deviceFile)
+        assert settingsOf(client.query()) == settingsOf(native.query())
+        assert client.catalogueFile() == native.modelFile
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,18 @@
+from brotherdevice import BrotherDevice
+from devicecache import loadSnapshot, saveSnapshot
+from tests.conftest import DEVICES, makeDevice
+
+
+def testSnapshotRoundTrip(tmpdir):
+    snapshotFile = str(tmpdir.join('cache', 'devices.json'))
+    assert loadSnapshot(snapshotFile) is None
+    assert saveSnapshot([makeDevice(*device).toDict() for device in DEVICES], snapshotFile)
+    assert [BrotherDevice.fromDict(values).settings() for values in loadSnapshot(snapshotFile)] == DEVICES
+
+
+def testUnusableSnapshotIsIgnored(tmpdir):
+    snapshotFile = tmpdir.join('devices.json')
+    snapshotFile.write('[{"name": ')
+    assert loadSnapshot(str(snapshotFile)) is None
+    snapshotFile.write('{"name": "office"}')
+    assert loadSnapshot(str(snapshotFile)) is None
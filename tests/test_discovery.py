@@ -0,0 +1,101 @@
+import socket, threading
+
+import pytest
+
+import discovery
+from discovery import Discovery, matchModel, parseNetwork, snmpGetRequest, snmpResponseString
+from modelsearch import ModelSearchIndex
+from reachability import REACHABLE, UNREACHABLE
+from tests.conftest import MODELS
+
+DEVICE_ID = 'MFG:Brother;CMD:PJL;MDL:MFC-9440CN;CLS:PRINTER;'
+
+
+# GetResponse to a request made by snmpGetRequest(), with value as an OCTET STRING
+def snmpResponse(request, value, errorStatus = 0):
+    request = bytearray(request)
+    message = discovery.berElement(request, 0)[1]
+    version = discovery.berElement(message, 0)
+    community = discovery.berElement(message, version[2])
+    pdu = discovery.berElement(message, community[2])[1]
+    requestID = discovery.berElement(pdu, 0)
+    varbind = discovery.ber(0x30, discovery.berOID(discovery.DEVICE_ID_OID) +
+                            discovery.ber(0x04, bytearray(value.encode('latin-1'))))
+    response = discovery.ber(0xa2, discovery.ber(0x02, requestID[1]) + discovery.berInteger(errorStatus) +
+                             discovery.berInteger(0) + discovery.ber(0x30, varbind))
+    return bytes(discovery.ber(0x30, discovery.berInteger(0) + discovery.ber(0x04, bytearray(b'public')) + response))
+
+
+@pytest.fixture
+def scanner():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(5)
+    agent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    agent.bind(('127.0.0.1', 0))
+    agent.settimeout(5)
+
+    def answer():
+        try:
+            request, sender = agent.recvfrom(4096)
+        except (socket.error, OSError):
+            return
+        agent.sendto(snmpResponse(request, DEVICE_ID), sender)
+
+    thread = threading.Thread(target = answer)
+    thread.daemon = True
+    thread.start()
+    yield server.getsockname()[1], agent.getsockname()[1]
+    server.close()
+    agent.close()
+
+
+def testParseNetworkLeavesOutNetworkAndBroadcast():
+    assert parseNetwork('192.168.1.0/30') == ['192.168.1.1', '192.168.1.2']
+    assert parseNetwork('192.168.1.77/31') == ['192.168.1.76', '192.168.1.77']
+    assert parseNetwork('10.0.0.5') == ['10.0.0.5']
+    assert len(parseNetwork('10.1.2.3/16')) == 65534
+
+
+@pytest.mark.parametrize('cidr', ['10.1/24', '10.0.0.300/24', '10.0.0.0/33', '10.0.0.0/x', '10.0.0.0/15'])
+def testParseNetworkRejects(cidr):
+    with pytest.raises(ValueError):
+        parseNetwork(cidr)
+
+
+def testSweepFindsListeningHostsAndAsksForTheirModel(scanner):
+    port, snmpPort = scanner
+    sweep = Discovery(port = port, timeout = 2, snmpPort = snmpPort)
+    # Only 127.0.0.1 listens, the rest of 127.0.0.0/8 refuses
+    results = dict((host.addr, host) for host in sweep.sweep(['127.0.0.1', '127.0.0.2']))
+    assert results['127.0.0.1'].status == REACHABLE
+    assert results['127.0.0.1'].model == 'MFC-9440CN'
+    assert (results['127.0.0.2'].status, results['127.0.0.2'].model) == (UNREACHABLE, None)
+
+
+def testSnmpResponseMustMatchTheRequest():
+    request = snmpGetRequest(discovery.DEVICE_ID_OID, 1234)
+    assert snmpResponseString(snmpResponse(request, DEVICE_ID), 1234) == DEVICE_ID
+    assert snmpResponseString(snmpResponse(request, DEVICE_ID), 4321) is None
+    # noSuchName
+    assert snmpResponseString(snmpResponse(request, DEVICE_ID, errorStatus = 2), 1234) is None
+    with pytest.raises(ValueError):
+        snmpResponseString(snmpResponse(request, DEVICE_ID)[:-5], 1234)
+
+
+def testReportedModelIsMatchedToTheCatalogue():
+    index = ModelSearchIndex(MODELS)
+    assert matchModel('Brother MFC-9440CN', index) == 'MFC-9440CN'
+    assert matchModel('MFC-L2710', index) == 'MFC-L2710DW'
+    assert matchModel('', index) == ''
+    assert matchModel(None, index) == ''
+
+
+def testNewDevicesGetUnusedNames():
+    taken = set(['MFC-9440CN-10-0-0-5'])
+    devices = discovery.newDevices([('10.0.0.5', 'MFC-9440CN'), ('10.0.0.5', 'MFC-9440CN'),
+                                    ('10.0.0.6', 'DCP-7065DN')], lambda name: name in taken)
+    assert [device.settings() for device in devices] == [('MFC-9440CN-10-0-0-5-2', 'MFC-9440CN', True, '10.0.0.5'),
+                                                         ('MFC-9440CN-10-0-0-5-3', 'MFC-9440CN', True, '10.0.0.5'),
+                                                         ('DCP-7065DN-10-0-0-6', 'DCP-7065DN', True, '10.0.0.6')]
+    assert all(device.isNew for device in devices)
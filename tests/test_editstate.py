@@ -0,0 +1,50 @@
+from editstate import EditState, addressError, fieldValues, groupErrors, nameError
+from tests.conftest import DEVICES, MODELS, makeDevice
+
+
+def testFieldValuesSplitTheAddress():
+    values = fieldValues(makeDevice(*DEVICES[0]))
+    assert [values[field] for field in ('name', 'usesIP', 'ip0', 'ip3', 'node')] == ['office', True, '192', '10', '']
+    assert fieldValues(makeDevice(*DEVICES[1]))['node'] == '000BA1'
+    assert fieldValues(None)['ip0'] == ''
+
+
+def testTypingBackTheOriginalValueIsNotAnEdit():
+    state = EditState()
+    state.reset(makeDevice(*DEVICES[0]))
+    state.setField('ip3', '11')
+    assert state.isDirty() and state.dirtyFields() == ['ip3']
+    state.setField('ip3', '10')
+    assert not state.isDirty()
+
+
+def testOnlyTheSelectedAddressTypeCounts():
+    state = EditState()
+    state.reset(makeDevice(*DEVICES[0]))
+    # The node box of an IP device is ignored until the type changes
+    state.setField('node', '000BA1')
+    assert not state.isDirty()
+    state.setField('usesIP', False)
+    assert state.isDirty()
+
+
+def testChecks():
+    taken = lambda name: name == 'lab'
+    assert nameError('new', taken) is None
+    assert nameError('lab', taken) == "A device with that name already exists."
+    assert nameError('my lab', taken) == "The name cannot contain whitespace."
+    values = fieldValues(makeDevice('new', addr = '10.0.0.300'))
+    assert groupErrors(['name', 'model', 'address'], values, taken, set(MODELS)) == \
+        {'address': addressError(values)}
+    values['model'] = 'XYZ-1'
+    assert set(groupErrors(['model'], values, taken, set(MODELS))) == set(['model'])
+
+
+def testAddressOfAnotherDeviceIsAnError():
+    values = fieldValues(makeDevice('new', addr = '192.168.1.10'))
+    owners = {(True, '192.168.1.10'): 'office'}
+    assert addressError(values, owners.get) == "office already uses this address."
+    values = fieldValues(makeDevice('new', usesIP = False, addr = '000bA1'))
+    assert addressError(values, {(False, '000ba1'): 'lab'}.get) == "lab already uses this address."
+    values['node'] = '000 BA1'
+    assert addressError(values) == "The node name cannot contain whitespace."
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import history
+from brotherdevice import BrotherDevice
+from history import HISTORY, History, describeDiff, diffSettings, restoreOperations
+from tests.conftest import DEVICES, makeDevice
+
+
+def testIdenticalConfigurationIsRecordedOnce(tmpdir):
+    snapshots = History(str(tmpdir))
+    assert snapshots.record(DEVICES, 'loaded') is not None
+    assert snapshots.record(list(reversed(DEVICES)), 'applied changes') is None
+    assert [snapshot.reason for snapshot in snapshots.snapshots()] == ['loaded']
+
+
+def testSnapshotsShareStoredConfigurations(tmpdir):
+    snapshots = History(str(tmpdir))
+    first = snapshots.record(DEVICES, 'a')
+    snapshots.record(DEVICES[:1], 'b')
+    third = snapshots.record(DEVICES, 'c')
+    assert first.digest == third.digest
+    assert len(os.listdir(str(tmpdir.join('objects')))) == 2
+    assert snapshots.load(first.digest) == sorted(DEVICES)
+
+
+def testCorruptSnapshotIsRejected(tmpdir):
+    snapshots = History(str(tmpdir))
+    snapshot = snapshots.record(DEVICES, 'a')
+    other = snapshots.record(DEVICES[:1], 'b')
+    os.rename(str(tmpdir.join('objects', other.digest)), str(tmpdir.join('objects', snapshot.digest)))
+    with pytest.raises(IOError):
+        snapshots.load(snapshot.digest)
+
+
+def testOldSnapshotsArePruned(tmpdir, monkeypatch):
+    monkeypatch.setattr(history, 'MAX_SNAPSHOTS', 3)
+    snapshots = History(str(tmpdir))
+    for i in range(5):
+        snapshots.record(DEVICES[:i % 3 + 1], str(i))
+    assert [snapshot.reason for snapshot in snapshots.snapshots()] == ['2', '3', '4']
+    assert sorted(os.listdir(str(tmpdir.join('objects')))) == \
+        sorted(set(snapshot.digest for snapshot in snapshots.snapshots()))
+
+
+def testDiffMatchesDevicesByName():
+    changed = ('office', 'MFC-9440CN', True, '192.168.1.50')
+    added = ('new', 'DCP-7065DN', True, '192.168.1.60')
+    diff = diffSettings(DEVICES, [changed, DEVICES[2], added])
+    assert diff.added == [added]
+    assert diff.removed == [DEVICES[1]]
+    assert diff.changed == [(DEVICES[0], changed)]
+    assert describeDiff(diff) == ['+ new: DCP-7065DN at 192.168.1.60', '- lab: DCP-7065DN at BRN_000BA1',
+                                  '~ office: MFC-9440CN at 192.168.1.10 -> MFC-9440CN at 192.168.1.50']
+
+
+def testRestoreOnlyTouchesDevicesThatDiffer():
+    changed = ('office', 'MFC-9440CN', True, '192.168.1.50')
+    removals, additions = restoreOperations([changed, DEVICES[1], DEVICES[2]], DEVICES)
+    assert removals == [changed]
+    assert additions == [DEVICES[0]]
+
+
+def testChangeIsWorkedOutFromTheLatestSnapshot(tmpdir):
+    snapshots = History(str(tmpdir))
+    assert snapshots.recordChange([], [DEVICES[0]], 'added office') is None
+    snapshots.record(DEVICES[1:], 'loaded')
+    changed = ('desk', 'MFC-L2710DW', True, '192.168.1.50')
+    snapshot = snapshots.recordChange([DEVICES[2]], [changed], 'changed desk')
+    assert snapshots.load(snapshot.digest) == sorted([DEVICES[1], changed])
+
+
+def testChangesMadeThroughBrotherDeviceAreRecorded(fake):
+    BrotherDevice.applyChanges([makeDevice(*DEVICES[0])], [], reason = "removed office", base = DEVICES)
+    BrotherDevice.applyChanges([], [makeDevice('new')], reason = "added new")
+    snapshots = HISTORY.snapshots()
+    assert [(snapshot.reason, snapshot.count) for snapshot in snapshots] == [("removed office", 2), ("added new", 3)]
+    assert HISTORY.load(snapshots[-1].digest) == sorted(fake.devices())
+
+
+def testDaemonRecordsWhatItChanged(fake):
+    from daemon import DeviceService
+    service = DeviceService(BrotherDevice.backend)
+    service.load()
+    device = makeDevice('new')
+    service.writer.call(service.change, BrotherDevice.addDevice, (device,), set(), [device], False, "added new")
+    snapshots = HISTORY.snapshots()
+    assert [snapshot.reason for snapshot in snapshots] == ["added new"]
+    assert HISTORY.load(snapshots[0].digest) == sorted(fake.devices())
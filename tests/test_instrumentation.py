@@ -0,0 +1,81 @@
+import io, json
+
+import pytest
+
+from brotherdevice import BrotherDevice, BrotherError
+from instrumentation import OPERATIONS, OperationLog, escapeLabel
+from tests.conftest import makeDevice
+
+
+class Backend:
+    name = 'test'
+
+
+def testCallRecordsTheCommandsItRan():
+    log = OperationLog()
+    seen = []
+    log.addListener(seen.append)
+
+    def add():
+        log.command(['brsaneconfig3', '-a', 'name=office'], 0.25, 0, 12)
+        return 'done'
+
+    assert log.call('addDevice', Backend(), add) == 'done'
+    record, = log.snapshot()
+    assert seen == [record]
+    assert (record.operation, record.backend, record.error) == ('addDevice', 'test', None)
+    assert record.commands[0].argv == ['brsaneconfig3', '-a', 'name=office']
+    assert record.caller.startswith('test_instrumentation.py:')
+
+
+def testFailedCallKeepsTheError():
+    log = OperationLog()
+
+    def fail():
+        raise BrotherError("Could not add device.")
+
+    with pytest.raises(BrotherError):
+        log.call('addDevice', Backend(), fail)
+    assert log.snapshot()[0].error == "Could not add device."
+
+
+def testStreamedResultIsRecordedOnceConsumed():
+    log = OperationLog()
+
+    def lines():
+        log.command(['brsaneconfig3', '-q'], 0.1, 0, 4)
+        yield 'a'
+        yield 'b'
+
+    stream = log.call('queryDevices', Backend(), lines)
+    assert log.snapshot() == []
+    assert list(stream) == ['a', 'b']
+    assert len(log.snapshot()[0].commands) == 1
+
+
+def testOnlyTheLatestOperationsAreKept():
+    log = OperationLog(capacity = 2)
+    for operation in ('a', 'b', 'c'):
+        log.call(operation, Backend(), lambda: None)
+    assert [record.operation for record in log.snapshot()] == ['b', 'c']
+    # The totals still count everything
+    assert 'brsaneconfig_operations_total{operation="a",backend="test",result="ok"} 1' in log.prometheusText()
+
+
+def testExports():
+    log = OperationLog()
+    log.call('addDevice', Backend(), lambda: log.command(['brsaneconfig3', '-a'], 0.5, None, 0))
+    stream = io.StringIO()
+    log.writeJSONLines(stream)
+    entry = json.loads(stream.getvalue())
+    assert (entry['operation'], entry['exitCode'], entry['outputSize']) == ('addDevice', None, 0)
+    assert 'brsaneconfig_commands_total{option="-a",exit_code="none"} 1' in log.prometheusText()
+    assert escapeLabel('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def testBackendCallsAreRecorded(fake):
+    OPERATIONS.clear()
+    BrotherDevice.addDevice(makeDevice('new'))
+    record = OPERATIONS.snapshot()[-1]
+    assert (record.operation, record.backend) == ('addDevice', 'subprocess')
+    assert [command.argv[1] for command in record.commands] == ['-a']
@@ -0,0 +1,82 @@
+import io, json
+
+import pytest
+
+import cli
+import inventory
+from brotherdevice import BrotherError
+from tests.conftest import DEVICES, MODELS, makeDevice
+
+
+def row(name = 'office', model = 'MFC-9440CN', ip = '', node = ''):
+    return {'name': name, 'model': model, 'ip': ip, 'node': node}
+
+
+def testRowToDeviceAcceptsEitherAddress():
+    assert inventory.rowToDevice(row(ip = ' 10.0.0.1 '), 'entry 1').settings() == \
+        ('office', 'MFC-9440CN', True, '10.0.0.1')
+    assert inventory.rowToDevice(row(node = 'BRN_000BA1'), 'entry 1').settings() == \
+        ('office', 'MFC-9440CN', False, '000BA1')
+
+
+@pytest.mark.parametrize('values, message', [
+    (row(name = 'front office', ip = '10.0.0.1'), "the name must be a single word"),
+    (row(model = '', ip = '10.0.0.1'), "no model given"),
+    (row(model = 'XYZ-1', ip = '10.0.0.1'), "unsupported model 'XYZ-1'"),
+    (row(ip = '10.0.0.1', node = '000BA1'), "give either an IP address or a node name"),
+    (row(node = 'BRN_00 0BA1'), "the node name for 'office' must be a single word"),
+    (row(node = 'BRN_'), "the node name for 'office' must be a single word"),
+])
+def testRowToDeviceRejects(values, message):
+    with pytest.raises(BrotherError) as error:
+        inventory.rowToDevice(values, 'entry 1', set(MODELS))
+    assert message in str(error.value)
+
+
+def testReadInventoryListsEveryInvalidAddress():
+    rows = [row('a', ip = '10.0.0.256'), row('b', ip = '10.0.0.2'), row('c', ip = 'nope')]
+    with pytest.raises(BrotherError) as error:
+        inventory.readInventory(io.StringIO(json.dumps(rows)), 'json')
+    assert str(error.value).startswith("2 invalid IP address(es):\nentry 1: ")
+    assert "\nentry 3: " in str(error.value)
+
+
+def testReadInventoryRejectsDuplicateNames():
+    rows = [row(ip = '10.0.0.1'), row(ip = '10.0.0.2')]
+    with pytest.raises(BrotherError) as error:
+        inventory.readInventory(io.StringIO(json.dumps(rows)), 'json')
+    assert "entry 2: duplicate name 'office'" in str(error.value)
+
+
+def testDiffDevicesOnlyRemovesWhenAsked():
+    current = [makeDevice(*device) for device in DEVICES]
+    changed = makeDevice(DEVICES[0][0], addr = '10.9.9.9')
+    added = makeDevice('new')
+    assert inventory.diffDevices(current, [changed, added], removeMissing = False) == \
+        ([added], [], [(current[0], changed)])
+    assert inventory.diffDevices(current, [changed, added])[1] == current[1:]
+
+
+def testExportThenImportIsANoOp(fake, tmpdir, capsys):
+    path = str(tmpdir.join('devices.csv'))
+    assert cli.main(['--backend', 'subprocess', 'export', '-o', path]) == 0
+    assert cli.main(['--backend', 'subprocess', 'reconcile', path]) == 0
+    assert capsys.readouterr().out == "Nothing to do.\n"
+
+
+def testReconcileRunsOnlyTheNeededChanges(fake, tmpdir, capsys):
+    path = tmpdir.join('devices.json')
+    path.write(json.dumps([row('office', ip = '192.168.1.50'), row('desk', 'MFC-L2710DW', ip = '192.168.1.12')]))
+    assert cli.main(['--backend', 'subprocess', 'reconcile', str(path)]) == 0
+    assert sorted(fake.devices()) == [('desk', 'MFC-L2710DW', True, '192.168.1.12'),
+                                      ('office', 'MFC-9440CN', True, '192.168.1.50')]
+    assert capsys.readouterr().out.splitlines() == [
+        '- lab', '~ office (MFC-9440CN, 192.168.1.10) -> (MFC-9440CN, 192.168.1.50)']
+
+
+def testImportWithAnUnsupportedModelChangesNothing(fake, tmpdir, capsys):
+    path = tmpdir.join('devices.json')
+    path.write(json.dumps([row('new', ip = '10.0.0.1'), row('other', 'XYZ-1', ip = '10.0.0.2')]))
+    assert cli.main(['--backend', 'subprocess', 'import', str(path)]) == 1
+    assert "unsupported model 'XYZ-1'" in capsys.readouterr().err
+    assert fake.devices() == list(DEVICES)
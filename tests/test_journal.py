@@ -0,0 +1,108 @@
+import os, json, subprocess
+
+from brotherdevice import BrotherDevice
+from journal import JOURNAL, Journal
+from tests.conftest import DEVICES, makeDevice
+
+
+# Start a batch the way SubprocessBackend.applyBatch() does and stop after the given steps, as if the process died
+def interruptedBatch(backend, removals, additions, steps):
+    batchID = JOURNAL.begin([device.toDict() for device in removals], [device.toDict() for device in additions])
+    for op, device in steps:
+        if op == 'remove':
+            backend.remove(device.name)
+        else:
+            backend.add(device)
+        JOURNAL.step(batchID, op, device.name)
+    JOURNAL.running.discard(batchID)
+    return batchID
+
+
+# A batch begun by another process, which is still running if pid is
+def otherProcessBatch(journal, pid):
+    with open(journal.journalFile(), 'a') as f:
+        f.write(json.dumps({'type': 'begin', 'id': '{}-1-1'.format(pid), 'removals': [], 'additions': []}) + "\n")
+
+
+def exitedPid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+def testUnfinishedListsBatchesWithoutEnd(tmpdir):
+    journal = Journal(str(tmpdir.join('journal.jsonl')))
+    first = journal.begin([], [{'name': 'a'}])
+    journal.step(first, 'add', 'a')
+    second = journal.begin([{'name': 'b'}], [])
+    journal.end(second, 'committed')
+    # Still running here
+    assert journal.unfinished() == []
+    journal.running.discard(first)
+    assert [(batch['id'], batch['done']) for batch in journal.unfinished()] == [(first, [('add', 'a')])]
+
+
+def testBatchesOfRunningProcessesAreLeftAlone(tmpdir):
+    journal = Journal(str(tmpdir.join('journal.jsonl')))
+    journal.end(journal.begin([], []), 'committed')
+    otherProcessBatch(journal, os.getppid())
+    pid = exitedPid()
+    otherProcessBatch(journal, pid)
+    assert [batch['id'] for batch in journal.unfinished()] == ['{}-1-1'.format(pid)]
+    # Ending a batch here must not drop theirs
+    journal.end(journal.begin([], []), 'committed')
+    assert tmpdir.join('journal.jsonl').read().count('"begin"') == 3
+
+
+def testCheckpointEmptiesTheJournalOnceNothingIsOpen(tmpdir):
+    path = tmpdir.join('journal.jsonl')
+    journal = Journal(str(path))
+    journal.end(journal.begin([], []), 'committed')
+    assert path.read() == ''
+
+
+def testInterruptedRenameIsFinished(fake):
+    old = makeDevice(*DEVICES[0])
+    renamed = makeDevice('office2', *DEVICES[0][1:])
+    interruptedBatch(BrotherDevice.backend, [old], [renamed], [('remove', old)])
+
+    messages = BrotherDevice.recoverInterrupted()
+    assert messages == ["Finished an interrupted change to office, office2."]
+    assert fake.devices() == DEVICES[1:] + [renamed.settings()]
+    assert JOURNAL.unfinished() == []
+
+
+def testBatchThatAlreadyCompletedIsClosed(fake):
+    old = makeDevice(*DEVICES[0])
+    renamed = makeDevice('office2', *DEVICES[0][1:])
+    interruptedBatch(BrotherDevice.backend, [old], [renamed], [('remove', old), ('add', renamed)])
+
+    BrotherDevice.recoverInterrupted()
+    assert fake.devices() == DEVICES[1:] + [renamed.settings()]
+    assert JOURNAL.unfinished() == []
+
+
+def testRenameOntoNameTakenSinceIsUndone(fake):
+    old = makeDevice(*DEVICES[0])
+    renamed = makeDevice('office2', *DEVICES[0][1:])
+    interruptedBatch(BrotherDevice.backend, [old], [renamed], [('remove', old)])
+    # Someone else took the new name in the meantime
+    theirs = makeDevice('office2', 'DCP-7065DN', True, '10.0.0.7')
+    BrotherDevice.backend.add(theirs)
+
+    messages = BrotherDevice.recoverInterrupted()
+    assert messages == ["Undid an interrupted change to office, office2."]
+    assert sorted(fake.devices()) == sorted(list(DEVICES) + [theirs.settings()])
+    assert JOURNAL.unfinished() == []
+
+
+def testBatchThatCanBeNeitherFinishedNorUndoneStaysOpen(fake):
+    old = makeDevice(*DEVICES[0])
+    renamed = makeDevice('office2', *DEVICES[0][1:])
+    interruptedBatch(BrotherDevice.backend, [old], [renamed], [('remove', old)])
+    BrotherDevice.backend.add(makeDevice('office2', 'DCP-7065DN', True, '10.0.0.7'))
+    BrotherDevice.backend.add(makeDevice('office', 'DCP-7065DN', True, '10.0.0.8'))
+
+    messages = BrotherDevice.recoverInterrupted()
+    assert messages[0].startswith("Could not recover an interrupted change to office, office2")
+    assert len(JOURNAL.unfinished()) == 1
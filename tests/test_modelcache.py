@@ -0,0 +1,43 @@
+import os
+
+from modelcache import loadModels, saveModels, writeJSON
+from tests.conftest import MODELS
+
+
+def testModelsAreCachedForTheirSource(tmpdir):
+    source = tmpdir.join('brsaneconfig3')
+    source.write('v1')
+    cacheFile = str(tmpdir.join('cache', 'models.json'))
+    assert loadModels(cacheFile, str(source)) is None
+    assert saveModels(MODELS, cacheFile, str(source))
+    assert loadModels(cacheFile, str(source)) == MODELS
+
+
+def testChangedSourceInvalidatesTheCache(tmpdir):
+    source = tmpdir.join('brsaneconfig3')
+    source.write('v1')
+    cacheFile = str(tmpdir.join('models.json'))
+    saveModels(MODELS, cacheFile, str(source))
+    source.write('version 2')
+    assert loadModels(cacheFile, str(source)) is None
+
+
+def testCorruptCacheIsIgnored(tmpdir):
+    source = tmpdir.join('brsaneconfig3')
+    source.write('v1')
+    cacheFile = tmpdir.join('models.json')
+    cacheFile.write('{"key": ')
+    assert loadModels(str(cacheFile), str(source)) is None
+
+
+def testMissingSourceIsNotCached(tmpdir):
+    cacheFile = str(tmpdir.join('models.json'))
+    assert not saveModels(MODELS, cacheFile, str(tmpdir.join('gone')))
+    assert not os.path.exists(cacheFile)
+
+
+def testFailedWriteLeavesNoTemporaryFile(tmpdir):
+    # A directory can't be renamed over
+    tmpdir.join('models.json').mkdir()
+    assert not writeJSON(str(tmpdir.join('models.json')), MODELS)
+    assert os.listdir(str(tmpdir)) == ['models.json']
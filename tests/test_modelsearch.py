@@ -0,0 +1,44 @@
+from modelsearch import ModelSearchIndex, normalize, subsequenceSpan
+
+CATALOGUE = sorted(['DCP-7065DN', 'DCP-L2540DW', 'MFC-9440CN', 'MFC-J4410DW', 'MFC-L2710DW', 'HL-L2350DW'])
+
+
+def testNormalizeIgnoresCaseAndPunctuation():
+    assert normalize('MFC-9440CN') == normalize('mfc 9440cn') == 'mfc9440cn'
+
+
+def testPrefixMatchesComeFirstThenSubstringsThenFuzzy():
+    index = ModelSearchIndex(CATALOGUE)
+    # Substring matches are ordered by where they start
+    assert index.search('l2') == ['HL-L2350DW', 'DCP-L2540DW', 'MFC-L2710DW']
+    assert index.search('d')[:2] == ['DCP-7065DN', 'DCP-L2540DW']
+    assert set(index.search('d')[2:]) == set(['MFC-J4410DW', 'MFC-L2710DW', 'HL-L2350DW'])
+    assert index.search('m9cn') == ['MFC-9440CN']
+    assert index.search('zzz') == []
+
+
+def testSubsequenceSpanIsTheTightestStretch():
+    assert subsequenceSpan('ac', 'abcxac') == 2
+    assert subsequenceSpan('ca', 'abc') is None
+
+
+def testSearchMatchesEveryNameAScanWould():
+    index = ModelSearchIndex(CATALOGUE)
+    for query in ('dw', '44', 'cdw', 'd', 'fcl', '0'):
+        expected = set(name for name in CATALOGUE if subsequenceSpan(normalize(query), normalize(name)) is not None)
+        assert set(index.search(query)) == expected
+
+
+def testEmptyQueryListsTheCatalogueUpToLimit():
+    index = ModelSearchIndex(CATALOGUE)
+    assert index.search('') == CATALOGUE
+    assert index.search(' -', limit = 2) == CATALOGUE[:2]
+    assert len(index.search('d', limit = 3)) == 3
+
+
+def testLookupsWorkBeforeTheFirstSearch():
+    index = ModelSearchIndex(CATALOGUE)
+    assert 'MFC-9440CN' in index and 'MFC-0000' not in index
+    assert index.position('MFC-9440CN') == CATALOGUE.index('MFC-9440CN')
+    assert index.position('MFC-0000') == -1
+    assert index.keys is None
@@ -0,0 +1,54 @@
+from pendingchanges import PendingChanges
+from tests.conftest import DEVICES, makeDevice
+
+
+def testEditsCollapseIntoOneRemovalAndAddition():
+    pending = PendingChanges()
+    device = makeDevice(*DEVICES[0])
+    original = device.copy()
+    device.addr = '10.0.0.1'
+    pending.recordSave(device, original)
+    device.addr = '10.0.0.2'
+    pending.recordSave(device, original.copy())
+    removals, additions = pending.operations()
+    assert [d.settings() for d in removals] == [DEVICES[0]]
+    assert [d.addr for d in additions] == ['10.0.0.2']
+
+
+def testEditBackToTheOriginalIsNoOp():
+    pending = PendingChanges()
+    device = makeDevice(*DEVICES[0])
+    original = device.copy()
+    device.addr = '10.0.0.1'
+    pending.recordSave(device, original)
+    device.addr = original.addr
+    assert len(pending) == 0
+    assert pending.operations() == ([], [])
+
+
+def testAddedThenDeletedIsNoOp():
+    pending = PendingChanges()
+    device = makeDevice('new')
+    pending.recordSave(device, None)
+    pending.recordDelete(device, None)
+    assert pending.operations() == ([], [])
+
+
+def testDeletedAndAddedAgainCancelOut():
+    pending = PendingChanges()
+    device = makeDevice(*DEVICES[0])
+    pending.recordDelete(device, device.copy())
+    pending.recordSave(makeDevice(*DEVICES[0]), None)
+    assert pending.operations() == ([], [])
+
+
+def testAppliedSettingsShowDevicesAsBeforeTheQueuedChanges():
+    pending = PendingChanges()
+    shown = [makeDevice(*device) for device in DEVICES]
+    original = shown[0].copy()
+    shown[0].addr = '10.0.0.1'
+    pending.recordSave(shown[0], original)
+    added = makeDevice('new')
+    added.isNew = True
+    pending.recordSave(added, None)
+    assert sorted(pending.appliedSettings(shown + [added])) == sorted(DEVICES)
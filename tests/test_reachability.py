@@ -0,0 +1,53 @@
+import socket, threading
+
+import pytest
+
+from reachability import REACHABLE, UNREACHABLE, Prober, runConcurrently
+from tests.conftest import makeDevice
+
+
+@pytest.fixture
+def listener():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(5)
+    yield server
+    server.close()
+
+
+def closedPort():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def testListeningPortIsReachable(listener):
+    prober = Prober(port = listener.getsockname()[1], timeout = 2)
+    results = prober.probeAll([makeDevice('office', addr = '127.0.0.1'), makeDevice('copy', addr = '127.0.0.1')])
+    # Devices sharing an address are probed once
+    assert [(result.key, result.status) for result in results] == [((True, '127.0.0.1'), REACHABLE)]
+
+
+def testClosedPortIsUnreachable():
+    results = Prober(port = closedPort(), timeout = 2).probeAll([makeDevice('office', addr = '127.0.0.1')])
+    assert [result.status for result in results] == [UNREACHABLE]
+
+
+def testResultsOfProbesRunningWhenCancelledAreDropped():
+    cancelled = threading.Event()
+    started = threading.Event()
+    seen = []
+
+    def func(item):
+        started.set()
+        cancelled.wait(5)
+        return item
+
+    thread = threading.Thread(target = lambda: seen.append(runConcurrently([1, 2], func, 1, seen.append, cancelled)))
+    thread.start()
+    started.wait(5)
+    cancelled.set()
+    thread.join(5)
+    assert seen == [[]]
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from spawner import Spawner, runLocal, splitLines
+
+
+@pytest.fixture
+def spawner():
+    spawner = Spawner()
+    spawner.start()
+    yield spawner
+    spawner.stop()
+
+
+def testSplitLinesJoinsChunks():
+    assert list(splitLines([b'a\nb', b'c\n', b'd'])) == [b'a\n', b'bc\n', b'd']
+
+
+@pytest.mark.parametrize('useHelper', [False, True])
+def testOutputAndStatus(spawner, useHelper):
+    status = {}
+    argv = ['sh', '-c', 'echo one; echo two; exit 3']
+    lines = spawner.stream(argv, 10, status) if useHelper else splitLines(runLocal(argv, 10, status))
+    assert list(lines) == [b'one\n', b'two\n']
+    assert status == {'returnCode': 3, 'timedOut': False}
+
+
+def testCommandThatCannotStartRaisesOSError(spawner):
+    with pytest.raises(OSError):
+        list(spawner.stream(['/nonexistent/brsaneconfig3'], 10, {}))
+    # The helper is still usable afterwards
+    assert list(spawner.stream(['echo', 'ok'], 10, {})) == [b'ok\n']
+
+
+@pytest.mark.parametrize('useHelper', [False, True])
+def testTimeoutKillsWhatTheCommandStarted(spawner, useHelper):
+    # The child keeps the output open after the shell itself is killed
+    argv = ['sh', '-c', 'sleep 30; echo late']
+    status = {}
+    begin = time.time()
+    lines = spawner.stream(argv, 0.5, status) if useHelper else runLocal(argv, 0.5, status)
+    assert list(lines) == []
+    assert time.time() - begin < 10
+    assert status['timedOut']
+
+
+def testReadingPartOfTheOutputKeepsTheHelperInStep(spawner):
+    lines = spawner.stream(['sh', '-c', 'echo a; echo b; echo c'], 10, {})
+    assert next(lines) == b'a\n'
+    lines.close()
+    assert list(spawner.stream(['echo', 'next'], 10, {})) == [b'next\n']
@@ -0,0 +1,55 @@
+import io, time
+
+import gui
+from stallwatch import StallWatchdog
+
+
+def blockingSlot(seconds):
+    time.sleep(seconds)
+
+
+def testBlockedLoopIsRecordedWithWhereItWasStuck():
+    watchdog = StallWatchdog(0.05)
+    watchdog.start()
+    try:
+        watchdog.beat()
+        blockingSlot(0.4)
+        watchdog.beat()
+    finally:
+        watchdog.stop()
+    stall, = watchdog.stalls
+    assert stall.seconds > 0.3
+    assert stall.samples and any(entry[2] == 'blockingSlot' for entry in stall.samples[0])
+    stream = io.StringIO()
+    watchdog.report(stream)
+    assert stream.getvalue().startswith("Event loop stalls over 50 ms: 1\n")
+    assert "in blockingSlot" in stream.getvalue()
+
+
+def testShortGapsAreNotStalls():
+    watchdog = StallWatchdog(0.2)
+    watchdog.start()
+    try:
+        for i in range(5):
+            watchdog.beat()
+            time.sleep(0.02)
+    finally:
+        watchdog.stop()
+    assert watchdog.stalls == []
+
+
+def testStallInProgressIsKeptOnStop():
+    watchdog = StallWatchdog(0.05)
+    watchdog.start()
+    watchdog.beat()
+    blockingSlot(0.3)
+    watchdog.stop()
+    assert len(watchdog.stalls) == 1
+
+
+def testProfileOptionsImplyProfile():
+    assert not gui.parseArgs([])[0].profile
+    args, qtArgs = gui.parseArgs(['--profile-threshold', '50', '-style', 'plastique'])
+    assert args.profile and args.profile_threshold == 50
+    assert qtArgs == ['-style', 'plastique']
+    assert gui.parseArgs(['--profile-report', 'stalls.txt'])[0].profile